@@ -0,0 +1,80 @@
+"""Store horizon_profile as int16 centi-degree bytea
+
+Revision ID: 5b8e3f1a6c27
+Revises: 7e1f0c2b9a64
+Create Date: 2025-10-27 10:42:18.276530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e3f1a6c27'
+down_revision: Union[str, Sequence[str], None] = '7e1f0c2b9a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 入力値が更新されたら静的スコアを再計算対象に戻すトリガー（da1a2400688bで作成）．horizon_profileの列に依存するため作り直す．
+CREATE_INVALIDATE_TRIGGER = """
+    CREATE TRIGGER trg_spots_invalidate_static_score
+    BEFORE UPDATE OF horizon_profile, wa2015_raw_value ON spots
+    FOR EACH ROW
+    WHEN (OLD.horizon_profile IS DISTINCT FROM NEW.horizon_profile
+          OR OLD.wa2015_raw_value IS DISTINCT FROM NEW.wa2015_raw_value)
+    EXECUTE FUNCTION spots_invalidate_static_score();
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_spots_invalidate_static_score ON spots;")
+
+    # float8[]（度）を，0.01度単位のint16（ビッグエンディアン．int2sendのバイト順）を並べたbyteaに変換
+    # （ALTER COLUMN ... USINGにはサブクエリを書けないため，新しい列に移してから入れ替える．）
+    op.add_column('spots', sa.Column('horizon_profile_bytes', sa.LargeBinary(), nullable=True))
+    op.execute("""
+        UPDATE spots
+        SET horizon_profile_bytes = (
+            SELECT string_agg(int2send(CAST(round(CAST(h * 100 AS numeric)) AS smallint)), ''::bytea ORDER BY ord)
+            FROM unnest(horizon_profile) WITH ORDINALITY AS u(h, ord)
+        )
+        WHERE horizon_profile IS NOT NULL
+          AND NOT ('NaN'::float8 = ANY(horizon_profile));
+    """)
+    op.drop_column('spots', 'horizon_profile')
+    op.alter_column('spots', 'horizon_profile_bytes', new_column_name='horizon_profile')
+
+    op.execute(CREATE_INVALIDATE_TRIGGER)
+    # 量子化で簡易地形スコアが変わり得るため，全スポットの静的スコアを再計算対象に戻す．
+    op.execute("UPDATE spots SET static_score_params = NULL;")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_spots_invalidate_static_score ON spots;")
+
+    op.add_column('spots', sa.Column('horizon_profile_array', sa.ARRAY(sa.Float()), nullable=True))
+    op.execute("""
+        UPDATE spots
+        SET horizon_profile_array = (
+            SELECT array_agg(
+                CAST(
+                    CASE WHEN get_byte(horizon_profile, 2 * i) >= 128
+                         THEN get_byte(horizon_profile, 2 * i) * 256 + get_byte(horizon_profile, 2 * i + 1) - 65536
+                         ELSE get_byte(horizon_profile, 2 * i) * 256 + get_byte(horizon_profile, 2 * i + 1)
+                    END AS float8
+                ) / 100
+                ORDER BY i
+            )
+            FROM generate_series(0, length(horizon_profile) / 2 - 1) AS i
+        )
+        WHERE horizon_profile IS NOT NULL;
+    """)
+    op.drop_column('spots', 'horizon_profile')
+    op.alter_column('spots', 'horizon_profile_array', new_column_name='horizon_profile')
+
+    op.execute(CREATE_INVALIDATE_TRIGGER)
+    op.execute("UPDATE spots SET static_score_params = NULL;")
@@ -0,0 +1,37 @@
+"""Add sky_glow_lut table
+
+Revision ID: 7e1f0c2b9a64
+Revises: c3d9a51e7f20
+Create Date: 2025-10-26 16:20:05.811427
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e1f0c2b9a64'
+down_revision: Union[str, Sequence[str], None] = 'c3d9a51e7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 中身はアプリの起動時（refresh_static_scores）にSQM_MIN・SQM_MAXから作られる．
+    op.create_table('sky_glow_lut',
+    sa.Column('idx', sa.Integer(), nullable=False),
+    sa.Column('wa2015_raw_value', sa.Float(), nullable=False),
+    sa.Column('sky_glow_score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('idx')
+    )
+    # 表が作り直されるため，全スポットの静的スコアを再計算対象に戻す．
+    op.execute("UPDATE spots SET static_score_params = NULL;")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sky_glow_lut')
+    op.execute("UPDATE spots SET static_score_params = NULL;")
@@ -0,0 +1,114 @@
+"""Add horizon profile summary columns to spots
+
+Revision ID: 9c4d2e7b1f35
+Revises: 5b8e3f1a6c27
+Create Date: 2025-10-28 09:15:42.603817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4d2e7b1f35'
+down_revision: Union[str, Sequence[str], None] = '5b8e3f1a6c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPEN_SKY_THRESHOLDS_DEG = (0, 3, 5, 10) # horizon_service.OPEN_SKY_THRESHOLDS_DEGと同じ
+NUM_OCTANTS = 8 # horizon_service.NUM_OCTANTSと同じ
+
+# 簡易地形スコアがopen_sky_fraction_3を参照するようになるため，入力値として監視する列に加える．
+CREATE_INVALIDATE_TRIGGER = """
+    CREATE TRIGGER trg_spots_invalidate_static_score
+    BEFORE UPDATE OF horizon_profile, open_sky_fraction_3, wa2015_raw_value ON spots
+    FOR EACH ROW
+    WHEN (OLD.horizon_profile IS DISTINCT FROM NEW.horizon_profile
+          OR OLD.open_sky_fraction_3 IS DISTINCT FROM NEW.open_sky_fraction_3
+          OR OLD.wa2015_raw_value IS DISTINCT FROM NEW.wa2015_raw_value)
+    EXECUTE FUNCTION spots_invalidate_static_score();
+"""
+
+# 5b8e3f1a6c27で作成したトリガー
+CREATE_PREVIOUS_INVALIDATE_TRIGGER = """
+    CREATE TRIGGER trg_spots_invalidate_static_score
+    BEFORE UPDATE OF horizon_profile, wa2015_raw_value ON spots
+    FOR EACH ROW
+    WHEN (OLD.horizon_profile IS DISTINCT FROM NEW.horizon_profile
+          OR OLD.wa2015_raw_value IS DISTINCT FROM NEW.wa2015_raw_value)
+    EXECUTE FUNCTION spots_invalidate_static_score();
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_spots_invalidate_static_score ON spots;")
+
+    for threshold in OPEN_SKY_THRESHOLDS_DEG:
+        op.add_column('spots', sa.Column(f'open_sky_fraction_{threshold}', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('max_ridge_angle', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('horizon_octant_max', sa.LargeBinary(), nullable=True))
+    op.add_column('spots', sa.Column('horizon_octant_min', sa.LargeBinary(), nullable=True))
+
+    # 既存の稜線プロファイル（0.01度単位のint16．ビッグエンディアン）から要約を計算
+    # （horizon_service.summarize_horizon_profileと同じ値になる．）
+    op.execute(f"""
+        WITH profile_values AS (
+            SELECT s.id, u.i, length(s.horizon_profile) / 2 AS n,
+                   CASE WHEN get_byte(s.horizon_profile, 2 * u.i) >= 128
+                        THEN get_byte(s.horizon_profile, 2 * u.i) * 256 + get_byte(s.horizon_profile, 2 * u.i + 1) - 65536
+                        ELSE get_byte(s.horizon_profile, 2 * u.i) * 256 + get_byte(s.horizon_profile, 2 * u.i + 1)
+                   END AS v
+            FROM spots AS s
+            CROSS JOIN LATERAL generate_series(0, length(s.horizon_profile) / 2 - 1) AS u(i)
+            WHERE s.horizon_profile IS NOT NULL AND length(s.horizon_profile) > 0
+        ),
+        fractions AS (
+            SELECT id,
+                   {", ".join(f"avg(CASE WHEN v <= {threshold * 100} THEN 1.0 ELSE 0.0 END)::float8 AS f{threshold}"
+                              for threshold in OPEN_SKY_THRESHOLDS_DEG)},
+                   max(v)::float8 / 100 AS max_ridge_angle
+            FROM profile_values
+            GROUP BY id
+        ),
+        octants AS (
+            SELECT id, i * {NUM_OCTANTS} / n AS octant, max(v) AS octant_max, min(v) AS octant_min
+            FROM profile_values
+            GROUP BY id, i * {NUM_OCTANTS} / n
+        ),
+        octant_bytes AS (
+            SELECT id,
+                   string_agg(int2send(CAST(octant_max AS smallint)), ''::bytea ORDER BY octant) AS horizon_octant_max,
+                   string_agg(int2send(CAST(octant_min AS smallint)), ''::bytea ORDER BY octant) AS horizon_octant_min
+            FROM octants
+            GROUP BY id
+        )
+        UPDATE spots
+        SET {", ".join(f"open_sky_fraction_{threshold} = fractions.f{threshold}" for threshold in OPEN_SKY_THRESHOLDS_DEG)},
+            max_ridge_angle = fractions.max_ridge_angle,
+            horizon_octant_max = octant_bytes.horizon_octant_max,
+            horizon_octant_min = octant_bytes.horizon_octant_min
+        FROM fractions
+        JOIN octant_bytes USING (id)
+        WHERE spots.id = fractions.id;
+    """)
+
+    op.execute(CREATE_INVALIDATE_TRIGGER)
+    # 簡易地形スコアの計算式が変わるため，全スポットの静的スコアを再計算対象に戻す．
+    op.execute("UPDATE spots SET static_score_params = NULL;")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_spots_invalidate_static_score ON spots;")
+
+    op.drop_column('spots', 'horizon_octant_min')
+    op.drop_column('spots', 'horizon_octant_max')
+    op.drop_column('spots', 'max_ridge_angle')
+    for threshold in OPEN_SKY_THRESHOLDS_DEG:
+        op.drop_column('spots', f'open_sky_fraction_{threshold}')
+
+    op.execute(CREATE_PREVIOUS_INVALIDATE_TRIGGER)
+    op.execute("UPDATE spots SET static_score_params = NULL;")
@@ -0,0 +1,37 @@
+"""Add trigram indexes for name search
+
+Revision ID: b4f6e2df480e
+Revises: eb8c8f06f488
+Create Date: 2025-10-26 10:47:18.662931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4f6e2df480e'
+down_revision: Union[str, Sequence[str], None] = 'eb8c8f06f488'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pg_trgmは日本語の文字も「単語の文字」として扱えるロケール（en_US.UTF-8やja_JP.UTF-8など）でDBが作成されている必要がある．
+    # Cロケールの場合，日本語の文字からトライグラムが作られず，インデックスが効かない．
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+
+    op.create_index('ix_locations_name_trgm', 'locations', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_spots_name_trgm', 'spots', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_spots_name_trgm', table_name='spots', postgresql_using='gin')
+    op.drop_index('ix_locations_name_trgm', table_name='locations', postgresql_using='gin')
+    # 他の用途で使われている可能性があるため，pg_trgm拡張は削除しない．
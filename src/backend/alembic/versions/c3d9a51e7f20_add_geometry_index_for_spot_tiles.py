@@ -0,0 +1,31 @@
+"""Add geometry index for spot tiles
+
+Revision ID: c3d9a51e7f20
+Revises: b4f6e2df480e
+Create Date: 2025-10-26 10:42:17.305118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d9a51e7f20'
+down_revision: Union[str, Sequence[str], None] = 'b4f6e2df480e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 地図タイルの範囲（経緯度の矩形）との&&演算子のための，geometry型の関数GiSTインデックス
+    # （geography型のidx_spots_geomは測地線で矩形を扱うため，タイルの範囲の判定には使えない．）
+    op.create_index('idx_spots_geom_geometry', 'spots', [sa.text('geometry(geom)')], unique=False, postgresql_using='gist')
+    op.execute("ANALYZE spots;")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_spots_geom_geometry', table_name='spots', postgresql_using='gist')
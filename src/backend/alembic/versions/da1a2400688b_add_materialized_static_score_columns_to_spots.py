@@ -0,0 +1,60 @@
+"""Add materialized static score columns to spots table
+
+Revision ID: da1a2400688b
+Revises: 586d8e9939ad
+Create Date: 2025-10-24 21:12:40.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'da1a2400688b'
+down_revision: Union[str, Sequence[str], None] = '586d8e9939ad'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('spots', sa.Column('topography_score', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('sqm_value', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('sky_glow_score', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('static_score', sa.Float(), nullable=True))
+    op.add_column('spots', sa.Column('static_score_params', sa.String(), nullable=True))
+
+    # 上位N件の取得用のB-treeインデックス（半径検索用のGiSTインデックスはeb8c8f06f488で作成する．）
+    op.create_index('ix_spots_static_score', 'spots', [sa.text('static_score DESC NULLS LAST')], unique=False)
+
+    # 入力値が更新されたら，静的スコアを再計算対象に戻すトリガー
+    op.execute("""
+        CREATE OR REPLACE FUNCTION spots_invalidate_static_score() RETURNS trigger AS $$
+        BEGIN
+            NEW.static_score_params := NULL;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_spots_invalidate_static_score
+        BEFORE UPDATE OF horizon_profile, wa2015_raw_value ON spots
+        FOR EACH ROW
+        WHEN (OLD.horizon_profile IS DISTINCT FROM NEW.horizon_profile
+              OR OLD.wa2015_raw_value IS DISTINCT FROM NEW.wa2015_raw_value)
+        EXECUTE FUNCTION spots_invalidate_static_score();
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_spots_invalidate_static_score ON spots;")
+    op.execute("DROP FUNCTION IF EXISTS spots_invalidate_static_score();")
+    op.drop_index('ix_spots_static_score', table_name='spots')
+    op.drop_column('spots', 'static_score_params')
+    op.drop_column('spots', 'static_score')
+    op.drop_column('spots', 'sky_glow_score')
+    op.drop_column('spots', 'sqm_value')
+    op.drop_column('spots', 'topography_score')
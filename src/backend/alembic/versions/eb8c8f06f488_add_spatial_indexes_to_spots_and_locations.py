@@ -0,0 +1,37 @@
+"""Add spatial indexes to spots and locations tables
+
+Revision ID: eb8c8f06f488
+Revises: da1a2400688b
+Create Date: 2025-10-25 14:03:51.207644
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eb8c8f06f488'
+down_revision: Union[str, Sequence[str], None] = 'da1a2400688b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ST_DWithinによる半径検索と，<->演算子によるKNN検索のためのGiSTインデックス
+    # インデックス名はGeoAlchemy2の命名規則（idx_{テーブル名}_{カラム名}）に合わせる．
+    # （テーブル作成時にGeoAlchemy2が作成済みの場合があるため，if_not_existsを付ける．）
+    op.create_index('idx_spots_geom', 'spots', ['geom'], unique=False, postgresql_using='gist', if_not_exists=True)
+    op.create_index('idx_locations_geom', 'locations', ['geom'], unique=False, postgresql_using='gist', if_not_exists=True)
+
+    # インデックス作成後にプランナーの統計情報を更新
+    op.execute("ANALYZE spots;")
+    op.execute("ANALYZE locations;")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_locations_geom', table_name='locations', postgresql_using='gist', if_exists=True)
+    op.drop_index('idx_spots_geom', table_name='spots', postgresql_using='gist', if_exists=True)
@@ -3,6 +3,7 @@ from functools import lru_cache
 from pydantic import PostgresDsn, computed_field
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from app.core.dem_manifest import DemTileManifest, load_dem_tile_manifest
 
 # このconfig.pyファイルの絶対パスを取得し，.envファイルのあるsrc/をプロジェクトルートとする．
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
@@ -27,14 +28,48 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str = 'localhost' # ローカルスクリプト用のデフォルト値
     POSTGRES_DB: str
 
+    # DBの接続プール設定（同期・非同期のエンジンで共通）
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True # 接続を使う前に生存確認する．DBの再起動などで切れた接続を避ける．
+
     # データソース設定
     LOCAL_DATA_ROOT: Path | None = None
     S3_BUCKET: str | None = None
 
     SQM_MIN: float
     SQM_MAX: float
+    SKY_GLOW_LUT_SIZE: int = 8192 # World Atlas 2015の生値から光害スコアへのルックアップテーブルの点数
+
+    # 起動時にWorld Atlas 2015から切り出してメモリに載せる範囲（西端経度, 南端緯度, 東端経度, 北端緯度）
+    SKY_GLOW_BBOX: tuple[float, float, float, float] = (122.0, 20.0, 154.0, 46.0)
+    SKY_GLOW_CACHE_PATH: Path | None = None # 切り出した配列の保存先（.npy）．次回以降はメモリマップで開く．
     OPEN_METEO_CONCURRENCY_LIMIT: int
 
+    # DEMの読み込み（COGをS3からHTTPのRange要求で読む場合の設定を含む）
+    DEM_DATASET_CACHE_SIZE: int = 64 # スレッドごとに開いたままにしておくDEMファイルの数（GDALのブロックキャッシュを保つ．）
+    GDAL_CACHEMAX_MB: int = 256 # GDALのブロックキャッシュの上限（MB）
+    GDAL_VSI_CACHE_SIZE_MB: int = 64 # S3から取得したバイト列のファイルごとのキャッシュ（MB）
+    # DEMが存在する3次メッシュの一覧（scripts/build_dem_tile_manifest.pyで作成）．
+    # ローカルでファイルが無い場合は，起動時にDEM5Aのディレクトリを1回走査して保存する．
+    # 未指定の場合は一覧を使わず，ローカルではファイルの有無を都度確認し，S3では存在確認をしない．
+    DEM_TILE_MANIFEST_PATH: Path | None = None
+
+    # 場所検索の総件数を数える上限（これを超える場合は打ち切る）
+    LOCATION_SEARCH_COUNT_LIMIT: int = 10000
+
+    # 場所検索のインメモリ索引（無効の場合はDBで検索する）
+    LOCATION_SEARCH_INDEX_ENABLED: bool = False
+    LOCATION_SEARCH_INDEX_SNAPSHOT: Path | None = None # 起動時に読み込み，再構築時に保存するNPZファイル
+    LOCATION_SEARCH_INDEX_MEMORY_BUDGET_MB: int = 512 # 超える場合は索引を作らない．
+    LOCATION_SEARCH_INDEX_REBUILD_INTERVAL_S: int = 0 # DBからの再構築の間隔（秒）．0の場合は再構築しない．
+
+    # スポットの地図タイル
+    SPOT_TILE_CLUSTER_MAX_ZOOM: int = 9 # このズームレベル以下ではスポットをクラスタリングする．
+    SPOT_TILE_CLUSTER_CELLS: int = 16 # クラスタリングの格子の1辺の分割数（タイルあたり）
+    SPOT_TILE_CACHE_SIZE: int = 1024 # プロセス内にキャッシュするタイルの数
+    SPOT_TILE_CACHE_MAX_AGE_S: int = 3600 # プロセス内キャッシュとCache-Controlの有効期間（秒）
+
     @computed_field
     @property
     def DATABASE_URL(self) -> PostgresDsn:
@@ -42,6 +77,14 @@ class Settings(BaseSettings):
         他のフィールドの値からDATABASE_URLを構築する．
         """
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:5432/{self.POSTGRES_DB}"
+
+    @computed_field
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        """
+        非同期エンジン（asyncpgドライバ）用のDATABASE_URLを構築する．
+        """
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:5432/{self.POSTGRES_DB}"
     
     @computed_field
     @property
@@ -73,9 +116,31 @@ class Settings(BaseSettings):
         else:
             raise ValueError("データソースが設定されていません．")
     
+    @computed_field
+    @property
+    def PATH_SKY_GLOW_SCORE_TIFF(self) -> str:
+        """
+        scripts/build_sky_glow_score_tiff.pyで作成する，日本周辺の光害スコアのGeoTIFF
+        """
+        if self.S3_BUCKET:
+            return f"s3://{self.S3_BUCKET}/World_Atlas_2015/sky_glow_score_japan.tif"
+        elif self.LOCAL_DATA_ROOT:
+            return str(self.LOCAL_DATA_ROOT / "World_Atlas_2015" / "sky_glow_score_japan.tif")
+        else:
+            raise ValueError("データソースが設定されていません．")
+    
+    def get_dem_tile_manifest(self) -> DemTileManifest | None:
+        """
+        DEMが存在する3次メッシュの一覧を返す．初回だけ読み込み，以降はキャッシュを返す．
+        DEM_TILE_MANIFEST_PATHが未指定の場合はNoneを返す．
+        """
+        dem_root = self.LOCAL_DATA_ROOT / "DEM5A" if self.LOCAL_DATA_ROOT and not self.S3_BUCKET else None
+        return load_dem_tile_manifest(path_manifest=self.DEM_TILE_MANIFEST_PATH, dem_root=dem_root)
+
     def get_dem_filepath(self, tertiary_meshcode: str) -> str | None:
         """
         3次メッシュコードに対応するTIFFファイルのパスを返す．
+        DEMが存在しない（海上など）場合はNoneを返す．タイル一覧があれば，判定にファイルへのアクセスはしない．
         """
         tertiary_meshcode = str(tertiary_meshcode)
 
@@ -87,10 +152,16 @@ class Settings(BaseSettings):
         second = tertiary_meshcode[4:6]
         third = tertiary_meshcode[6:]
 
+        manifest = self.get_dem_tile_manifest()
+        if manifest is not None and tertiary_meshcode not in manifest:
+            return None
+
         if self.S3_BUCKET:
             return f"s3://{self.S3_BUCKET}/DEM5A/{first}/{first}-{second}/{first}-{second}-{third}.tif"
         elif self.LOCAL_DATA_ROOT:
             path_dem_tiff = self.LOCAL_DATA_ROOT / f"DEM5A/{first}/{first}-{second}/{first}-{second}-{third}.tif"
+            if manifest is not None:
+                return str(path_dem_tiff)
             return str(path_dem_tiff) if path_dem_tiff.exists() else None
         else:
             raise ValueError("データソースが設定されていません．")
@@ -0,0 +1,108 @@
+# app/core/dem_manifest.py
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+# 3次メッシュコード（8桁）の通し番号の範囲．1次メッシュ（4桁）×2次メッシュ（8×8）×3次メッシュ（10×10）
+NUM_TERTIARY_MESHES = 10000 * 64 * 100
+
+# DEM5A/{1次}/{1次}-{2次}/{1次}-{2次}-{3次}.tif のファイル名（変換途中の*.tmp.tifは含めない．）
+DEM_FILENAME_PATTERN = re.compile(r'^(\d{4})-(\d{2})-(\d{2})\.tif$')
+
+def get_tertiary_mesh_index(tertiary_meshcode: str) -> int | None:
+    """
+    3次メッシュコードをビットマップ上の通し番号に変換する．不正なメッシュコードの場合はNoneを返す．
+    """
+    if len(tertiary_meshcode) != 8 or not tertiary_meshcode.isdigit():
+        return None
+    primary = int(tertiary_meshcode[0:4])
+    secondary_lat, secondary_lon = int(tertiary_meshcode[4]), int(tertiary_meshcode[5])
+    if secondary_lat > 7 or secondary_lon > 7:
+        return None
+    tertiary = int(tertiary_meshcode[6:])
+    return (primary * 64 + secondary_lat * 8 + secondary_lon) * 100 + tertiary
+
+class DemTileManifest:
+    """
+    DEMのGeoTIFFが存在する3次メッシュの一覧．
+    全ての3次メッシュを1ビットずつのビットマップ（8MB）で持ち，ファイルの有無をI/O無しで判定する．
+    """
+    def __init__(self, bits: np.ndarray):
+        self.bits = bits # np.packbitsの形式（上位ビットが先）
+
+    @classmethod
+    def from_meshcodes(cls, tertiary_meshcodes) -> 'DemTileManifest':
+        indices = [get_tertiary_mesh_index(str(meshcode)) for meshcode in tertiary_meshcodes]
+        indices = np.array([index for index in indices if index is not None], dtype=np.int64)
+        bits = np.zeros(NUM_TERTIARY_MESHES // 8, dtype=np.uint8)
+        np.bitwise_or.at(bits, indices >> 3, (0x80 >> (indices & 7)).astype(np.uint8))
+        return cls(bits=bits)
+
+    @classmethod
+    def from_directory(cls, dem_root: str | Path) -> 'DemTileManifest':
+        """
+        DEM5Aのディレクトリを1回だけ走査して作成する．
+        """
+        def iter_meshcodes():
+            for path in Path(dem_root).glob("*/*-*/*.tif"):
+                match = DEM_FILENAME_PATTERN.match(path.name)
+                if match:
+                    yield "".join(match.groups())
+
+        return cls.from_meshcodes(iter_meshcodes())
+
+    def save(self, path: str | Path) -> None:
+        """
+        一時ファイルに書いてから置き換える（同時に起動した他のプロセスが書き込み途中のファイルを読まないため．）
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'DemTileManifest':
+        """
+        保存したビットマップをメモリマップで開く．（ワーカープロセス間でもページキャッシュを共有できる．）
+        """
+        bits = np.load(path, mmap_mode='r', allow_pickle=False)
+        if bits.shape != (NUM_TERTIARY_MESHES // 8,) or bits.dtype != np.uint8:
+            raise ValueError(f"DEMのタイル一覧の形式が不正です: {path}")
+        return cls(bits=bits)
+
+    def __contains__(self, tertiary_meshcode: str) -> bool:
+        index = get_tertiary_mesh_index(str(tertiary_meshcode))
+        if index is None:
+            return False
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(np.asarray(self.bits)).sum())
+
+@lru_cache
+def load_dem_tile_manifest(path_manifest: Path | None, dem_root: Path | None) -> DemTileManifest | None:
+    """
+    DEMのタイル一覧をメモリマップで開き，プロセスごとにキャッシュして返す．一覧のファイルが指定されていなければNoneを返す．
+    ファイルが無い（または壊れている）場合は，ローカルのDEM5Aのディレクトリを1回だけ走査してファイルに保存する．
+    （起動時に保存しておけば，後から起動するワーカープロセスは走査せずに同じファイルを開ける．）
+    """
+    if not path_manifest:
+        return None
+
+    try:
+        manifest = DemTileManifest.load(path_manifest)
+    except (OSError, ValueError) as e:
+        if not (dem_root and Path(dem_root).is_dir()):
+            print(f"⚠️ 警告: DEMのタイル一覧を読み込めませんでした．ファイルの有無を都度確認します: {e}")
+            return None
+        print(f"DEMのタイル一覧が無いため，{dem_root} を走査して {path_manifest} に保存します．")
+        manifest = DemTileManifest.from_directory(dem_root)
+        try:
+            manifest.save(path_manifest)
+        except OSError as e:
+            print(f"⚠️ 警告: DEMのタイル一覧を保存できませんでした: {e}")
+    print(f"DemTileManifest: {len(manifest)}個の3次メッシュのDEMを登録．")
+    return manifest
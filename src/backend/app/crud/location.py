@@ -1,63 +1,189 @@
 # app/crud/location.py
+import base64
+import json
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, cast, union_all, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, cast, union_all, func, literal, select, true, Float, Integer, Select
 from app.models import Location, Spot
-from geoalchemy2.functions import ST_Distance
 from geoalchemy2.types import Geometry
 
-def search_locations_and_sort_by_distance(
-        db: Session,
+# 検索対象のモデル．インデックスはカーソルで行の出どころを識別するために使う．
+SEARCH_MODELS = [Location, Spot]
+
+def encode_cursor(distance: float, source: int, row_id: int) -> str:
+    """
+    直前のページの最後の行（距離，テーブル，id）をカーソル文字列に変換する．
+    """
+    payload = json.dumps({'d': distance, 's': source, 'i': row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple[float, int, int]:
+    """
+    カーソル文字列を（距離，テーブル，id）に戻す．不正なカーソルの場合はValueErrorを送出する．
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(payload['d']), int(payload['s']), int(payload['i'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def build_search_statement(
         name: str,
         lat: float,
         lon: float,
+        count_limit: int,
         limit: int = 10,
-        offset: int = 0
-    ):
+        offset: int = 0,
+        cursor: str | None = None
+    ) -> Select | None:
     """
-    スペース区切りの全ての検索クエリを名前に含むLocationをAND検索し，
-    指定された座標に近い順にソートしてリストを返す．
+    場所検索のSELECT文を組み立てる．同期・非同期のどちらのセッションでも実行できる．
+    検索クエリが空の場合はNoneを返す．
     """
     keywords = name.split()
     if not keywords:
-        return 0, []
+        return None
+
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        offset = 0
 
-    queries = []
-    # 検索対象のモデルをリスト化
-    for model in [Location, Spot]:
+    center_point = f"SRID=4326;POINT({lon} {lat})" # lon -> latの順に注意！
+    center_geog = func.ST_GeogFromText(center_point)
+
+    count_queries = []
+    page_queries = []
+    for source, model in enumerate(SEARCH_MODELS):
         conditions = [model.name.contains(kw) for kw in keywords]
-        query = (
-            db.query(
+        # KNN演算子<->はGiSTインデックス（idx_{テーブル名}_geom）を使って近い順に走査できる．
+        distance_expr = model.geom.op('<->', return_type=Float)(center_geog)
+
+        # 総件数はcount_limit+1件まで数えれば打ち切りを判定できる．
+        count_queries.append(
+            select(model.id).where(and_(*conditions)).limit(count_limit + 1)
+        )
+
+        # カーソルより後ろ（距離 -> テーブル -> id の順で比較）の行に限定
+        # （インデックスの条件ではなくフィルタなので，カーソルより近い行も走査はされる．）
+        page_conditions = list(conditions)
+        if after:
+            after_distance, after_source, after_id = after
+            if source > after_source:
+                page_conditions.append(distance_expr >= after_distance)
+            elif source < after_source:
+                page_conditions.append(distance_expr > after_distance)
+            else:
+                page_conditions.append(or_(
+                    distance_expr > after_distance,
+                    and_(distance_expr == after_distance, model.id > after_id)
+                ))
+
+        # テーブルごとに近い順で必要な件数（次のページの有無の判定用に+1件）まで取得してから統合する．
+        # （UNION ALLの外側で並べ替えるとインデックスが使えないため．）
+        page_queries.append(
+            select(
                 model.name.label('name'),
                 cast(model.geom, Geometry).ST_Y().label('lat'),
                 cast(model.geom, Geometry).ST_X().label('lon'),
-                model.geom.label('geom')
+                distance_expr.label('distance'),
+                literal(source, Integer).label('source'),
+                model.id.label('id')
             )
-            .filter(and_(*conditions))
+            .where(and_(*page_conditions))
+            .order_by(distance_expr, model.id)
+            .limit(offset + limit + 1)
         )
-        queries.append(query)
 
     # 2つのクエリを統合してサブクエリとして扱う．
-    # .subqueryでラップすることで，'unified_sq' という名前の仮想テーブルになる．
-    unified_sq = union_all(*queries).subquery("unified_sq")
+    count_sq = (
+        select(func.count().label('total'))
+        .select_from(union_all(*count_queries).subquery("matched_sq"))
+        .subquery("count_sq")
+    )
+    unified_sq = union_all(*page_queries).subquery("unified_sq")
+    sort_keys = [unified_sq.c.distance, unified_sq.c.source, unified_sq.c.id] # 仮想テーブルのカラムは .c 経由でアクセス
+    page_sq = (
+        select(unified_sq)
+        .order_by(*sort_keys)
+        .offset(offset)
+        .limit(limit + 1)
+        .subquery("page_sq")
+    )
 
-    # ページネーション前の総件数をサブクエリから取得
-    total_query = db.query(func.count()).select_from(unified_sq)
-    total = total_query.scalar()
+    # 総件数とページを1回のクエリで取得．ページが空でも総件数の行が返るよう外部結合する．
+    return (
+        select(count_sq.c.total, page_sq)
+        .select_from(count_sq.outerjoin(page_sq, true()))
+        .order_by(page_sq.c.distance, page_sq.c.source, page_sq.c.id)
+    )
 
-    center_point = f"SRID=4326;POINT({lon} {lat})" # lon -> latの順に注意！
+def build_search_result(rows: list, limit: int, count_limit: int) -> tuple[int, list, str | None, bool]:
+    """
+    build_search_statementの結果の行を，（総件数，ページの行，次のページのカーソル，総件数が打ち切られたか）に分ける．
+    """
+    total = rows[0].total
+    is_total_capped = total > count_limit
+    total = min(total, count_limit)
 
-    # 距離でソート・ページネーションを適用
-    results = (
-        db.query(unified_sq)
-        .order_by(
-            ST_Distance(
-                unified_sq.c.geom, # 仮想テーブルのカラムは .c 経由でアクセス
-                center_point
-            )
-        )
-        .offset(offset)
-        .limit(limit)
-        .all()
+    results = [row for row in rows if row.id is not None]
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last = results[-1]
+        next_cursor = encode_cursor(distance=last.distance, source=last.source, row_id=last.id)
+
+    return total, results, next_cursor, is_total_capped
+
+def search_locations_and_sort_by_distance(
+        db: Session,
+        name: str,
+        lat: float,
+        lon: float,
+        count_limit: int,
+        limit: int = 10,
+        offset: int = 0,
+        cursor: str | None = None
+    ):
+    """
+    スペース区切りの全ての検索クエリを名前に含むLocationをAND検索し，
+    指定された座標に近い順にソートしてリストを返す．
+
+    ページと総件数は1回のクエリで取得する．
+    cursorが渡された場合はoffsetを無視し，カーソルの位置より遠い行から取得する（キーセット・ページネーション）．
+    ⚠️ 警告: カーソルの条件はKNNの走査中のフィルタなので，カーソルより近い行もインデックスから読まれる．
+    カーソルで減るのは，各テーブルからUNION ALLと並べ替えに渡す行数（offset+limit件 -> limit件）だけ．
+    総件数はcount_limit件（設定のLOCATION_SEARCH_COUNT_LIMIT）で打ち切る．
+
+    Returns:
+        (int, list, str | None, bool): 総件数，ページの行，次のページのカーソル，総件数が打ち切られたか
+    """
+    statement = build_search_statement(
+        name=name, lat=lat, lon=lon, limit=limit, offset=offset, cursor=cursor, count_limit=count_limit
+    )
+    if statement is None:
+        return 0, [], None, False
+
+    rows = db.execute(statement).all()
+    return build_search_result(rows=rows, limit=limit, count_limit=count_limit)
+
+async def search_locations_and_sort_by_distance_async(
+        db: AsyncSession,
+        name: str,
+        lat: float,
+        lon: float,
+        count_limit: int,
+        limit: int = 10,
+        offset: int = 0,
+        cursor: str | None = None
+    ):
+    """
+    search_locations_and_sort_by_distanceの非同期版．
+    """
+    statement = build_search_statement(
+        name=name, lat=lat, lon=lon, limit=limit, offset=offset, cursor=cursor, count_limit=count_limit
     )
+    if statement is None:
+        return 0, [], None, False
 
-    return total, results
+    rows = (await db.execute(statement)).all()
+    return build_search_result(rows=rows, limit=limit, count_limit=count_limit)
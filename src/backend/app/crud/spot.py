@@ -1,38 +1,41 @@
 # app/crud/spot.py
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select, column, cast, Float, case
-from app.models import Spot
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, cast, Float, update, delete, or_, Select, literal, literal_column, Integer
+from app.models import Spot, SkyGlowLut
 from geoalchemy2.functions import ST_DWithin
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from geoalchemy2.types import Geometry
 from app.core.config import Settings
+from app.services.sky_glow_service import (
+    build_sky_glow_lut, get_sky_glow_params, NATURAL_SKY_BRIGHTNESS_MCD_M2, SQM_CONVERSION_CONSTANT, LOG_BASE_FACTOR
+)
 
-def get_top_spots_by_static_score(
-        db: Session,
-        settings: Settings,
-        lat: float,
-        lon: float,
-        radius_km: int,
-        limit: int = 10) -> list:
+WEB_MERCATOR_WORLD_WIDTH_M = 2 * 20037508.342789244 # EPSG:3857の世界全体の幅（m）
+MVT_EXTENT = 4096 # タイル内の座標の分解能
+MVT_BUFFER = 64 # タイル境界をまたぐ描画のためのバッファ（タイル内座標）
+
+def get_static_score_params(settings: Settings) -> str:
     """
-    指定された中心座標から半径内にあるスポットを検索する．
+    静的スコアの計算に用いるパラメータを文字列で返す．
+    Spot.static_score_paramsと比較して，再計算が必要なスポットを判定するために使う．
     """
-    # 検索中心（SRID=4326：世界測地系WGS84）
-    center_point = f"SRID=4326;POINT({lon} {lat})" # lon -> latの順に注意！
-    radius_m = radius_km * 1000
+    return get_sky_glow_params(settings=settings)
 
+def build_static_score_exprs(settings: Settings) -> dict:
+    """
+    静的スコアの計算式（SQLAlchemyの式オブジェクト）を返す．
+
+    Returns:
+        (dict): {'topography_score', 'sqm_value', 'sky_glow_score', 'static_score'} の式オブジェクト
+    """
     # 足切りするため，適当に静的スコアを組み合わせて「場所の良さ」を概算．
-    # A. 簡易地形スコアの計算式（式オブジェクト）
-    topography_score_expr = (
-        select(func.count())
-        .select_from(func.unnest(Spot.horizon_profile).alias('h'))
-        .where(column('h') <= 3.0)
-    ).scalar_subquery() / cast(func.cardinality(Spot.horizon_profile), Float)
+    # A. 簡易地形スコアの計算式（式オブジェクト）：稜線の仰角が3度以下の方位の割合
+    # 稜線プロファイルの要約として登録時に計算済みの値を使う（horizon_service.summarize_horizon_profile）．
+    topography_score_expr = Spot.open_sky_fraction_3
 
     # B. 光害スコアの正規化式
-    # B-1. World Atlas 2015の生値をSQM値に変換
-    NATURAL_SKY_BRIGHTNESS_MCD_M2 = 0.171168465
-    SQM_CONVERSION_CONSTANT = 108000000
-    LOG_BASE_FACTOR = -0.4
+    # B-1. World Atlas 2015の生値をSQM値に変換（表示用．光害スコアの計算には使わない．）
     SQM_MIN = settings.SQM_MIN
     SQM_MAX = settings.SQM_MAX
     
@@ -43,61 +46,261 @@ def get_top_spots_by_static_score(
         SQM_MIN
     )
 
-    # B-2. SQM値を限界等級NELM（Naked-Eye Limiting Magnitude）に変換
-    # 参考文献：Crumey, Andrew (2014). “Human Contrast Threshold and Astronomical Visibility”. Monthly Notices of the Royal Astronomical Society. 442 (3): 2600-2619.
-    F = 2.0 # 典型的な観測者と仮定
+    # B-2. 生値をルックアップテーブル（sky_glow_lut）の隣接する2点で線形補間して，0-1の光害スコアに変換
+    # （Pythonのscore_service.convert_wa2015_to_sky_glow_scoreと同じ表を使う．）
+    sky_glow_lut = build_sky_glow_lut(sqm_min=SQM_MIN, sqm_max=SQM_MAX, size=settings.SKY_GLOW_LUT_SIZE)
+    raw_max = float(sky_glow_lut.raw_values[-1])
+    step = float(sky_glow_lut.step)
 
-    NELM_INTERCEPT_91 = -1.44 - (2.5 * func.log10(F))
-    NELM_SLOPE_91 = 0.383
+    # Spot.wa2015_raw_valueがNULLの場合は，最悪値（光害スコア0）で計算．
+    raw_value_expr = func.least(func.greatest(func.coalesce(Spot.wa2015_raw_value, raw_max), 0.0), raw_max)
+    lut_idx_expr = func.least(cast(func.floor(raw_value_expr / step), Integer), settings.SKY_GLOW_LUT_SIZE - 2)
+    lower_score_expr = select(SkyGlowLut.sky_glow_score).where(SkyGlowLut.idx == lut_idx_expr).scalar_subquery()
+    upper_score_expr = select(SkyGlowLut.sky_glow_score).where(SkyGlowLut.idx == lut_idx_expr + 1).scalar_subquery()
+    sky_glow_score_expr = (
+        lower_score_expr
+        + (upper_score_expr - lower_score_expr) * (raw_value_expr - lut_idx_expr * step) / step
+    )
 
-    NELM_INTERCEPT_90 = 0.8 - (2.5 * func.log10(F))
-    NELM_SLOPE_90 = 0.27
+    # C. 最終的な静的スコアの計算式
+    final_static_score = (topography_score_expr * sky_glow_score_expr)
 
-    nelm_value_expr = case(
-        (
-            sqm_value_expr >= 19.5,
-            (NELM_SLOPE_91 * sqm_value_expr) + NELM_INTERCEPT_91 # 参考文献の(91)式
-        ),
-        else_=(
-            (NELM_SLOPE_90 * sqm_value_expr) + NELM_INTERCEPT_90 # 参考文献の(90)式
-        )
-    )
+    return {
+        'topography_score': topography_score_expr,
+        'sqm_value': sqm_value_expr,
+        'sky_glow_score': sky_glow_score_expr,
+        'static_score': final_static_score
+    }
 
-    # NELMをクリップ
-    NELM_MIN = (NELM_SLOPE_90 * SQM_MIN) + NELM_INTERCEPT_90
-    NELM_MAX = (NELM_SLOPE_91 * SQM_MAX) + NELM_INTERCEPT_91
-    nelm_value_expr = func.least(func.greatest(nelm_value_expr, NELM_MIN), NELM_MAX)
+def refresh_sky_glow_lut(db: Session, settings: Settings) -> None:
+    """
+    sky_glow_lutテーブルを，SQM_MIN・SQM_MAXから作ったルックアップテーブルで上書きする．（コミットはしない）
+    複数のプロセスが同時に起動しても主キーが衝突しないよう，UPSERTで書き込む．
+    """
+    sky_glow_lut = build_sky_glow_lut(sqm_min=settings.SQM_MIN, sqm_max=settings.SQM_MAX, size=settings.SKY_GLOW_LUT_SIZE)
+    rows = [
+        {'idx': idx, 'wa2015_raw_value': float(raw_value), 'sky_glow_score': float(score)}
+        for idx, (raw_value, score) in enumerate(zip(sky_glow_lut.raw_values, sky_glow_lut.scores))
+    ]
+    statement = insert(SkyGlowLut).values(rows)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[SkyGlowLut.idx],
+        set_={
+            'wa2015_raw_value': statement.excluded.wa2015_raw_value,
+            'sky_glow_score': statement.excluded.sky_glow_score
+        }
+    ))
+    db.execute(delete(SkyGlowLut).where(SkyGlowLut.idx >= len(rows)))
 
-    # NELMを0-1の範囲に正規化
-    NELM_RANGE = NELM_MAX - NELM_MIN
-    sky_glow_score_expr = case(
-        (NELM_RANGE > 0, (nelm_value_expr - NELM_MIN) / NELM_RANGE),
-        else_=0.0
+def refresh_static_scores(db: Session, settings: Settings, stale_only: bool = True) -> int:
+    """
+    スポットの静的スコアを再計算して，カラムに保存する．
+
+    Args:
+        stale_only (bool): Trueの場合，入力値が更新されたスポットと，異なるSQM_MIN・SQM_MAXで計算されたスポットのみを再計算する．
+
+    Returns:
+        (int): 再計算したスポットの件数
+    """
+    params = get_static_score_params(settings=settings)
+    exprs = build_static_score_exprs(settings=settings)
+
+    refresh_sky_glow_lut(db=db, settings=settings)
+
+    statement = update(Spot).values(
+        topography_score=exprs['topography_score'],
+        sqm_value=exprs['sqm_value'],
+        sky_glow_score=exprs['sky_glow_score'],
+        static_score=exprs['static_score'],
+        static_score_params=params
     )
+    if stale_only:
+        statement = statement.where(
+            or_(Spot.static_score_params.is_(None), Spot.static_score_params != params)
+        )
 
-    # C. 最終的な静的スコアの計算式
-    final_static_score = (topography_score_expr * sky_glow_score_expr)
+    num_updated = db.execute(statement.execution_options(synchronize_session=False)).rowcount
+    db.commit()
+
+    return num_updated
+
+def build_top_spots_statement(
+        lat: float,
+        lon: float,
+        radius_km: int,
+        limit: int = 10) -> Select:
+    """
+    指定された中心座標から半径内にあるスポットを，静的スコアの高い順に取得するSELECT文を組み立てる．
+    静的スコアはrefresh_static_scoresで事前に計算されたカラムを使う．
+    """
+    # 検索中心（SRID=4326：世界測地系WGS84）
+    center_point = f"SRID=4326;POINT({lon} {lat})" # lon -> latの順に注意！
+    # asyncpgは文字列をVARCHARとして送るため，明示的にgeographyに変換する（varchar→geographyの暗黙の変換は無い．）
+    center_geog = func.ST_GeogFromText(center_point)
+    radius_m = radius_km * 1000
 
-    results_query = (
-        db.query(
+    return (
+        select(
             Spot.name.label('name'),
             cast(Spot.geom, Geometry).ST_Y().label('lat'),
             cast(Spot.geom, Geometry).ST_X().label('lon'),
             Spot.elevation_m.label('elevation_m'),
             Spot.horizon_profile.label('horizon_profile'),
+            Spot.horizon_octant_min.label('horizon_octant_min'),
+            Spot.sky_glow_score.label('sky_glow_score'),
         )
-        .filter(
+        .where(
             ST_DWithin(
                 Spot.geom,    # スポットのgeomカラム
-                center_point, # 検索中心のポイント
+                center_geog,  # 検索中心のポイント
                 radius_m      # 検索半径（m）
             )
         )
-        .add_columns(sky_glow_score_expr.label('sky_glow_score'))
-        .order_by(final_static_score.desc().nulls_last()) # デフォルトでは，NULLが先頭に来る．
+        # ix_spots_static_scoreと同じ並び順．デフォルトでは，NULLが先頭に来る．
+        .order_by(Spot.static_score.desc().nulls_last())
         .limit(limit)
     )
 
-    results = results_query.all() # Rowオブジェクトのlistになる．
+def get_top_spots_by_static_score(
+        db: Session,
+        settings: Settings,
+        lat: float,
+        lon: float,
+        radius_km: int,
+        limit: int = 10) -> list:
+    """
+    指定された中心座標から半径内にあるスポットを検索する．
+    静的スコアはrefresh_static_scoresで事前に計算されたカラムを使う．
+    """
+    statement = build_top_spots_statement(lat=lat, lon=lon, radius_km=radius_km, limit=limit)
+    results = db.execute(statement).all() # Rowオブジェクトのlistになる．
+
+    return results
+
+async def get_top_spots_by_static_score_async(
+        db: AsyncSession,
+        settings: Settings,
+        lat: float,
+        lon: float,
+        radius_km: int,
+        limit: int = 10) -> list:
+    """
+    get_top_spots_by_static_scoreの非同期版．
+    """
+    statement = build_top_spots_statement(lat=lat, lon=lon, radius_km=radius_km, limit=limit)
+    results = (await db.execute(statement)).all()
+
+    return results
+
+def build_spot_tile_features(z: int, x: int, y: int, cluster_max_zoom: int, cluster_cells: int):
+    """
+    XYZタイルの範囲にあるスポットのサブクエリを組み立てる．
+    ズームレベルがcluster_max_zoom以下の場合は，タイルをcluster_cells×cluster_cellsの格子に分けてクラスタリングする．
+
+    Returns:
+        サブクエリ（カラム：geom_3857, name, static_score, sky_glow_score, topography_score, count）
+    """
+    envelope = func.ST_TileEnvelope(z, x, y) # EPSG:3857
+    # geometry(geom)の関数インデックス（idx_spots_geom_geometry）を使うため，経緯度の矩形と比較する．
+    geom = func.geometry(Spot.geom)
+    in_tile = geom.op('&&')(func.ST_Transform(envelope, 4326))
+    geom_3857 = func.ST_Transform(geom, 3857)
+
+    if z > cluster_max_zoom:
+        return (
+            select(
+                geom_3857.label('geom_3857'),
+                Spot.name.label('name'),
+                Spot.static_score.label('static_score'),
+                Spot.sky_glow_score.label('sky_glow_score'),
+                Spot.topography_score.label('topography_score'),
+                literal(1, Integer).label('count')
+            )
+            .where(in_tile)
+            .subquery('features')
+        )
+
+    # 格子ごとに，スポットの重心と，静的スコアが最も高いスポットの名前・スコアを代表とする．
+    cell_size_m = WEB_MERCATOR_WORLD_WIDTH_M / (2 ** z) / cluster_cells
+    cell = func.ST_SnapToGrid(geom_3857, cell_size_m)
+    best_first = Spot.static_score.desc().nulls_last()
+    return (
+        select(
+            func.ST_Centroid(func.ST_Collect(geom_3857)).label('geom_3857'),
+            func.array_agg(aggregate_order_by(Spot.name, best_first))[1].label('name'),
+            func.max(Spot.static_score).label('static_score'),
+            func.array_agg(aggregate_order_by(Spot.sky_glow_score, best_first))[1].label('sky_glow_score'),
+            func.array_agg(aggregate_order_by(Spot.topography_score, best_first))[1].label('topography_score'),
+            func.count().label('count')
+        )
+        .where(in_tile)
+        .group_by(cell)
+        .subquery('features')
+    )
+
+def build_spot_tile_mvt_statement(z: int, x: int, y: int, cluster_max_zoom: int, cluster_cells: int) -> Select:
+    """
+    スポットのMapbox Vector Tile（レイヤー名：spots）を返すSELECT文を組み立てる．
+    """
+    features = build_spot_tile_features(z=z, x=x, y=y, cluster_max_zoom=cluster_max_zoom, cluster_cells=cluster_cells)
+    mvt_rows = (
+        select(
+            func.ST_AsMVTGeom(features.c.geom_3857, func.ST_TileEnvelope(z, x, y), MVT_EXTENT, MVT_BUFFER, True).label('geom'),
+            features.c.name,
+            features.c.static_score,
+            features.c.sky_glow_score,
+            features.c.topography_score,
+            features.c.count
+        )
+        .subquery('mvt_rows')
+    )
+    return select(func.ST_AsMVT(literal_column('mvt_rows'), 'spots', MVT_EXTENT, 'geom')).select_from(mvt_rows)
+
+def build_spot_tile_rows_statement(z: int, x: int, y: int, cluster_max_zoom: int, cluster_cells: int) -> Select:
+    """
+    スポットを経緯度付きの行で返すSELECT文を組み立てる．（カラム形式のJSON用）
+    """
+    features = build_spot_tile_features(z=z, x=x, y=y, cluster_max_zoom=cluster_max_zoom, cluster_cells=cluster_cells)
+    geom_4326 = func.ST_Transform(features.c.geom_3857, 4326)
+    return (
+        select(
+            features.c.name,
+            func.ST_Y(geom_4326).label('lat'),
+            func.ST_X(geom_4326).label('lon'),
+            features.c.static_score,
+            features.c.sky_glow_score,
+            features.c.topography_score,
+            features.c.count
+        )
+        .order_by(features.c.static_score.desc().nulls_last())
+    )
+
+async def get_spot_tile_mvt_async(
+        db: AsyncSession,
+        z: int,
+        x: int,
+        y: int,
+        cluster_max_zoom: int,
+        cluster_cells: int) -> bytes:
+    """
+    スポットのMapbox Vector Tileを返す．スポットが無い場合は空のバイト列になる．
+    """
+    statement = build_spot_tile_mvt_statement(z=z, x=x, y=y, cluster_max_zoom=cluster_max_zoom, cluster_cells=cluster_cells)
+    tile = (await db.execute(statement)).scalar()
+
+    return bytes(tile) if tile else b""
+
+async def get_spot_tile_rows_async(
+        db: AsyncSession,
+        z: int,
+        x: int,
+        y: int,
+        cluster_max_zoom: int,
+        cluster_cells: int) -> list:
+    """
+    タイルの範囲にあるスポット（またはクラスタ）の行を，静的スコアの高い順に返す．
+    """
+    statement = build_spot_tile_rows_statement(z=z, x=x, y=y, cluster_max_zoom=cluster_max_zoom, cluster_cells=cluster_cells)
+    results = (await db.execute(statement)).all()
 
     return results
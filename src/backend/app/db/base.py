@@ -3,3 +3,4 @@
 from app.db.base_class import Base
 from app.models.location import Location
 from app.models.spot import Spot
+from app.models.sky_glow_lut import SkyGlowLut
@@ -0,0 +1,90 @@
+# app/db/bulk_load.py
+# データ登録スクリプト（scripts/load_*.py）用の，COPYによる一括登録の部品
+import csv
+import io
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from tqdm import tqdm
+
+COPY_BATCH_ROWS = 50000 # 1回のCOPYで送る行数（スクリプトのメモリ使用量はこれで決まる．）
+
+def format_pg_bytea(data: bytes | None) -> str | None:
+    """
+    バイト列をPostgreSQLのbyteaの16進数表記（'\\x0102'）に変換する．
+    """
+    if data is None:
+        return None
+    return "\\x" + data.hex()
+
+def copy_rows(db: Session, table: str, columns: list[str], rows, batch_rows: int = COPY_BATCH_ROWS) -> int:
+    """
+    行（タプル）のイテラブルを，COPY FROM STDIN（CSV形式）でbatch_rows行ずつテーブルに送る．
+    Noneは引用符の無い空欄（NULL）として送り，それ以外の値は引用符で囲む（空文字列をNULLと区別するため）．
+
+    Returns:
+        (int): 送った行数
+    """
+    cursor = db.connection().connection.cursor() # セッションと同じトランザクションのDBAPIカーソル
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+
+    def flush(buffer: io.StringIO) -> None:
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+
+    num_rows = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL, lineterminator='\n')
+    start_time = time.perf_counter()
+    with tqdm(desc=f"COPY {table}", unit="rows") as pbar:
+        for row in rows:
+            writer.writerow(row)
+            num_rows += 1
+            if num_rows % batch_rows == 0:
+                flush(buffer)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL, lineterminator='\n')
+                pbar.update(batch_rows)
+        if num_rows % batch_rows:
+            flush(buffer)
+            pbar.update(num_rows % batch_rows)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"COPY: {num_rows}行，{elapsed:.1f}秒，{num_rows / max(elapsed, 1e-9):.0f}行/秒")
+    return num_rows
+
+def drop_secondary_indexes(db: Session, table: str) -> list[str]:
+    """
+    主キーと一意インデックス以外のインデックスを削除し，作り直すためのCREATE INDEX文を返す．
+    （一括登録の後にまとめて作る方が，1行ずつインデックスを更新するより速い．）
+    """
+    rows = db.execute(text("""
+        SELECT i.relname AS index_name, pg_get_indexdef(ix.indexrelid) AS index_def
+        FROM pg_index ix
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        WHERE ix.indrelid = CAST(:table AS regclass)
+          AND NOT ix.indisprimary AND NOT ix.indisunique
+    """), {'table': table}).all()
+
+    for row in rows:
+        db.execute(text(f'DROP INDEX "{row.index_name}"'))
+    return [row.index_def for row in rows]
+
+def create_indexes(db: Session, index_defs: list[str]) -> None:
+    """
+    drop_secondary_indexesで削除したインデックスを作り直す．
+    """
+    for index_def in index_defs:
+        start_time = time.perf_counter()
+        db.execute(text(index_def))
+        print(f"インデックスを作成（{time.perf_counter() - start_time:.1f}秒）: {index_def}")
+
+def run_timed(db: Session, statement: str, label: str) -> int:
+    """
+    SQL文を実行し，処理した行数と速度を表示する．
+    """
+    start_time = time.perf_counter()
+    num_rows = db.execute(text(statement)).rowcount
+    elapsed = time.perf_counter() - start_time
+    print(f"{label}: {num_rows}行，{elapsed:.1f}秒，{num_rows / max(elapsed, 1e-9):.0f}行/秒")
+    return num_rows
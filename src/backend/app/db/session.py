@@ -1,13 +1,28 @@
 # app/db/session.py
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from app.core.config import get_settings
 
 settings = get_settings()
 
-engine = create_engine(str(settings.DATABASE_URL))
+engine = create_engine(
+    str(settings.DATABASE_URL),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async defのルーターでイベントループを止めないための非同期エンジン（asyncpg）
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=settings.DB_POOL_PRE_PING
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # FastAPIのDependsで使うためのDBセッション取得関数
 def get_db():
     db = SessionLocal()
@@ -15,3 +30,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# async defのルーターのDependsで使うための非同期DBセッション取得関数
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,13 +1,91 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
-from app.routers import locations, recommendations, forecasts, trajectories
+import rasterio
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import get_settings
+from app.crud import spot as crud_spot
+from app.db import session
+from app.services.search_service import NameSearchService, get_name_search_service
+from app.services.sky_glow_service import get_sky_glow_raster, get_sky_glow_score_raster, get_sky_glow_params
+from app.routers import locations, recommendations, forecasts, trajectories, satellites, spots, sky_glow
 
-app = FastAPI()
+def rebuild_name_search_index(name_search_service: NameSearchService) -> None:
+    """
+    DBから場所検索のインメモリ索引を再構築する．
+    """
+    try:
+        with session.SessionLocal() as db:
+            name_search_service.rebuild(db=db)
+    except SQLAlchemyError as e:
+        print(f"⚠️ 警告: 場所検索の索引の構築に失敗しました: {e}")
+
+async def rebuild_name_search_index_periodically(name_search_service: NameSearchService, interval_s: int) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        await asyncio.to_thread(rebuild_name_search_index, name_search_service)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+
+    # 入力値やSQM_MIN・SQM_MAXが変わったスポットの静的スコアを再計算
+    try:
+        with session.SessionLocal() as db:
+            num_updated = crud_spot.refresh_static_scores(db=db, settings=settings)
+        print(f"{num_updated}件のスポットの静的スコアを再計算しました．")
+    except SQLAlchemyError as e:
+        print(f"⚠️ 警告: 静的スコアの再計算に失敗しました: {e}")
+
+    # 光害スコアの取得をファイルI/O無しで済ませるため，事前計算された光害スコアのGeoTIFFの範囲をメモリに載せる．
+    # 同じパラメータで作られたものに限って使う．
+    try:
+        get_sky_glow_score_raster().load(
+            path_world_atlas_2015=settings.PATH_SKY_GLOW_SCORE_TIFF,
+            required_tags={'SKY_GLOW_PARAMS': get_sky_glow_params(settings=settings)}
+        )
+    except (rasterio.errors.RasterioIOError, ValueError) as e:
+        print(f"⚠️ 警告: 光害スコアのGeoTIFFを使いません: {e}")
+    # 使えない場合に限り，World Atlas 2015の同じ範囲を載せる．
+    # （光害スコアを載せた範囲の内側では生値を参照しないため，両方を載せてもメモリを使うだけ．）
+    if not get_sky_glow_score_raster().is_loaded():
+        try:
+            get_sky_glow_raster().load(path_world_atlas_2015=settings.PATH_WORLD_ATLAS_2015_TIFF)
+        except rasterio.errors.RasterioIOError as e:
+            print(f"⚠️ 警告: World Atlas 2015を読み込めませんでした．光害の値はリクエストごとにファイルから取得します: {e}")
+
+    # DEMのタイル一覧を読み込む（標高の取得でDEMの無いメッシュをファイルI/O無しで除外するため．）
+    # ファイルが無ければここで1回だけ走査して保存し，稜線計算のワーカープロセスはそれをメモリマップで開く．
+    settings.get_dem_tile_manifest()
+
+    # 場所検索のインメモリ索引を，スナップショットが無ければDBから構築
+    rebuild_task = None
+    if settings.LOCATION_SEARCH_INDEX_ENABLED:
+        name_search_service = get_name_search_service()
+        if not name_search_service.load_snapshot():
+            rebuild_name_search_index(name_search_service)
+        if settings.LOCATION_SEARCH_INDEX_REBUILD_INTERVAL_S > 0:
+            rebuild_task = asyncio.create_task(rebuild_name_search_index_periodically(
+                name_search_service, settings.LOCATION_SEARCH_INDEX_REBUILD_INTERVAL_S
+            ))
+
+    yield
+
+    if rebuild_task:
+        rebuild_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await rebuild_task
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(locations.router)
 app.include_router(recommendations.router)
 app.include_router(forecasts.router)
 app.include_router(trajectories.router)
+app.include_router(satellites.router)
+app.include_router(spots.router)
+app.include_router(sky_glow.router)
 
 @app.get("/")
 def read_root():
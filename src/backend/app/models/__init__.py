@@ -4,3 +4,4 @@
 # これが無いと，from app.models.location import Location と書かなければならない．
 from .location import Location
 from .spot import Spot
+from .sky_glow_lut import SkyGlowLut
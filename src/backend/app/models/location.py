@@ -1,5 +1,5 @@
 # app/models/location.py
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index
 from app.db.base_class import Base
 from geoalchemy2 import Geography
 
@@ -9,3 +9,8 @@ class Location(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     geom = Column(Geography(geometry_type='POINT', srid=4326), nullable=False) # SRID=4326：世界測地系（WGS84）
+
+    __table_args__ = (
+        # 部分一致検索（LIKE '%kw%'）用のトライグラムGINインデックス（要pg_trgm拡張）
+        Index('ix_locations_name_trgm', name, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
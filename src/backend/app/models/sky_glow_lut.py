@@ -0,0 +1,15 @@
+# app/models/sky_glow_lut.py
+from sqlalchemy import Column, Integer, Float
+from app.db.base_class import Base
+
+class SkyGlowLut(Base):
+    """
+    World Atlas 2015の生値から光害スコアへの量子化されたルックアップテーブル．
+    生値をSKY_GLOW_LUT_SIZE等分した格子点の光害スコアを持ち，SQLでは隣接する2行の線形補間で光害スコアを求める．
+    （crud/spot.pyのrefresh_static_scoresで，Pythonの光害スコアと同じ表に更新される．）
+    """
+    __tablename__ = "sky_glow_lut"
+
+    idx = Column(Integer, primary_key=True) # 格子点の番号（生値 = idx × 刻み幅）
+    wa2015_raw_value = Column(Float, nullable=False) # 人工光の輝度（mcd/m2）
+    sky_glow_score = Column(Float, nullable=False)
@@ -1,5 +1,5 @@
 # app/models/spot.py
-from sqlalchemy import Column, Integer, String, ARRAY, Float, BigInteger
+from sqlalchemy import Column, Integer, String, Float, BigInteger, Index, LargeBinary, func
 from app.db.base_class import Base
 from geoalchemy2 import Geography
 
@@ -17,7 +17,32 @@ class Spot(Base):
     polygon_geom = Column(Geography(geometry_type='POLYGON', srid=4326), nullable=True) # POLYGONがあれば格納
 
     # 時間的に変化しない静的な評価指標
-    horizon_profile = Column(ARRAY(Float), nullable=True)
+    # 稜線プロファイル．0.01度単位のint16（ビッグエンディアン）を方位の順に並べたバイト列（horizon_service参照）
+    horizon_profile = Column(LargeBinary, nullable=True)
+    # 稜線プロファイルの要約（horizon_service.summarize_horizon_profileで計算）
+    open_sky_fraction_0 = Column(Float, nullable=True) # 稜線の仰角が0度以下の方位の割合
+    open_sky_fraction_3 = Column(Float, nullable=True) # 同3度以下（簡易地形スコアに使う．）
+    open_sky_fraction_5 = Column(Float, nullable=True) # 同5度以下
+    open_sky_fraction_10 = Column(Float, nullable=True) # 同10度以下
+    max_ridge_angle = Column(Float, nullable=True) # 稜線の最大仰角（度）
+    horizon_octant_max = Column(LargeBinary, nullable=True) # 45度ごとの区画の最大仰角（稜線プロファイルと同じ形式）
+    horizon_octant_min = Column(LargeBinary, nullable=True) # 同最小仰角（稜線に隠れるパスの事前判定に使う．）
     wa2015_raw_value = Column(Float, nullable=True)
 
     elevation_m = Column(Float, nullable=True) # 標高（m）
+
+    # 静的スコアの計算結果（crud/spot.pyのrefresh_static_scoresで更新）
+    topography_score = Column(Float, nullable=True) # 簡易地形スコア
+    sqm_value = Column(Float, nullable=True) # SQM値
+    sky_glow_score = Column(Float, nullable=True) # 光害スコア
+    static_score = Column(Float, nullable=True) # 簡易地形スコア × 光害スコア
+    # 計算に用いたSQM_MIN・SQM_MAX．入力値（horizon_profile・wa2015_raw_value）が更新されるとトリガーでNULLに戻る．
+    static_score_params = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index('ix_spots_static_score', static_score.desc().nulls_last()),
+        # 部分一致検索（LIKE '%kw%'）用のトライグラムGINインデックス（要pg_trgm拡張）
+        Index('ix_spots_name_trgm', name, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # 地図タイル（経緯度の矩形との&&）用のgeometry型の関数GiSTインデックス
+        Index('idx_spots_geom_geometry', func.geometry(geom), postgresql_using='gist'),
+    )
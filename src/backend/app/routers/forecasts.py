@@ -5,8 +5,9 @@ import numpy as np
 from app.schemas import event as schemas_event
 from app.core.config import Settings, get_settings
 from app.services.dem_service import get_elevations_by_coords, calc_horizon_profile_parallel
-from app.services.event_service import get_events_for_the_coord, get_weather_dataframe_sync
+from app.services.event_service import get_events_for_the_coord, get_weather_dataframe_sync, TopEvents
 from app.services.score_service import calc_sky_glow_score
+from app.services.horizon_service import encode_horizon_profile
 from app.services.sat_service import SatDataService, get_sat_data_service
 
 router = APIRouter()
@@ -37,11 +38,13 @@ def forecast_events(
         max_distance=50000, # 事前計算より軽いパラメータ
         num_samples=50
     )
-    horizon_profile = list(horizon_profile)
+    horizon_profile = encode_horizon_profile(horizon_profile) # スポットと同じ保存形式に揃える．
 
     sky_glow_score = calc_sky_glow_score(coords_to_sample=[(lon, lat)], settings=settings)[0]
 
-    events = get_events_for_the_coord(
+    # 上位offset+limit件だけを保持し，それ以外のイベントはスコア計算を省略して件数のみを数える．
+    top_events = TopEvents(k=offset+limit)
+    get_events_for_the_coord(
         location_name="",
         lat=lat,
         lon=lon,
@@ -49,11 +52,11 @@ def forecast_events(
         horizon_profile=horizon_profile,
         sky_glow_score=sky_glow_score,
         sat_service=sat_service,
-        weather_df=weather_df
+        weather_df=weather_df,
+        top_events=top_events
     )
 
     # visibilityが高い順にソート
-    events = sorted(events, key=lambda e: e.scores.visibility, reverse=True)
-    total = len(events)
+    sorted_events = top_events.sorted_events()
     
-    return {'total': total, 'events': events[offset:offset+limit]}
+    return {'total': top_events.total, 'events': sorted_events[offset:offset+limit]}
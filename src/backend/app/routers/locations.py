@@ -1,23 +1,47 @@
 # app/routers/locations.py
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import Settings, get_settings
 from app.crud import location as crud_location
 from app.db import session
 from app.schemas import location as schemas_location
+from app.services.search_service import NameSearchService, get_name_search_service, encode_offset_cursor, decode_offset_cursor
 
 router = APIRouter()
 @router.get("/api/v1/locations", response_model=schemas_location.LocationsResponse)
-def search_locations(
+async def search_locations(
         q: str = Query(...),
         lat: float = Query(35.68126494858904), # デフォルト：東京駅
         lon: float = Query(139.7670650510304),
         limit: int = Query(10),
         offset: int = Query(0),
-        db: Session = Depends(session.get_db)):
-    total, results_from_db = crud_location.search_locations_and_sort_by_distance(
-        db=db, name=q, lat=lat, lon=lon, limit=limit, offset=offset
-    )
+        cursor: str | None = Query(None, description="前のレスポンスのnext_cursor．指定した場合はoffsetを無視する．"),
+        db: AsyncSession = Depends(session.get_async_db),
+        settings: Settings = Depends(get_settings),
+        name_search_service: NameSearchService = Depends(get_name_search_service)):
+    # インメモリ索引のカーソルはページ位置（offset）を持つ．
+    cursor_offset = decode_offset_cursor(cursor) if cursor else None
+    if cursor_offset is not None:
+        offset, cursor = cursor_offset, None
+
+    index = name_search_service.get_index() if settings.LOCATION_SEARCH_INDEX_ENABLED else None
+    if index and cursor is None:
+        total, results = index.search(name=q, lat=lat, lon=lon, limit=limit, offset=offset)
+        return {
+            "total": total,
+            "locations": [schemas_location.Location(name=row.name, lat=row.lat, lon=row.lon) for row in results],
+            "next_cursor": encode_offset_cursor(offset + limit) if offset + limit < total else None,
+            "is_total_capped": False
+        }
+
+    try:
+        total, results_from_db, next_cursor, is_total_capped = await crud_location.search_locations_and_sort_by_distance_async(
+            db=db, name=q, lat=lat, lon=lon, limit=limit, offset=offset, cursor=cursor,
+            count_limit=settings.LOCATION_SEARCH_COUNT_LIMIT
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursorが不正です．")
 
     locations_for_response = []
     for row in results_from_db:
@@ -29,4 +53,9 @@ def search_locations(
             )
         )
 
-    return {"total": total, "locations": locations_for_response}
+    return {
+        "total": total,
+        "locations": locations_for_response,
+        "next_cursor": next_cursor,
+        "is_total_capped": is_total_capped
+    }
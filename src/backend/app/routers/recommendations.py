@@ -1,13 +1,15 @@
 # app/routers/recommendations.py
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from skyfield.api import load
 import httpx
 import asyncio
+import json
 from app.db import session
 from app.schemas import event as schemas_event
 from app.crud import spot as crud_spot
-from app.services.event_service import get_events_for_the_coord, fetch_weather_limited
+from app.services.event_service import get_events_for_the_coord, fetch_weather_limited, TopEvents
 from app.services.sat_service import SatDataService, get_sat_data_service
 from app.core.config import Settings, get_settings
 
@@ -19,11 +21,11 @@ async def recommend_events(
     radius: int = Query(...),
     limit: int = Query(10),
     offset: int = Query(0),
-    db: Session = Depends(session.get_db),
+    db: AsyncSession = Depends(session.get_async_db),
     settings: Settings = Depends(get_settings),
     sat_service: SatDataService = Depends(get_sat_data_service)):
     # 探索中心と探索半径を用いて，観測候補スポットのRowオブジェクトのリストを取得．
-    potential_spots = crud_spot.get_top_spots_by_static_score(
+    potential_spots = await crud_spot.get_top_spots_by_static_score_async(
         db=db, settings=settings, lat=lat, lon=lon, radius_km=radius, limit=10
     )
 
@@ -47,23 +49,131 @@ async def recommend_events(
         # asyncio.gatherでタスクを並行処理（セマフォにより同時実行数が制限されている．）
         weather_forecasts = await asyncio.gather(*weather_tasks)
 
-    unified_events = []
-    for row, weather_df in zip(potential_spots, weather_forecasts):
-        events_for_the_spot = get_events_for_the_coord(
+    # 上位offset+limit件だけを保持し，それ以外のイベントはスコア計算を省略して件数のみを数える．
+    top_events = TopEvents(k=offset+limit)
+
+    # 光害スコア（イベントのスコアの上界）が高いスポットから処理し，早い段階で下限を引き上げる．
+    spot_order = sorted(range(len(potential_spots)),
+                        key=lambda i: potential_spots[i].sky_glow_score or 0.0, reverse=True)
+    for spot_index in spot_order:
+        row, weather_df = potential_spots[spot_index], weather_forecasts[spot_index]
+        # 軌道計算はCPUバウンドなので，イベントループを止めないよう別スレッドで実行
+        # （1スポットずつ待つため，top_eventsを同時に更新することは無い．）
+        await asyncio.to_thread(
+            get_events_for_the_coord,
             location_name=row.name,
             lat=row.lat,
             lon=row.lon,
             elevation_m=row.elevation_m,
             horizon_profile=row.horizon_profile,
+            horizon_octant_min=row.horizon_octant_min,
             sky_glow_score=row.sky_glow_score,
             sat_service=sat_service,
-            weather_df=weather_df
+            weather_df=weather_df,
+            top_events=top_events,
+            spot_index=spot_index
         )
-        if events_for_the_spot:
-            unified_events.extend(events_for_the_spot)
 
     # visibilityが高い順にソート
-    top_events = sorted(unified_events, key=lambda e: e.scores.visibility, reverse=True)
-    total = len(top_events)
+    sorted_events = top_events.sorted_events()
     
-    return {'total': total, 'events': top_events[offset:offset+limit]}
+    return {'total': top_events.total, 'events': sorted_events[offset:offset+limit]}
+
+def _format_frame(payload: dict, stream_format: str) -> str:
+    """
+    1フレーム分のデータをNDJSONまたはServer-Sent-Eventsの形式に変換する．
+    """
+    data = json.dumps(payload, ensure_ascii=False)
+    if stream_format == 'sse':
+        return f"event: {payload['type']}\ndata: {data}\n\n"
+    return f"{data}\n"
+
+@router.get("/api/v1/recommendations/events/stream")
+async def recommend_events_stream(
+    lat: float = Query(...),
+    lon: float = Query(...),
+    radius: int = Query(...),
+    limit: int = Query(10),
+    offset: int = Query(0),
+    stream_format: str = Query('ndjson', alias='format', pattern='^(ndjson|sse)$'),
+    db: AsyncSession = Depends(session.get_async_db),
+    settings: Settings = Depends(get_settings),
+    sat_service: SatDataService = Depends(get_sat_data_service)):
+    """
+    スポットごとの観測イベントを，計算でき次第ストリーミングで返す．
+    最後のフレームで総件数とvisibilityの高い順のページ（offset・limit適用済み）を返す．
+
+    フレームの例（NDJSON）：
+        {"type": "spot", "location_name": "...", "lat": ..., "lon": ..., "events": [...]}
+        {"type": "summary", "total": 42, "events": [...]}
+    """
+    potential_spots = await crud_spot.get_top_spots_by_static_score_async(
+        db=db, settings=settings, lat=lat, lon=lon, radius_km=radius, limit=10
+    )
+
+    async def frame_generator():
+        # 上位offset+limit件だけを保持
+        top_events = TopEvents(k=offset+limit)
+
+        async with httpx.AsyncClient() as client:
+            semaphore = asyncio.Semaphore(settings.OPEN_METEO_CONCURRENCY_LIMIT)
+
+            async def fetch_for_spot(spot):
+                weather_df = await fetch_weather_limited(
+                    lat=spot.lat,
+                    lon=spot.lon,
+                    elevation_m=spot.elevation_m,
+                    client=client,
+                    semaphore=semaphore
+                )
+                return spot, weather_df
+
+            weather_tasks = [asyncio.create_task(fetch_for_spot(spot)) for spot in potential_spots]
+
+            try:
+                # 天気予報の取得が終わったスポットから順に処理
+                for weather_task in asyncio.as_completed(weather_tasks):
+                    row, weather_df = await weather_task
+
+                    # 軌道計算はCPUバウンドなので，イベントループを止めないよう別スレッドで実行
+                    events_for_the_spot = await asyncio.to_thread(
+                        get_events_for_the_coord,
+                        location_name=row.name,
+                        lat=row.lat,
+                        lon=row.lon,
+                        elevation_m=row.elevation_m,
+                        horizon_profile=row.horizon_profile,
+                        horizon_octant_min=row.horizon_octant_min,
+                        sky_glow_score=row.sky_glow_score,
+                        sat_service=sat_service,
+                        weather_df=weather_df
+                    )
+                    if not events_for_the_spot:
+                        continue
+
+                    for event in events_for_the_spot:
+                        top_events.push(event) # 同点の場合は先に到着した方を優先
+
+                    yield _format_frame({
+                        'type': 'spot',
+                        'location_name': row.name,
+                        'lat': row.lat,
+                        'lon': row.lon,
+                        'events': [event.model_dump() for event in events_for_the_spot]
+                    }, stream_format)
+            finally:
+                # クライアントの切断や例外で抜けた場合，残りの天気予報の取得を（閉じたクライアントで続けないよう）取り消す．
+                for weather_task in weather_tasks:
+                    weather_task.cancel()
+                await asyncio.gather(*weather_tasks, return_exceptions=True)
+
+        # visibilityが高い順にソート
+        sorted_events = top_events.sorted_events()
+        yield _format_frame({
+            'type': 'summary',
+            'total': top_events.total,
+            'events': [event.model_dump() for event in sorted_events[offset:offset+limit]]
+        }, stream_format)
+
+    media_type = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    return StreamingResponse(frame_generator(), media_type=media_type)
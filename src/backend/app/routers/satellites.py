@@ -0,0 +1,22 @@
+# app/routers/satellites.py
+from fastapi import APIRouter, Depends, Query
+from app.schemas import satellite as schemas_satellite
+from app.services.sat_service import SatDataService, get_sat_data_service
+
+router = APIRouter()
+@router.get("/api/v1/satellites/launch-groups", response_model=schemas_satellite.LaunchGroupStatsResponse)
+def get_launch_group_stats(
+        potential_trains_only: bool = Query(False),
+        sat_service: SatDataService = Depends(get_sat_data_service)):
+    """
+    TLEの読み込み時に計算された，打ち上げグループごとの統計量とトレイン候補の判定結果を返す．
+    """
+    launch_groups = []
+    for group_name, stats in sorted(sat_service.get_launch_group_stats().items()):
+        if potential_trains_only and not stats['is_potential_train']:
+            continue
+        launch_groups.append(
+            schemas_satellite.LaunchGroupStats(launch_group=group_name, **stats)
+        )
+
+    return {'total': len(launch_groups), 'launch_groups': launch_groups}
@@ -0,0 +1,44 @@
+# app/routers/sky_glow.py
+from fastapi import APIRouter, Depends, Header, HTTPException, Path
+from fastapi.responses import Response
+import rasterio
+from app.core.config import Settings, get_settings
+from app.services.tile_service import TileCache, get_tile_cache, render_sky_glow_tile
+
+router = APIRouter()
+@router.get(
+    "/api/v1/sky-glow/tiles/{z}/{x}/{y}.png",
+    responses={200: {"content": {"image/png": {}}}, 304: {}}
+)
+def get_sky_glow_tile(
+        z: int = Path(..., ge=0, le=22),
+        x: int = Path(..., ge=0),
+        y: int = Path(..., ge=0),
+        if_none_match: str | None = Header(None),
+        settings: Settings = Depends(get_settings),
+        tile_cache: TileCache = Depends(get_tile_cache)):
+    """
+    事前計算された光害スコアのGeoTIFF（scripts/build_sky_glow_score_tiff.py）を着色した，地図に重ねるためのPNGタイルを返す．
+    """
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=400, detail="タイル座標がズームレベルの範囲外です．")
+
+    cache_key = ('sky_glow', z, x, y)
+    cached = tile_cache.get(cache_key)
+    if cached:
+        content, etag = cached
+    else:
+        try:
+            content = render_sky_glow_tile(path_sky_glow_score_tiff=settings.PATH_SKY_GLOW_SCORE_TIFF, z=z, x=x, y=y)
+        except rasterio.errors.RasterioIOError:
+            raise HTTPException(status_code=404, detail="光害スコアのGeoTIFFが見つかりません．")
+        etag = tile_cache.put(cache_key, content)
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.SPOT_TILE_CACHE_MAX_AGE_S}",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=content, media_type="image/png", headers=headers)
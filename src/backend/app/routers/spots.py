@@ -0,0 +1,72 @@
+# app/routers/spots.py
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, Query
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import Settings, get_settings
+from app.crud import spot as crud_spot
+from app.db import session
+from app.schemas import spot as schemas_spot
+from app.services.tile_service import TileCache, get_tile_cache
+
+MEDIA_TYPES = {
+    'mvt': "application/vnd.mapbox-vector-tile",
+    'json': "application/json",
+}
+
+router = APIRouter()
+@router.get(
+    "/api/v1/spots/tiles/{z}/{x}/{y}",
+    responses={200: {"content": {MEDIA_TYPES['mvt']: {}, MEDIA_TYPES['json']: {}}}, 304: {}}
+)
+async def get_spot_tile(
+        z: int = Path(..., ge=0, le=22),
+        x: int = Path(..., ge=0),
+        y: int = Path(..., ge=0),
+        tile_format: str = Query('mvt', alias='format', pattern='^(mvt|json)$'),
+        if_none_match: str | None = Header(None),
+        db: AsyncSession = Depends(session.get_async_db),
+        settings: Settings = Depends(get_settings),
+        tile_cache: TileCache = Depends(get_tile_cache)):
+    """
+    XYZタイルの範囲にあるスポットと，事前計算された静的スコアを返す．
+    format=mvtの場合はMapbox Vector Tile（レイヤー名：spots），format=jsonの場合はカラム形式のJSON．
+    ズームレベルがSPOT_TILE_CLUSTER_MAX_ZOOM以下の場合は，格子ごとにクラスタリングしたものを返す．
+    """
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=400, detail="タイル座標がズームレベルの範囲外です．")
+
+    cache_key = (z, x, y, tile_format)
+    cached = tile_cache.get(cache_key)
+    if cached:
+        content, etag = cached
+    else:
+        tile_kwargs = dict(
+            db=db, z=z, x=x, y=y,
+            cluster_max_zoom=settings.SPOT_TILE_CLUSTER_MAX_ZOOM,
+            cluster_cells=settings.SPOT_TILE_CLUSTER_CELLS
+        )
+        if tile_format == 'mvt':
+            content = await crud_spot.get_spot_tile_mvt_async(**tile_kwargs)
+        else:
+            rows = await crud_spot.get_spot_tile_rows_async(**tile_kwargs)
+            content = schemas_spot.SpotTileColumnarResponse(
+                z=z, x=x, y=y,
+                is_clustered=z <= settings.SPOT_TILE_CLUSTER_MAX_ZOOM,
+                names=[row.name for row in rows],
+                lat=[round(row.lat, 6) for row in rows],
+                lon=[round(row.lon, 6) for row in rows],
+                static_score=[row.static_score for row in rows],
+                sky_glow_score=[row.sky_glow_score for row in rows],
+                topography_score=[row.topography_score for row in rows],
+                count=[row.count for row in rows]
+            ).model_dump_json().encode('utf-8')
+        etag = tile_cache.put(cache_key, content)
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.SPOT_TILE_CACHE_MAX_AGE_S}",
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=content, media_type=MEDIA_TYPES[tile_format], headers=headers)
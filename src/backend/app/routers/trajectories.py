@@ -1,15 +1,15 @@
 # app/routers/trajectories.py
 from fastapi import APIRouter, Depends, HTTPException, Query
-from datetime import datetime, timezone
+from datetime import datetime
 from skyfield.api import Topos
 import numpy as np
 from app.core.config import Settings, get_settings
-from app.schemas.trajectory import Position, Trajectory, TrajectoryResponse
+from app.schemas.trajectory import Position, Trajectory, TrajectoryResponse, TrajectoryColumnarResponse
 from app.services.dem_service import get_elevations_by_coords
-from app.services.sat_service import SatDataService, get_sat_data_service
+from app.services.sat_service import SatDataService, get_sat_data_service, calc_altaz_batch, calc_adaptive_sample_times
 
 router = APIRouter()
-@router.get("/api/v1/trajectories", response_model=TrajectoryResponse)
+@router.get("/api/v1/trajectories", response_model=TrajectoryResponse | TrajectoryColumnarResponse)
 def get_trajectory_details(
         location_name: str = Query(...),
         start_time: datetime = Query(...),
@@ -17,75 +17,78 @@ def get_trajectory_details(
         lat: float = Query(...),
         lon: float = Query(...),
         international_designators: list[str] = Query(..., description="...&international_designators=25225A&international_designators=25212A..."),
+        max_points: int = Query(30, ge=2, le=1000, description="時刻列の最大点数"),
+        max_step_deg: float | None = Query(None, gt=0, description="隣り合う時刻の間に衛星が移動する角度の目標値（度）"),
+        encoding: str = Query('rows', pattern='^(rows|columnar)$', description="rows：時刻ごとのオブジェクト，columnar：衛星ごとの配列"),
         settings: Settings = Depends(get_settings),
         sat_service: SatDataService = Depends(get_sat_data_service)):
     """
     指定された期間における，指定された衛星群の時系列的な位置を返す．
+    時刻列は衛星の天球上の移動角度が均等になるように作成する．
     """
-    # 国際衛星識別番号で指定されたインスタンスを抽出
+    # 国際衛星識別番号で指定されたインスタンスを抽出（クエリで指定された順序を維持）
+    target_designators = []
     target_instances = []
     intldesg_to_sat = sat_service.get_all_satellites()
     for intldesg in international_designators:
         instance = intldesg_to_sat.get(intldesg, None) # O(1)で高速に検索
         if instance:
+            target_designators.append(intldesg)
             target_instances.append(instance)
     
     if not target_instances:
         raise HTTPException(status_code=404, detail="指定された国際衛星識別番号の衛星が見つかりません．")
 
-    # 開始時刻と終了時刻から時刻列を作成
-    ts = sat_service.get_timescale()
-    t_start = ts.from_datetime(start_time)
-    t_end = ts.from_datetime(end_time)
-    # 地球時（Terrestrial Time）のユリウス日の数値配列に変換してlinspace
-    SAMPLING_COUNT = 30
-    tt_values = np.linspace(t_start.tt, t_end.tt, num=SAMPLING_COUNT, endpoint=True)
-    # skyfield.timelib.Timeの時刻配列
-    t = ts.tt_jd(tt_values)
-
     # Toposの作成
     elevation_m = get_elevations_by_coords(coords=[{'lat': lat, 'lon': lon}],
                                            settings=settings)[0]
     if elevation_m < -1000 or np.isnan(elevation_m):
         print(f"⚠️ 警告: 観測地点 ({lat}, {lon}) の標高が取得できませんでした．")
+        if encoding == 'columnar':
+            return TrajectoryColumnarResponse(location_name=location_name, timestamps=[],
+                                              international_designators=[], az=[], alt=[])
         return TrajectoryResponse(location_name=location_name, trajectories=[])
     
     observer = Topos(latitude_degrees=lat, longitude_degrees=lon, elevation_m=elevation_m)
 
-    # ベクトルを活用したSkyfieldでの計算
-    ## 衛星ごとに全時刻の位置を一括計算して辞書に格納
-    all_positions_by_sat: dict[str, list[dict]] = {}
-    for sat in target_instances:
-        # 時刻配列't'を使ってベクトル計算
-        alt, az, distance = (sat - observer).at(t).altaz()
+    # 開始時刻と終了時刻から，角速度に応じた時刻列を作成
+    ts = sat_service.get_timescale()
+    t = calc_adaptive_sample_times(
+        satellites=target_instances,
+        observer=observer,
+        t_start=ts.from_datetime(start_time),
+        t_end=ts.from_datetime(end_time),
+        ts=ts,
+        max_points=max_points,
+        max_step_deg=max_step_deg
+    )
 
-        positions = [
-            {'az': az.degrees[i], 'alt': alt.degrees[i]} for i in range(SAMPLING_COUNT)
-        ]
-        all_positions_by_sat[sat.model.intldesg] = positions
-    
-    ## スキーマに合わせてデータを再構築
-    trajectories = []
-    for i, t_current in enumerate(t, start=0):
-        positions_at_t = []
+    # 全衛星・全時刻の位置をSGP4で一括計算（形状は (衛星数, 時刻数)）
+    alt_deg, az_deg = calc_altaz_batch(satellites=target_instances, observer=observer, t=t)
 
-        # クエリで指定された順序を維持してループ
-        for intldesg in international_designators:
-            sat_pos_data = all_positions_by_sat.get(intldesg, None)
+    timestamps = [dt.isoformat() for dt in t.utc_datetime()]
 
-            if sat_pos_data:
-                pos_at_i = sat_pos_data[i]
-                posi = Position(
-                    international_designator=intldesg,
-                    az = pos_at_i['az'],
-                    alt = pos_at_i['alt']
-                )
-                positions_at_t.append(posi)
-        
-        trajectory = Trajectory(
-            timestamp=t_current.astimezone(timezone.utc).isoformat(),
-            positions=positions_at_t
+    if encoding == 'columnar':
+        # 小数点以下4桁（約0.36秒角）に丸めてペイロードを削減
+        return TrajectoryColumnarResponse(
+            location_name=location_name,
+            timestamps=timestamps,
+            international_designators=target_designators,
+            az=np.round(az_deg, 4).tolist(),
+            alt=np.round(alt_deg, 4).tolist()
         )
-        trajectories.append(trajectory)
+
+    # 時刻ごとに行を取り出せるよう転置してからPythonのリストに変換
+    alts_by_time = alt_deg.T.tolist()
+    azs_by_time = az_deg.T.tolist()
+
+    ## スキーマに合わせてデータを再構築
+    trajectories = []
+    for timestamp, alts_at_t, azs_at_t in zip(timestamps, alts_by_time, azs_by_time):
+        positions_at_t = [
+            Position(international_designator=intldesg, az=az, alt=alt)
+            for intldesg, az, alt in zip(target_designators, azs_at_t, alts_at_t)
+        ]
+        trajectories.append(Trajectory(timestamp=timestamp, positions=positions_at_t))
 
     return TrajectoryResponse(location_name=location_name, trajectories=trajectories)
@@ -13,3 +13,5 @@ class Location(BaseModel):
 class LocationsResponse(BaseModel):
     total: int
     locations: list[Location]
+    next_cursor: str | None = None # 次のページを取得する際にcursorとして渡す．最後のページの場合はNone．
+    is_total_capped: bool = False # Trueの場合，totalは打ち切られた下限値．
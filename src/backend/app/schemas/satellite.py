@@ -0,0 +1,14 @@
+# app/schemas/satellite.py
+from pydantic import BaseModel
+
+class LaunchGroupStats(BaseModel):
+    launch_group: str
+    launch_year: int
+    num_satellites: int
+    circular_std: float
+    is_potential_train: bool
+    exclusion_reason: str | None # 'ng_list'，'launch_year'，'circular_std'のいずれか．トレイン候補ならNone．
+
+class LaunchGroupStatsResponse(BaseModel):
+    total: int
+    launch_groups: list[LaunchGroupStats]
@@ -0,0 +1,16 @@
+# app/schemas/spot.py
+from pydantic import BaseModel
+
+# 地図タイルの範囲にあるスポットをカラム形式で表すスキーマ．各リストの同じ添字が同じスポット（またはクラスタ）．
+class SpotTileColumnarResponse(BaseModel):
+    z: int
+    x: int
+    y: int
+    is_clustered: bool # Trueの場合，各要素は複数のスポットのクラスタ（名前・スコアは静的スコアが最も高いスポットのもの）．
+    names: list[str]
+    lat: list[float]
+    lon: list[float]
+    static_score: list[float | None]
+    sky_glow_score: list[float | None]
+    topography_score: list[float | None]
+    count: list[int]
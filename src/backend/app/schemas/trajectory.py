@@ -13,3 +13,11 @@ class Trajectory(BaseModel):
 class TrajectoryResponse(BaseModel):
     location_name: str
     trajectories: list[Trajectory]
+
+# 列指向のレスポンス．az・altは [衛星][時刻] の2次元配列で，international_designators・timestampsの順序に対応する．
+class TrajectoryColumnarResponse(BaseModel):
+    location_name: str
+    timestamps: list[str]
+    international_designators: list[str]
+    az: list[list[float]]
+    alt: list[list[float]]
@@ -2,48 +2,113 @@
 import jismesh.utils as ju
 import numpy as np
 import rasterio
+from rasterio.transform import rowcol
+from rasterio.windows import Window
 import pyproj
 import multiprocessing as mp
+import threading
+from collections import OrderedDict
 from app.core.config import Settings
 
+# 開いたままのDEMファイル（スレッドごと．rasterioのデータセットはスレッド間で共有できないため．）
+_thread_local = threading.local()
+
 def get_meshcode_by_coord(lat, lon, n):
     """
     緯度・経度に対応するn次メッシュを返す．
     """
     return ju.to_meshcode(lat, lon, n)
 
-def get_elevations_by_coords(coords: list[dict], settings: Settings) -> np.ndarray:
+def get_gdal_env_options(settings: Settings) -> dict:
     """
-    緯度経度リストに対応するGeoTIFFファイルを見つけて標高値リストを返す．
+    COGのDEMをS3からHTTPのRange要求で読むためのGDALの設定を返す．ローカルのファイルにも無害．
+    """
+    return {
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR', # 隣の.ovrや.aux.xmlを探すLIST要求を送らない．
+        'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif',
+        'GDAL_INGESTED_BYTES_AT_OPEN': 32768, # ヘッダ（IFD）を最初の1回のRange要求で読み切る．
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES', # 隣り合うタイルの要求を1回にまとめる．
+        'GDAL_HTTP_MULTIPLEX': 'YES',
+        'VSI_CACHE': 'TRUE', # 取得したバイト列をファイルごとにメモリにキャッシュ
+        'VSI_CACHE_SIZE': settings.GDAL_VSI_CACHE_SIZE_MB * 1024 * 1024,
+        'GDAL_CACHEMAX': settings.GDAL_CACHEMAX_MB,
+    }
+
+def open_dem_dataset(path_dem: str, max_open: int):
+    """
+    DEMファイルを開いて返す．開いたデータセットはスレッドごとにLRUで保持し，
+    同じファイルを再び読む場合はGDALのブロックキャッシュに残ったタイルを使う．（呼び出し側で閉じないこと．）
+    """
+    datasets: OrderedDict | None = getattr(_thread_local, 'datasets', None)
+    if datasets is None:
+        datasets = _thread_local.datasets = OrderedDict()
+
+    src = datasets.get(path_dem)
+    if src is not None:
+        datasets.move_to_end(path_dem)
+        return src
+
+    src = rasterio.open(path_dem)
+    datasets[path_dem] = src
+    while len(datasets) > max_open:
+        _, evicted = datasets.popitem(last=False)
+        evicted.close()
+    return src
+
+def get_elevations_by_lonlats(lons: np.ndarray, lats: np.ndarray, settings: Settings) -> np.ndarray:
     """
+    経度・緯度の配列に対応するGeoTIFFファイルを見つけて標高値の配列を返す．
+    メッシュコードの順に並べ替えて，1つのファイルに属する座標をまとめて読む．
+    """
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    elevations = np.full(len(lons), np.nan, dtype=float) # 結果を格納する配列
+    if len(lons) == 0:
+        return elevations
+
     # 座標を所属するメッシュコードごとに分類（sampleメソッドの呼び出し回数を減らすため．）
-    coords_by_meshcode = {}
-    for i, coord in enumerate(coords, start=0):
-        meshcode = get_meshcode_by_coord(lat=coord['lat'], lon=coord['lon'], n=3)
-        if meshcode not in coords_by_meshcode:
-            coords_by_meshcode[meshcode] = []
-        # (lon, lat, 元のインデックス)のタプルで保存
-        coords_by_meshcode[meshcode].append((coord['lon'], coord['lat'], i))
-    
+    if len(lons) == 1: # jismeshは要素数1の配列を扱えない（numpy 2で削除されたasscalarを呼ぶ）ため，スカラーで渡す．
+        meshcodes = np.array([get_meshcode_by_coord(lat=lats[0], lon=lons[0], n=3)])
+    else:
+        meshcodes = get_meshcode_by_coord(lat=lats, lon=lons, n=3)
+    order = np.argsort(meshcodes, kind='stable')
+    sorted_meshcodes = meshcodes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_meshcodes[1:] != sorted_meshcodes[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+
     # メッシュごとに標高データを取得
-    elevations = np.full(len(coords), np.nan, dtype=float) # 結果を格納するリスト
-    for meshcode, coords_with_indices in coords_by_meshcode.items():
-        path_dem = settings.get_dem_filepath(tertiary_meshcode=meshcode)
-        if path_dem is None: # TIFFファイルが存在しなければ開く処理に進まない．
-            continue
+    with rasterio.Env(**get_gdal_env_options(settings)):
+        for start, end in zip(starts, ends):
+            path_dem = settings.get_dem_filepath(tertiary_meshcode=sorted_meshcodes[start])
+            if path_dem is None: # TIFFファイルが存在しなければ開く処理に進まない．
+                continue
+
+            src = open_dem_dataset(path_dem, max_open=settings.DEM_DATASET_CACHE_SIZE)
+            # このファイルに属する座標の画素をまとめて取り出し，結果を元のインデックスの位置に格納
+            # （src.sampleで1点ずつ読むより，座標を囲む範囲を1回で読んで配列で引く方が速い．
+            #   範囲外のブロックは読まないため，S3のCOGでも必要な分だけ取得する．）
+            indices = order[start:end]
+            rows, cols = rowcol(src.transform, lons[indices], lats[indices])
+            rows, cols = np.asarray(rows), np.asarray(cols)
+            inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+            if not inside.any():
+                continue
+            indices, rows, cols = indices[inside], rows[inside], cols[inside]
+            row_min, col_min = rows.min(), cols.min()
+            window = Window.from_slices((row_min, rows.max() + 1), (col_min, cols.max() + 1))
+            band = src.read(1, window=window)
+            elevations[indices] = band[rows - row_min, cols - col_min]
 
-        with rasterio.open(path_dem) as src:
-            # このファイルに属する座標だけをまとめてsampleに渡す．
-            coords_to_sample = [(lon, lat) for lon, lat, idx in coords_with_indices]
-            results = list(src.sample(coords_to_sample))
-        
-        # 結果を元のインデックスの位置に格納
-        for i, result in enumerate(results, start=0):
-            original_index = coords_with_indices[i][2]
-            elevations[original_index] = result[0]
-    
     return elevations
 
+def get_elevations_by_coords(coords: list[dict], settings: Settings) -> np.ndarray:
+    """
+    緯度経度リストに対応するGeoTIFFファイルを見つけて標高値リストを返す．
+    """
+    lons = np.array([coord['lon'] for coord in coords], dtype=float)
+    lats = np.array([coord['lat'] for coord in coords], dtype=float)
+    return get_elevations_by_lonlats(lons=lons, lats=lats, settings=settings)
+
 def calc_hidden_height(observer_height: float, target_distance: float) -> float:
     """
     観測者の高さと対象までの距離から，地球の丸みで隠される高さを計算する．
@@ -133,6 +198,79 @@ def calc_max_angle_for_single_azimuth(args):
 
     return max_angle # この方位での最大仰角を返す
 
+def calc_viewing_angles(observer_height: float, target_heights: np.ndarray, distances: np.ndarray) -> np.ndarray:
+    """
+    calc_viewing_angleの配列版．観測者から見た各対象の仰俯角（度）をまとめて計算する．
+    """
+    EARTH_R = 6371000.0 # 地球の半径（m）
+
+    if observer_height < 0:
+        dist_to_horizon = 0.0
+    else:
+        dist_to_horizon = np.sqrt((2 * EARTH_R * observer_height) + (observer_height ** 2))
+
+    # 水平線より手前の対象は地球の丸みで隠されない．
+    dist_horizon_to_target = np.maximum(distances - dist_to_horizon, 0.0)
+    hidden_by_curvature = np.where(
+        distances < dist_to_horizon,
+        0.0,
+        np.sqrt((EARTH_R ** 2) + (dist_horizon_to_target ** 2)) - EARTH_R
+    )
+    height_diff = (target_heights - hidden_by_curvature) - observer_height
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angles = np.degrees(np.arctan(height_diff / distances))
+    return np.where(distances == 0, 90.0, angles) # 距離0は真上
+
+def calc_horizon_profile(
+        settings: Settings,
+        observer_lat: float,
+        observer_lon: float,
+        observer_ground_elev: float | None = None,
+        observer_eye_height: float = 1.55,
+        num_directions: int = 180,
+        max_distance: float = 100000,
+        num_samples: int = 100):
+    """
+    calc_horizon_profile_parallelの1プロセス版．全ての方位のサンプリング点の標高を1回の呼び出しでまとめて取得する．
+    多数の地点を処理するバッチでは，地点ごとにプロセスを分けて呼ぶ（開いたDEMファイルを地点間で使い回せる）．
+
+    Args:
+        observer_ground_elev (float | None): 観測地点の標高（m）．取得済みであれば渡す．
+
+    Returns:
+        (np.ndarray, np.ndarray): 各方位における最大仰角（稜線の仰角），各方位
+    """
+    azimuths = np.linspace(0, 360, num_directions, endpoint=False) # 各方位
+
+    # 観測者の準備
+    if observer_ground_elev is None:
+        observer_ground_elev = get_elevations_by_lonlats(lons=[observer_lon], lats=[observer_lat], settings=settings)[0]
+    if observer_ground_elev < -1000 or np.isnan(observer_ground_elev):
+        print(f"⚠️警告: 観測地点 ({observer_lat}, {observer_lon}) の標高が取得できませんでした．スキップします．")
+        return np.full(num_directions, np.nan), azimuths
+
+    observer_height = observer_ground_elev + observer_eye_height
+    distances = np.geomspace(1, max_distance, num_samples) # 各サンプリング点
+
+    # (方位, 距離)の全ての組み合わせの座標
+    geod = pyproj.Geod(ellps='WGS84')
+    lons, lats, back_azimuth = geod.fwd(
+        np.full(num_directions * num_samples, observer_lon),
+        np.full(num_directions * num_samples, observer_lat),
+        np.repeat(azimuths, num_samples),
+        np.tile(distances, num_directions)
+    )
+    elevations = get_elevations_by_lonlats(lons=lons, lats=lats, settings=settings)
+    elevations[np.isnan(elevations)] = 0.0
+
+    angles = calc_viewing_angles(
+        observer_height=observer_height,
+        target_heights=elevations.reshape(num_directions, num_samples),
+        distances=distances
+    )
+    horizon_profile = np.maximum(angles.max(axis=1), -90.0)
+    return horizon_profile, azimuths
+
 def calc_horizon_profile_parallel(
         settings: Settings,
         observer_lat: float,
@@ -5,71 +5,58 @@ from skyfield.api import Topos, load, EarthSatellite
 from datetime import datetime, timedelta, timezone
 from app.schemas.event import Event, Score
 import pandas as pd
-from app.services.score_service import calc_event_score
+from app.services.score_service import calc_event_score, calc_event_score_upper_bound
 from app.services.sat_service import SatDataService
 import httpx
 import asyncio
+import heapq
 
-def calc_circular_std(rads: list) -> float:
+class TopEvents:
     """
-    角度（ラジアン）の配列から円周標準偏差を計算する．
-
-    Args:
-        rads (list): 角度（ラジアン）の配列
-    Returns:
-        (float): 円周標準偏差
+    visibilityの上位k件の観測イベントだけを保持するヒープ．
+    上位k件に入り得ないイベントは破棄し，総件数のみを数える．
     """
-    # 角度を単位ベクトルに変換
-    x_coords = np.cos(rads)
-    y_coords = np.sin(rads)
-
-    # 重心の座標: (c_bar, s_bar)
-    c_bar = np.mean(x_coords)
-    s_bar = np.mean(y_coords)
-
-    # 平均合成ベクトル長（mean resultant length）: r_bar
-    r_bar = np.sqrt(c_bar**2 + s_bar**2)
-    # 単位円上の点を平均しているため，0 <= r_bar <= 1．対数を取るためにゼロは回避．
-    r_bar = np.clip(r_bar, 1e-12, 1.0)
-
-    # 円周標準偏差
-    circular_std_rad = np.sqrt(-2 * np.log(r_bar))
-    return circular_std_rad
-
-def get_potential_trains(launch_group_to_sats, circular_std_threshold: float = 1.0):
-    # トレイン状態にある可能性が高いグループを特定
-    launch_groups_in_train_form = {}
-
-    for group_name, instances in launch_group_to_sats.items():
-        # 手動フィルタ
-        ng_list = ['21059', '24065'] # 古いグループなのに仲間が脱落していて標準偏差が小さいなど．
-        if group_name in ng_list:
-            continue
-
-        # 打ち上げ年フィルタ
-
-        # TLEの使用は，そもそも1957-2056年に限定されていると推察される．
-        # よって，打ち上げ年の上2桁の補完に57年ルールを適用する．
-        # https://www.space-track.org/documentation#tle
-        launch_year_2_digit = int(group_name[0:2])
-        if launch_year_2_digit >= 57:
-            launch_year_4_digit = 1900 + launch_year_2_digit
-        else:
-            launch_year_4_digit = 2000 + launch_year_2_digit
-        
-        # 今年か去年のみが通過
-        current_year = datetime.now().year
-        if launch_year_4_digit < (current_year - 1):
-            continue
-
-        # グループ内の全衛星から平均近点角（ラジアン）を抽出
-        mean_anomalies_rad = [instance.model.mo for instance in instances]
-        circular_std = calc_circular_std(mean_anomalies_rad)
-
-        if circular_std < circular_std_threshold:
-            launch_groups_in_train_form[group_name] = instances
-
-    return launch_groups_in_train_form
+    def __init__(self, k: int):
+        self.k = k
+        self.total = 0
+        self._heap: list[tuple[float, tuple, Event]] = [] # (visibility, 順序キー, event) の最小ヒープ
+
+    def threshold(self) -> float:
+        """
+        上位k件に入るために必要なvisibilityの下限を返す．k件に満たない間は-inf．
+        """
+        if self.k <= 0:
+            return np.inf
+        if len(self._heap) < self.k:
+            return -np.inf
+        return self._heap[0][0]
+
+    def count(self, num_events: int = 1) -> None:
+        """
+        スコアを計算せずに破棄したイベントを総件数に加える．
+        """
+        self.total += num_events
+
+    def push(self, event: Event, order_key: tuple = ()) -> None:
+        """
+        イベントを追加する．order_keyが小さいほど，同点の場合に上位として扱う．
+        """
+        self.total += 1
+        if self.k <= 0:
+            return
+
+        # order_keyを符号反転し，同点の場合は先に処理されたイベント（order_keyが小さい方）が残るようにする．
+        entry = (event.scores.visibility, tuple(-key for key in order_key) or (-self.total,), event)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def sorted_events(self) -> list[Event]:
+        """
+        保持しているイベントをvisibilityが高い順に返す．
+        """
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
 
 def get_iss_as_a_group_member(intldesg_to_sat, iss_intldesgs: list[str] = ['98067A', '21066A']):
     for intldesg in iss_intldesgs:
@@ -184,12 +171,19 @@ def get_events_for_the_coord(
         lat: float,
         lon: float,
         elevation_m: float,
-        horizon_profile: list[float],
+        horizon_profile: bytes, # horizon_service.encode_horizon_profileの形式
         sky_glow_score: float,
         sat_service: SatDataService,
-        weather_df: pd.DataFrame) -> list[Event]:
+        weather_df: pd.DataFrame,
+        top_events: TopEvents | None = None,
+        spot_index: int = 0,
+        horizon_octant_min: bytes | None = None) -> list[Event]:
     """
     単一の座標に対して，観測可能なイベントのリストを取得する．
+
+    top_eventsが渡された場合は，スコアの上界がtop_eventsの下限に届かないイベントのスコア計算を省略して件数のみを数え，
+    残りのイベントをtop_eventsに追加する．spot_indexは同点の場合の順序付けに使う．
+    horizon_octant_min（スポットの稜線プロファイルの区画ごとの最小仰角）は，稜線に隠れるパスの事前判定に使う．
     """
     # 静的スコアが欠損している場合はスキップする．
     if not elevation_m or not horizon_profile or not sky_glow_score:
@@ -201,7 +195,7 @@ def get_events_for_the_coord(
     
     # 計算対象にする衛星の国際衛星識別符号を特定
     launch_group_to_sats = {}
-    launch_group_to_sats.update(get_potential_trains(launch_group_to_sats=sat_service.get_launch_groups()))
+    launch_group_to_sats.update(sat_service.get_potential_trains()) # TLEの読み込み時に計算済み
     launch_group_to_sats.update(get_iss_as_a_group_member(intldesg_to_sat=sat_service.get_all_satellites()))
 
     # 時刻・検索期間設定
@@ -215,7 +209,11 @@ def get_events_for_the_coord(
     # 天体暦設定
     eph = load('de421.bsp')
 
+    # スポットの光害スコアはイベントのスコアの上界．下限に届かなければ，全イベントのスコア計算を省略して件数のみを数える．
+    is_pruned_spot = top_events is not None and sky_glow_score < top_events.threshold()
+
     events = []
+    pass_index = 0
     for group_name, instances in launch_group_to_sats.items():
         repre_sat = instances[0] # 処理の軽量化のため代表衛星を適当に定義
 
@@ -224,8 +222,22 @@ def get_events_for_the_coord(
         # 天文学的条件でフィルタ
         visible_passes = filter_visible_events(pass_events=raw_passes, satellite=repre_sat,
                                                spot_pos=spot_pos, eph=eph, ts=ts)
+
+        if is_pruned_spot:
+            top_events.count(len(visible_passes))
+            continue
         
         for pass_event in visible_passes:
+            pass_index += 1
+
+            # 上位に入り得ないイベントは，重いスコア計算（可視時間割合・月相）を省略
+            if top_events is not None:
+                upper_bound = calc_event_score_upper_bound(pass_event=pass_event, sky_glow_score=sky_glow_score,
+                                                           weather_df=weather_df)
+                if upper_bound < top_events.threshold():
+                    top_events.count()
+                    continue
+
             scores: Score = calc_event_score(
                 pass_event=pass_event,
                 satellite=repre_sat,
@@ -234,7 +246,8 @@ def get_events_for_the_coord(
                 sky_glow_score=sky_glow_score,
                 ts=ts,
                 eph=eph,
-                weather_df=weather_df
+                weather_df=weather_df,
+                horizon_octant_min=horizon_octant_min
             )
 
             if 'STARLINK' in repre_sat.name:
@@ -256,5 +269,7 @@ def get_events_for_the_coord(
             )
 
             events.append(event)
+            if top_events is not None:
+                top_events.push(event, order_key=(spot_index, pass_index))
 
     return events
@@ -0,0 +1,102 @@
+# app/services/horizon_service.py
+import numpy as np
+
+# 稜線プロファイルの保存形式：仰角を0.01度単位に量子化した符号付き16bit整数（ビッグエンディアン）のバイト列．
+# PostgreSQLのint2send・get_byteと同じバイト順なので，SQL側でもそのまま読み書きできる．
+HORIZON_PROFILE_SCALE = 100 # 1度あたりの値
+HORIZON_PROFILE_DTYPE = np.dtype('>i2')
+
+def encode_horizon_profile(horizon_profile) -> bytes | None:
+    """
+    稜線プロファイル（度）をバイト列に変換する．NaNを含む（取得できなかった）場合はNoneを返す．
+    """
+    if horizon_profile is None:
+        return None
+    degrees = np.asarray(horizon_profile, dtype=float)
+    if np.isnan(degrees).any():
+        return None
+    info = np.iinfo(HORIZON_PROFILE_DTYPE)
+    # 0.5は0から遠い方に丸める（マイグレーションで使うPostgreSQLのround(numeric)と同じ）．
+    scaled = degrees * HORIZON_PROFILE_SCALE
+    centi_degrees = np.clip(np.trunc(scaled + np.copysign(0.5, scaled)), info.min, info.max)
+    return centi_degrees.astype(HORIZON_PROFILE_DTYPE).tobytes()
+
+def decode_horizon_profile(data: bytes | memoryview) -> np.ndarray:
+    """
+    バイト列を，コピーせずに0.01度単位の整数の配列として読む．（度に直す場合はHORIZON_PROFILE_SCALEで割る．）
+    """
+    return np.frombuffer(data, dtype=HORIZON_PROFILE_DTYPE)
+
+def stack_horizon_profiles(encoded_profiles: list, num_directions: int) -> np.ndarray:
+    """
+    バイト列のリストを(地点数, 方位数)の0.01度単位の配列にまとめる．（NPYで受け渡す場合に使う．）
+    稜線プロファイルの無い地点の行は，int16の最小値で埋める．
+    """
+    profiles = np.full((len(encoded_profiles), num_directions), np.iinfo(HORIZON_PROFILE_DTYPE).min,
+                       dtype=HORIZON_PROFILE_DTYPE)
+    for i, data in enumerate(encoded_profiles):
+        if data is not None:
+            profiles[i] = decode_horizon_profile(data)
+    return profiles
+
+# 稜線プロファイルの要約（spotsテーブルのカラム）．全方位を見なくても，SQLでの順位付けやイベントの判定に使える．
+OPEN_SKY_THRESHOLDS_DEG = (0, 3, 5, 10) # 稜線の仰角がこの値以下の方位の割合を，open_sky_fraction_{値}に保存
+NUM_OCTANTS = 8 # 方位を45度ずつに分けた区画の数
+HORIZON_SUMMARY_COLUMNS = [f'open_sky_fraction_{threshold}' for threshold in OPEN_SKY_THRESHOLDS_DEG] + [
+    'max_ridge_angle', 'horizon_octant_max', 'horizon_octant_min'
+]
+
+def get_octant_indices(num_directions: int) -> np.ndarray:
+    """
+    稜線プロファイルの各要素（方位）が属する区画（0：北〜北東，1：北東〜東，...）を返す．
+    """
+    return np.arange(num_directions) * NUM_OCTANTS // num_directions
+
+def get_spanned_octants(azimuths_deg, num_directions: int, max_arc_deg: float = 135.0) -> list[int] | None:
+    """
+    方位角の列（度）を順に短い弧で結んだときに通る区画の番号を返す．
+    方位角を稜線プロファイルの要素の番号に変換してから，get_octant_indicesと同じ式で区画を求める．
+    1つの弧がmax_arc_degを超える場合は，どちら回りか決めきれないためNoneを返す．
+    """
+    indices = np.floor((np.asarray(azimuths_deg) / 360.0) * num_directions).astype(int)
+    indices = np.clip(indices, 0, num_directions - 1)
+    octants = indices * NUM_OCTANTS // num_directions
+
+    spanned = {int(octants[0])}
+    for start, end, start_octant, end_octant in zip(indices[:-1], indices[1:], octants[:-1], octants[1:]):
+        forward = (end - start) % num_directions
+        step = 1 if forward * 2 <= num_directions else -1 # 短い方の向き
+        arc = forward if step == 1 else num_directions - forward
+        if arc * 360.0 / num_directions > max_arc_deg:
+            return None
+        octant = start_octant
+        while octant != end_octant:
+            octant = (octant + step) % NUM_OCTANTS
+            spanned.add(int(octant))
+    return sorted(spanned)
+
+def summarize_horizon_profile(data: bytes | None) -> dict:
+    """
+    稜線プロファイル（保存形式のバイト列）から要約の値を計算する．
+
+    Returns:
+        (dict): open_sky_fraction_{閾値}（0-1），max_ridge_angle（度），
+                horizon_octant_max・horizon_octant_min（区画ごとの最大・最小仰角．稜線プロファイルと同じ保存形式のバイト列）
+    """
+    summary = dict.fromkeys(HORIZON_SUMMARY_COLUMNS)
+    if not data:
+        return summary
+
+    centi_degrees = decode_horizon_profile(data)
+    for threshold in OPEN_SKY_THRESHOLDS_DEG:
+        summary[f'open_sky_fraction_{threshold}'] = float(np.mean(centi_degrees <= threshold * HORIZON_PROFILE_SCALE))
+    summary['max_ridge_angle'] = float(centi_degrees.max()) / HORIZON_PROFILE_SCALE
+
+    octant_max = np.full(NUM_OCTANTS, np.iinfo(HORIZON_PROFILE_DTYPE).min, dtype=HORIZON_PROFILE_DTYPE)
+    np.maximum.at(octant_max, get_octant_indices(len(centi_degrees)), centi_degrees)
+    summary['horizon_octant_max'] = octant_max.tobytes()
+
+    octant_min = np.full(NUM_OCTANTS, np.iinfo(HORIZON_PROFILE_DTYPE).max, dtype=HORIZON_PROFILE_DTYPE)
+    np.minimum.at(octant_min, get_octant_indices(len(centi_degrees)), centi_degrees)
+    summary['horizon_octant_min'] = octant_min.tobytes()
+    return summary
@@ -1,40 +1,268 @@
 # app/services/sat_service.py
-from skyfield.api import load, EarthSatellite, Timescale
+from skyfield.api import load, EarthSatellite, Timescale, Topos
+from skyfield.constants import AU_KM, DAY_S
+from skyfield.sgp4lib import TEME
+from skyfield.timelib import Time, julian_day
+from sgp4.api import SatrecArray
+from datetime import datetime
+import numpy as np
 from app.core.config import get_settings
 import re
 
+# 手動フィルタ：古いグループなのに仲間が脱落していて標準偏差が小さいなど．
+NG_LAUNCH_GROUPS = ['21059', '24065']
+
+def calc_circular_std(rads: list) -> float:
+    """
+    角度（ラジアン）の配列から円周標準偏差を計算する．
+
+    Args:
+        rads (list): 角度（ラジアン）の配列
+    Returns:
+        (float): 円周標準偏差
+    """
+    # 角度を単位ベクトルに変換
+    x_coords = np.cos(rads)
+    y_coords = np.sin(rads)
+
+    # 重心の座標: (c_bar, s_bar)
+    c_bar = np.mean(x_coords)
+    s_bar = np.mean(y_coords)
+
+    # 平均合成ベクトル長（mean resultant length）: r_bar
+    r_bar = np.sqrt(c_bar**2 + s_bar**2)
+    # 単位円上の点を平均しているため，0 <= r_bar <= 1．対数を取るためにゼロは回避．
+    r_bar = np.clip(r_bar, 1e-12, 1.0)
+
+    # 円周標準偏差
+    circular_std_rad = np.sqrt(-2 * np.log(r_bar))
+    return circular_std_rad
+
+def get_launch_year(launch_group: str) -> int:
+    """
+    打ち上げグループ名（国際衛星識別符号の数字部分）から打ち上げ年（4桁）を返す．
+    """
+    # TLEの使用は，そもそも1957-2056年に限定されていると推察される．
+    # よって，打ち上げ年の上2桁の補完に57年ルールを適用する．
+    # https://www.space-track.org/documentation#tle
+    launch_year_2_digit = int(launch_group[0:2])
+    if launch_year_2_digit >= 57:
+        return 1900 + launch_year_2_digit
+    else:
+        return 2000 + launch_year_2_digit
+
+def calc_launch_group_stats(
+        launch_group_to_sats: dict[str, list[EarthSatellite]],
+        current_year: int,
+        circular_std_threshold: float = 1.0) -> dict[str, dict]:
+    """
+    打ち上げグループごとの統計量と，トレイン状態にある可能性が高いかの判定結果を計算する．
+
+    Returns:
+        (dict): {launch_group: {launch_year, num_satellites, circular_std, is_potential_train, exclusion_reason}}
+    """
+    launch_group_stats = {}
+
+    for group_name, instances in launch_group_to_sats.items():
+        launch_year = get_launch_year(group_name)
+
+        # グループ内の全衛星から平均近点角（ラジアン）を抽出
+        mean_anomalies_rad = [instance.model.mo for instance in instances]
+        circular_std = float(calc_circular_std(mean_anomalies_rad))
+
+        # 手動フィルタ -> 打ち上げ年フィルタ（今年か去年のみが通過） -> 円周標準偏差フィルタ
+        if group_name in NG_LAUNCH_GROUPS:
+            exclusion_reason = 'ng_list'
+        elif launch_year < (current_year - 1):
+            exclusion_reason = 'launch_year'
+        elif not circular_std < circular_std_threshold:
+            exclusion_reason = 'circular_std'
+        else:
+            exclusion_reason = None
+
+        launch_group_stats[group_name] = {
+            'launch_year': launch_year,
+            'num_satellites': len(instances),
+            'circular_std': circular_std,
+            'is_potential_train': exclusion_reason is None,
+            'exclusion_reason': exclusion_reason
+        }
+
+    return launch_group_stats
+
+def calc_altaz_batch(satellites: list[EarthSatellite], observer: Topos, t: Time) -> tuple[np.ndarray, np.ndarray]:
+    """
+    複数の衛星について，時刻配列における観測者から見た仰角・方位角をまとめて計算する．
+    (satellite - observer).at(t).altaz() を衛星ごとに呼ぶのと同じ結果を，SGP4の一括伝播（SatrecArray）で求める．
+
+    Args:
+        satellites (list[EarthSatellite]): 衛星インスタンスのリスト
+        observer (Topos): 観測地点
+        t (Time): skyfield.timelib.Timeの時刻配列
+
+    Returns:
+        (np.ndarray, np.ndarray): 仰角（度）・方位角（度）の配列．形状はいずれも (衛星数, 時刻数)．
+                                  SGP4の伝播に失敗した（軌道が減衰したなど）衛星・時刻はNaN（不可視として扱う）．
+    """
+    # TLEのエポックはUTC基準なので，UTCのユリウス日を整数部と小数部に分けてSGP4に渡す．
+    # EarthSatellite._position_and_velocity_TEME_km の whole, tai_fraction - 閏秒 / DAY_S と同じ値を，
+    # Skyfieldの非公開メソッドを使わずにUTCの暦から求める．（閏秒の1秒間だけは，次の日の0時として扱う．）
+    year, month, day, hour, minute, second = t.utc
+    jd = julian_day(year.astype(int), month.astype(int), day.astype(int)) - 0.5
+    fraction = (hour * 3600.0 + minute * 60.0 + second) / DAY_S
+
+    # 全衛星・全時刻をSGP4で一括伝播．r の形状は (衛星数, 時刻数, 3)，TEME座標系（km）．
+    satrec_array = SatrecArray([sat.model for sat in satellites])
+    errors, r_teme_km, _ = satrec_array.sgp4(jd, fraction)
+    r_teme_au = r_teme_km / AU_KM
+    is_failed = errors != 0 # 形状は (衛星数, 時刻数)
+
+    # 回転行列の形状はいずれも (3, 3, 時刻数)．
+    R_gcrs_to_teme = TEME.rotation_at(t)
+    R_gcrs_to_altaz = observer.rotation_at(t)
+    # TEME -> GCRS -> 観測者の地平座標系 を1つの回転にまとめる．
+    R_teme_to_altaz = np.einsum('ijt,kjt->ikt', R_gcrs_to_altaz, R_gcrs_to_teme)
+
+    # 地平座標系における衛星と観測者の位置ベクトル（形状は (衛星数, 3, 時刻数)）
+    sat_xyz = np.einsum('ikt,stk->sit', R_teme_to_altaz, r_teme_au)
+    observer_xyz = np.einsum('ijt,jt->it', R_gcrs_to_altaz, observer.at(t).position.au)
+    x, y, z = np.moveaxis(sat_xyz - observer_xyz[np.newaxis], 1, 0)
+
+    alt_deg = np.degrees(np.arctan2(z, np.sqrt(x**2 + y**2)))
+    az_deg = np.degrees(np.arctan2(y, x) % (2 * np.pi))
+
+    # 伝播に失敗した位置は，SGP4が返す値に頼らず明示的にNaNにする．
+    alt_deg[is_failed] = np.nan
+    az_deg[is_failed] = np.nan
+
+    return alt_deg, az_deg
+
+def calc_angular_separation_deg(alt1_deg: np.ndarray, az1_deg: np.ndarray,
+                                alt2_deg: np.ndarray, az2_deg: np.ndarray) -> np.ndarray:
+    """
+    地平座標で表された2つの方向の間の角距離（度）を計算する．
+    """
+    alt1, az1, alt2, az2 = map(np.radians, (alt1_deg, az1_deg, alt2_deg, az2_deg))
+    cos_sep = (np.sin(alt1) * np.sin(alt2)) + (np.cos(alt1) * np.cos(alt2) * np.cos(az1 - az2))
+    return np.degrees(np.arccos(np.clip(cos_sep, -1.0, 1.0)))
+
+def calc_adaptive_sample_times(
+        satellites: list[EarthSatellite],
+        observer: Topos,
+        t_start: Time,
+        t_end: Time,
+        ts: Timescale,
+        max_points: int = 30,
+        max_step_deg: float | None = None,
+        probe_count: int = 300) -> Time:
+    """
+    天球上の移動角度が均等になるように時刻列を作成する．
+    角速度の大きい南中付近ほど時刻の間隔が密になる．
+
+    Args:
+        satellites (list[EarthSatellite]): 衛星インスタンスのリスト
+        observer (Topos): 観測地点
+        t_start (Time): 開始時刻
+        t_end (Time): 終了時刻
+        ts (Timescale): Timescaleインスタンス
+        max_points (int): 時刻列の最大点数
+        max_step_deg (float | None): 隣り合う時刻の間に衛星が移動する角度の目標値（度）．Noneの場合はmax_pointsの点数で作成．
+        probe_count (int): 角速度を見積もるための下調べの点数
+
+    Returns:
+        (Time): skyfield.timelib.Timeの時刻配列
+    """
+    # 細かい時刻列で下調べし，各区間で衛星が移動する角度（全衛星の最大値）を求める．
+    probe_count = max(probe_count, 4 * max_points)
+    probe_tt = np.linspace(t_start.tt, t_end.tt, num=probe_count, endpoint=True)
+    alt_deg, az_deg = calc_altaz_batch(satellites=satellites, observer=observer, t=ts.tt_jd(probe_tt))
+    step_deg = calc_angular_separation_deg(alt_deg[:, :-1], az_deg[:, :-1], alt_deg[:, 1:], az_deg[:, 1:])
+    step_deg = np.nan_to_num(step_deg).max(axis=0)
+
+    # 累積移動角度．静止区間でも単調増加となるよう，時間に比例する微小な重みを加える．
+    total_deg = step_deg.sum()
+    step_weight = step_deg + (max(total_deg, 1.0) * 1e-6 / len(step_deg))
+    cumulative = np.concatenate([[0.0], np.cumsum(step_weight)])
+
+    if max_step_deg:
+        num_points = int(np.ceil(total_deg / max_step_deg)) + 1
+        num_points = int(np.clip(num_points, 2, max_points))
+    else:
+        num_points = max_points
+
+    # 累積移動角度を等分する時刻を線形補間で求める．
+    targets = np.linspace(0.0, cumulative[-1], num=num_points, endpoint=True)
+    tt_values = np.interp(targets, cumulative, probe_tt)
+
+    return ts.tt_jd(tt_values)
+
 class SatDataService:
     """
     TLEデータをロードし，衛星インスタンスをキャッシュするサービス．
     アプリ起動時に一度だけ初期化されることを想定．
     """
     def __init__(self, tle_starlink_url: str, tle_stations_url: str, ts: Timescale):
+        self.tle_starlink_url = tle_starlink_url
+        self.tle_stations_url = tle_stations_url
+        self.ts = ts
+
+        self.load_catalog()
+
+    def load_catalog(self, reload: bool = False) -> None:
+        """
+        TLEファイルを読み込み，衛星インスタンスとトレイン候補のキャッシュを（再）構築する．
+
+        Args:
+            reload (bool): Trueの場合，ダウンロード済みのTLEファイルがあっても最新版を取得し直す．
+        """
         print("SatDataService: TLEファイルの読み込みを開始...")
 
-        starlink_sats = load.tle(tle_starlink_url)
-        station_sats = load.tle(tle_stations_url)
+        starlink_sats = load.tle(self.tle_starlink_url, reload=reload)
+        station_sats = load.tle(self.tle_stations_url, reload=reload)
 
         all_sats = list(starlink_sats.values()) + list(station_sats.values())
 
         # 国際衛星識別番号をキーにした辞書に変換
-        self._intldesg_to_sat: dict[str, EarthSatellite] = {}
+        intldesg_to_sat: dict[str, EarthSatellite] = {}
 
         for sat in all_sats:
             if sat.model.intldesg:
-                self._intldesg_to_sat[sat.model.intldesg] = sat
+                intldesg_to_sat[sat.model.intldesg] = sat
         
         # 打ち上げグループをキーにした辞書もキャッシュ
-        self._launch_group_to_sats: dict[str, list[EarthSatellite]] = {}
+        launch_group_to_sats: dict[str, list[EarthSatellite]] = {}
 
-        for instance in self._intldesg_to_sat.values():
+        for instance in intldesg_to_sat.values():
             intldesg = instance.model.intldesg
             launch_group = re.search(r'\d+', intldesg).group()
-            self._launch_group_to_sats.setdefault(launch_group, []) # キーが存在しない時のみ空のリストをセット
-            self._launch_group_to_sats[launch_group].append(instance)
-        
+            launch_group_to_sats.setdefault(launch_group, []) # キーが存在しない時のみ空のリストをセット
+            launch_group_to_sats[launch_group].append(instance)
+
+        # リクエスト処理中のスレッドが中途半端な状態を参照しないよう，構築し終えてから差し替える．
+        self._intldesg_to_sat = intldesg_to_sat
+        self._launch_group_to_sats = launch_group_to_sats
+        self._refresh_potential_trains()
+
         print(f"SatDataService: {len(self._intldesg_to_sat)}機の衛星をキャッシュ完了．")
-    
-        self.ts = ts
+        print(f"SatDataService: {len(self._potential_trains)}個のトレイン候補グループを特定．")
+
+    def _refresh_potential_trains(self) -> None:
+        """
+        打ち上げグループの統計量とトレイン候補を計算してキャッシュする．
+        結果はTLEカタログと現在の年のみに依存するため，それらが変わった時だけ再計算すれば良い．
+        """
+        current_year = datetime.now().year
+        launch_group_stats = calc_launch_group_stats(
+            launch_group_to_sats=self._launch_group_to_sats,
+            current_year=current_year
+        )
+
+        self._potential_trains = {
+            group_name: self._launch_group_to_sats[group_name]
+            for group_name, stats in launch_group_stats.items() if stats['is_potential_train']
+        }
+        self._launch_group_stats = launch_group_stats
+        self._stats_year = current_year
 
     def get_all_satellites(self) -> dict[str, EarthSatellite]:
         """
@@ -47,6 +275,23 @@ class SatDataService:
         キャッシュされた打ち上げグループの辞書 {launch_group: instances} を返す．
         """
         return self._launch_group_to_sats
+
+    def get_potential_trains(self) -> dict[str, list[EarthSatellite]]:
+        """
+        キャッシュされたトレイン状態にある可能性が高いグループの辞書 {launch_group: instances} を返す．
+        """
+        # 年を跨いだ場合は打ち上げ年フィルタの結果が変わるため再計算
+        if datetime.now().year != self._stats_year:
+            self._refresh_potential_trains()
+        return self._potential_trains
+
+    def get_launch_group_stats(self) -> dict[str, dict]:
+        """
+        キャッシュされた打ち上げグループごとの統計量の辞書 {launch_group: stats} を返す．
+        """
+        if datetime.now().year != self._stats_year:
+            self._refresh_potential_trains()
+        return self._launch_group_stats
     
     def get_timescale(self) -> Timescale:
         """
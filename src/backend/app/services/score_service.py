@@ -6,17 +6,57 @@ import pandas as pd
 import rasterio
 from app.core.config import Settings
 from app.schemas.event import Score
+from app.services.sky_glow_service import get_sky_glow_raster, get_sky_glow_score_raster, build_sky_glow_lut
+from app.services.horizon_service import decode_horizon_profile, get_spanned_octants, HORIZON_PROFILE_SCALE
+
+# find_eventsの南中時刻には1秒程度の誤差があり，真の最大高度は南中時刻の高度より少し高い場合がある．
+PEAK_ALTITUDE_MARGIN_DEG = 0.1
+
+def is_pass_hidden_by_octants(
+        pass_event: dict,
+        satellite: EarthSatellite,
+        spot_pos: Topos,
+        horizon_octant_min: bytes,
+        num_directions: int,
+        ts: Timescale) -> bool:
+    """
+    出・南中・没の3時刻の高度・方位角と区画ごとの最小仰角から，パス全体で衛星が稜線に隠れているかを判定する．
+    南中高度が，出→南中→没の方位角が通る全ての区画の最小仰角以下であれば，どの時刻でも衛星はその方位の稜線以下にある．
+    （衛星の方位角は出→南中・南中→没のそれぞれで短い弧を単調に動くとみなす．）
+    Trueの場合のみ確実に隠れている．Falseの場合は稜線プロファイルでの判定が必要．
+    """
+    t = ts.tt_jd([pass_event['rise_time'].tt, pass_event['peak_time'].tt, pass_event['set_time'].tt])
+    alt, az, _ = (satellite - spot_pos).at(t).altaz()
+
+    octants = get_spanned_octants(az.degrees, num_directions)
+    if octants is None:
+        return False
+    min_ridge_centi_deg = decode_horizon_profile(horizon_octant_min)[octants].min()
+    return (alt.degrees[1] + PEAK_ALTITUDE_MARGIN_DEG) * HORIZON_PROFILE_SCALE <= min_ridge_centi_deg
 
 def calc_visible_time_ratio(
         pass_event: dict,
         satellite: EarthSatellite,
         spot_pos: Topos,
-        horizon_profile: list[float],
+        horizon_profile: bytes,
         ts: Timescale,
-        eph: SpiceKernel) -> float:
+        eph: SpiceKernel,
+        horizon_octant_min: bytes | None = None) -> float:
     """
     1つのイベントに対して，地形と天文学的な条件（観測地点の暗さ・衛星の被照）から，イベント期間に対する衛星の可視時間割合を計算する．
+    horizon_octant_min（区画ごとの最小仰角）が渡された場合，出・南中・没の3時刻だけでパス全体が稜線に隠れていると分かれば，
+    10時刻の高度・方位角を計算せずに0を返す．
+    全ての時刻で衛星が稜線に隠れている場合は，重い計算（太陽高度・衛星の被照）をせずに0を返す．
     """
+    horizon_profile = decode_horizon_profile(horizon_profile) # 0.01度単位（コピーしない）
+    len_horizon_profile = len(horizon_profile)
+
+    # 0. 区画ごとの最小仰角による事前判定
+    if horizon_octant_min is not None and is_pass_hidden_by_octants(
+            pass_event=pass_event, satellite=satellite, spot_pos=spot_pos,
+            horizon_octant_min=horizon_octant_min, num_directions=len_horizon_profile, ts=ts):
+        return 0.0
+
     t_rise = pass_event['rise_time']
     t_set = pass_event['set_time']
     # 地球時（Terrestrial Time）のユリウス日の数値配列に変換してlinspace
@@ -33,14 +73,16 @@ def calc_visible_time_ratio(
     sat_azimuths_deg: np.ndarray = alt_az_dist_tuple[1].degrees
 
     # 衛星の方位角[0:360)を，稜線プロファイルのインデックス[0:len(horizon_profile)-1]に変換する．
-    horizon_profile = np.array(horizon_profile)
-    len_horizon_profile = len(horizon_profile)
     indices = np.floor((sat_azimuths_deg / 360.0) * len_horizon_profile).astype(int)
     indices = np.clip(indices, 0, len_horizon_profile - 1)
 
-    horizon_altitudes_deg = horizon_profile[indices] # 衛星の方位角に対応する稜線高度
+    horizon_altitudes = horizon_profile[indices] # 衛星の方位角に対応する稜線高度（0.01度単位）
+
+    is_foreground: np.ndarray = sat_altitudes_deg * HORIZON_PROFILE_SCALE > horizon_altitudes
 
-    is_foreground: np.ndarray = sat_altitudes_deg > horizon_altitudes_deg
+    # 全ての時刻で隠れていれば，2・3の結果に関わらず可視時間割合は0．
+    if not is_foreground.any():
+        return 0.0
 
     # 2. 観測地点の暗さ
     sun, earth = eph['sun'], eph['earth']
@@ -111,65 +153,73 @@ def get_meteorological_score(pass_event: dict, weather_df: pd.DataFrame) -> tupl
 
     return rain_score, cloud_score, met_visibility_score
 
+def convert_wa2015_to_sky_glow_score(artificial_brightness: np.ndarray, settings: Settings) -> np.ndarray:
+    """
+    World Atlas 2015の生値（人工光の輝度 mcd/m2）の配列を，0-1に正規化した光害スコアの配列に変換する．
+    SQLの静的スコアと同じルックアップテーブルを線形補間する．
+    """
+    sky_glow_lut = build_sky_glow_lut(sqm_min=settings.SQM_MIN, sqm_max=settings.SQM_MAX, size=settings.SKY_GLOW_LUT_SIZE)
+    artificial_brightness = np.asarray(artificial_brightness, dtype=float)
+    # 範囲外は両端の値になる．（負の値は0と同じ，上限以上は光害スコア0）
+    return np.interp(artificial_brightness, sky_glow_lut.raw_values, sky_glow_lut.scores)
+
 def calc_sky_glow_score(coords_to_sample: list[(float, float)], settings: Settings) -> np.ndarray:
-    # 光害スコアの計算と正規化
-    # World Atlas 2015の生値をSQM値に変換
-    try:
-        with rasterio.open(settings.PATH_WORLD_ATLAS_2015_TIFF) as src:
-            sample_results = np.array(list(src.sample(coords_to_sample)))
-    except rasterio.errors.RasterioIOError:
-        print(f"⚠️ 警告: 観測地点 {coords_to_sample} に対応するWorld Atlas 2015の値が取得できませんでした．")
-        return np.full(len(coords_to_sample), 0.0)
-
-    NATURAL_SKY_BRIGHTNESS_MCD_M2 = 0.171168465
-    SQM_CONVERSION_CONSTANT = 108000000
-    LOG_BASE_FACTOR = -0.4
-    SQM_MIN = settings.SQM_MIN
-    SQM_MAX = settings.SQM_MAX
-
-    artificial_brightness = sample_results[:, 0]
-    artificial_brightness[artificial_brightness < 0] = 0 # 負の値を0にクリップ
-    total_brightness = artificial_brightness + NATURAL_SKY_BRIGHTNESS_MCD_M2
-    sqm_value = np.log10(total_brightness / SQM_CONVERSION_CONSTANT) / LOG_BASE_FACTOR
-
-    # SQM値を限界等級NELM（Naked-Eye Limiting Magnitude）に変換
-    # 参考文献：Crumey, Andrew (2014). “Human Contrast Threshold and Astronomical Visibility”. Monthly Notices of the Royal Astronomical Society. 442 (3): 2600-2619.
-    F = 2.0 # 典型的な観測者と仮定
-
-    NELM_INTERCEPT_91 = -1.44 - (2.5 * np.log10(F))
-    NELM_SLOPE_91 = 0.383
-
-    NELM_INTERCEPT_90 = 0.8 - (2.5 * np.log10(F))
-    NELM_SLOPE_90 = 0.27
-
-    nelm_value = np.where(
-        sqm_value >= 19.5,
-        (NELM_SLOPE_91 * sqm_value) + NELM_INTERCEPT_91,
-        (NELM_SLOPE_90 * sqm_value) + NELM_INTERCEPT_90
-    )
-    
-    # NELMをクリップ
-    NELM_MIN = (NELM_SLOPE_90 * SQM_MIN) + NELM_INTERCEPT_90
-    NELM_MAX = (NELM_SLOPE_91 * SQM_MAX) + NELM_INTERCEPT_91
-    nelm_value = np.clip(nelm_value, NELM_MIN, NELM_MAX)
-
-    NELM_RANGE = NELM_MAX - NELM_MIN
-    if NELM_RANGE > 0:
-        sky_glow_score = (nelm_value - NELM_MIN) / NELM_RANGE
+    """
+    (経度, 緯度)のリストに対応する光害スコアを返す．
+    事前計算された光害スコアのGeoTIFF，またはメモリに載せたWorld Atlas 2015の範囲内は配列の添字参照で求め，
+    範囲外の座標だけはWorld Atlas 2015のファイルから取得する．
+    """
+    lons = np.array([lon for lon, lat in coords_to_sample], dtype=float)
+    lats = np.array([lat for lon, lat in coords_to_sample], dtype=float)
+
+    sky_glow_score_raster = get_sky_glow_score_raster()
+    if sky_glow_score_raster.is_loaded():
+        sky_glow_score = sky_glow_score_raster.sample(lons=lons, lats=lats)
     else:
-        sky_glow_score = np.full_like(nelm_value, 0.0)
-    
+        sky_glow_score = np.full(len(coords_to_sample), np.nan)
+
+    is_missing = np.isnan(sky_glow_score)
+    if not is_missing.any():
+        return sky_glow_score
+
+    lons, lats = lons[is_missing], lats[is_missing]
+    sky_glow_raster = get_sky_glow_raster()
+    if sky_glow_raster.is_loaded():
+        artificial_brightness = sky_glow_raster.sample(lons=lons, lats=lats)
+    else:
+        artificial_brightness = np.full(len(lons), np.nan)
+
+    is_raw_missing = np.isnan(artificial_brightness)
+    if is_raw_missing.any():
+        try:
+            with rasterio.open(settings.PATH_WORLD_ATLAS_2015_TIFF) as src:
+                sample_results = np.array(list(src.sample(list(zip(lons[is_raw_missing], lats[is_raw_missing])))))
+            artificial_brightness[is_raw_missing] = sample_results[:, 0]
+        except rasterio.errors.RasterioIOError:
+            print(f"⚠️ 警告: 観測地点 {coords_to_sample} に対応するWorld Atlas 2015の値が取得できませんでした．")
+            return np.full(len(coords_to_sample), 0.0)
+
+    sky_glow_score[is_missing] = convert_wa2015_to_sky_glow_score(artificial_brightness=artificial_brightness, settings=settings)
     return sky_glow_score
 
+def calc_event_score_upper_bound(pass_event: dict, sky_glow_score: float, weather_df: pd.DataFrame) -> float:
+    """
+    1つのイベントに対して，計算の軽いスコアだけを用いて最終スコアの上界を求める．
+    最終スコアは0-1のスコアの総積であるため，可視時間割合と月相スコアを1とみなせば上界になる．
+    """
+    rain_score, cloud_score, met_visibility_score = get_meteorological_score(pass_event=pass_event, weather_df=weather_df)
+    return sky_glow_score * rain_score * cloud_score * met_visibility_score
+
 def calc_event_score(
         pass_event: dict,
         satellite: EarthSatellite,
         spot_pos: Topos,
-        horizon_profile: list[float],
+        horizon_profile: bytes,
         sky_glow_score: float,
         ts: Timescale,
         eph: SpiceKernel,
-        weather_df: pd.DataFrame) -> Score:
+        weather_df: pd.DataFrame,
+        horizon_octant_min: bytes | None = None) -> Score:
     """
     1つのイベントに対して，地形・光害・気象を考慮した最終スコアを計算する．
     """
@@ -177,7 +227,8 @@ def calc_event_score(
 
     # 可視時間割合
     visible_time_ratio = calc_visible_time_ratio(pass_event=pass_event, satellite=satellite, spot_pos=spot_pos,
-                                                 horizon_profile=horizon_profile, ts=ts, eph=eph)
+                                                 horizon_profile=horizon_profile, ts=ts, eph=eph,
+                                                 horizon_octant_min=horizon_octant_min)
     scores['visible_time_ratio'] = visible_time_ratio
 
     # 光害スコア（SQM値とボートル・スケールにより夜空の暗さを評価）
@@ -0,0 +1,323 @@
+# app/services/search_service.py
+import base64
+import json
+import os
+import sys
+import threading
+from array import array
+from collections import namedtuple
+from pathlib import Path
+import numpy as np
+from sqlalchemy import cast
+from sqlalchemy.orm import Session
+from geoalchemy2.types import Geometry
+from app.models import Location, Spot
+from app.core.config import get_settings
+
+EARTH_R = 6371008.8 # 地球の平均半径（m）
+
+# 検索結果の1行．crud/location.pyの結果と同じく，name・lat・lonの属性を持つ．
+SearchRow = namedtuple('SearchRow', ['name', 'lat', 'lon', 'distance'])
+
+def extract_grams(text: str) -> set[str]:
+    """
+    文字列から検索用のn-gram（1文字と2文字）を抽出する．
+    日本語は単語の区切りが無いため，形態素解析の代わりにバイグラムを使う．
+    """
+    return set(text) | {text[i:i+2] for i in range(len(text) - 1)}
+
+def encode_offset_cursor(offset: int) -> str:
+    """
+    インメモリ索引のページ位置をカーソル文字列に変換する．
+    """
+    payload = json.dumps({'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_offset_cursor(cursor: str) -> int | None:
+    """
+    インメモリ索引のカーソル文字列をページ位置に戻す．インメモリ索引のカーソルでなければNoneを返す．
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(payload['o'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+# 索引の構築時のメモリ使用量の見積もりに使う，要素ごとのバイト数
+# 1組（n-gram，名前）あたり：構築中の番号の組（int32×2），並べ替えの添字（int64），ポスティング（int32）
+BUILD_BYTES_PER_POSTING = 4 * 2 + 8 + 4
+# 1件あたり：緯度経度（float64×2）と，名前のリストのポインタ
+BUILD_BYTES_PER_DOC = 8 * 2 + 8
+# 1つのn-gramあたり：n-gramの番号と範囲の2つの辞書のエントリ，範囲のタプルとint（概算）
+BUILD_BYTES_PER_GRAM = 200
+
+def estimate_build_bytes(num_docs: int, num_postings: int, num_grams: int, num_bytes_names: int, num_bytes_grams: int) -> int:
+    """
+    索引の構築時のピークのメモリ使用量（バイト）を見積もる．
+    名前とn-gramの文字列は，sys.getsizeofで測ったPythonのオブジェクトのサイズの合計を渡す．
+    """
+    return (
+        num_postings * BUILD_BYTES_PER_POSTING
+        + num_docs * BUILD_BYTES_PER_DOC
+        + num_grams * BUILD_BYTES_PER_GRAM
+        + num_bytes_names
+        + num_bytes_grams
+    )
+
+class NameSearchIndex:
+    """
+    場所の名前のn-gram転置索引．
+    ポスティング（各n-gramを含む名前の番号）は1本のint32配列に連結し，n-gramごとの開始・終了位置だけを辞書で持つ．
+    """
+    def __init__(self, names: list[str], lats, lons, grams: list[str], posting_offsets, postings):
+        self.names = names
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.grams = grams
+        self.posting_offsets = np.asarray(posting_offsets, dtype=np.int64)
+        self.postings = np.asarray(postings, dtype=np.int32)
+        self.gram_to_range = {
+            gram: (int(start), int(end))
+            for gram, start, end in zip(grams, self.posting_offsets[:-1], self.posting_offsets[1:])
+        }
+
+    @classmethod
+    def from_rows(cls, rows, memory_budget_bytes: int | None = None) -> 'NameSearchIndex':
+        """
+        name・lat・lonの属性を持つ行のイテラブルから索引を作成する．
+
+        n-gramの番号と名前の番号の組を型付き配列に溜め，最後にn-gramの番号で安定ソートしてポスティングを作る．
+        （n-gramごとにPythonのintのリストを持つと，1件あたり数十バイトになるため．）
+        メモリ予算は，行を読みながら構築時のピークの見積もりで判定し，超える時点でMemoryErrorを送出する．
+        """
+        names: list[str] = []
+        lats = array('d')
+        lons = array('d')
+        gram_ids_by_gram: dict[str, int] = {}
+        pair_gram_ids = array('i') # 各（n-gram，名前）の組のn-gramの番号
+        pair_doc_ids = array('i') # 各（n-gram，名前）の組の名前の番号
+        num_bytes_names = 0
+        num_bytes_grams = 0
+
+        for doc_id, row in enumerate(rows):
+            name = row.name or ""
+            names.append(name)
+            lats.append(row.lat)
+            lons.append(row.lon)
+            num_bytes_names += sys.getsizeof(name)
+
+            for gram in extract_grams(name):
+                gram_id = gram_ids_by_gram.get(gram)
+                if gram_id is None:
+                    gram_id = gram_ids_by_gram[gram] = len(gram_ids_by_gram)
+                    num_bytes_grams += sys.getsizeof(gram)
+                pair_gram_ids.append(gram_id)
+                pair_doc_ids.append(doc_id)
+
+            if memory_budget_bytes and estimate_build_bytes(
+                    num_docs=doc_id + 1, num_postings=len(pair_doc_ids), num_grams=len(gram_ids_by_gram),
+                    num_bytes_names=num_bytes_names, num_bytes_grams=num_bytes_grams) > memory_budget_bytes:
+                raise MemoryError(f"検索索引がメモリ予算（{memory_budget_bytes}バイト）を超えます．")
+
+        # n-gramの番号で安定ソートすると，同じn-gramのポスティングが名前の番号の昇順で並ぶ．
+        pair_gram_ids = np.frombuffer(pair_gram_ids, dtype=np.int32)
+        order = np.argsort(pair_gram_ids, kind='stable')
+        postings = np.frombuffer(pair_doc_ids, dtype=np.int32)[order]
+        del order
+
+        lengths = np.bincount(pair_gram_ids, minlength=len(gram_ids_by_gram))
+        posting_offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        return cls(
+            names=names, lats=np.frombuffer(lats, dtype=np.float64), lons=np.frombuffer(lons, dtype=np.float64),
+            grams=list(gram_ids_by_gram), # 辞書は挿入順（＝n-gramの番号順）
+            posting_offsets=posting_offsets, postings=postings
+        )
+
+    @classmethod
+    def from_db(cls, db: Session, memory_budget_bytes: int | None = None) -> 'NameSearchIndex':
+        """
+        locationsテーブルとspotsテーブルから索引を作成する．
+        """
+        def iter_rows():
+            for model in [Location, Spot]:
+                query = db.query(
+                    model.name.label('name'),
+                    cast(model.geom, Geometry).ST_Y().label('lat'),
+                    cast(model.geom, Geometry).ST_X().label('lon')
+                )
+                yield from query.yield_per(10000) # 全件をまとめてメモリに載せない
+
+        return cls.from_rows(iter_rows(), memory_budget_bytes=memory_budget_bytes)
+
+    def save(self, path: str | Path) -> None:
+        """
+        索引をNPZファイルにスナップショットとして保存する．（pickleは使わない）
+        一時ファイルに書いてから置き換える（読み込み中のプロセスが書き込み途中のファイルを読まないため．）
+        """
+        path = Path(path)
+        names_bytes = [name.encode('utf-8') for name in self.names]
+        grams_bytes = [gram.encode('utf-8') for gram in self.grams]
+
+        # ファイルオブジェクトに書くと，np.savezはパスに.npzを付け足さない．
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                names_blob=np.frombuffer(b"".join(names_bytes), dtype=np.uint8),
+                names_offsets=np.cumsum([0] + [len(b) for b in names_bytes], dtype=np.int64),
+                grams_blob=np.frombuffer(b"".join(grams_bytes), dtype=np.uint8),
+                grams_offsets=np.cumsum([0] + [len(b) for b in grams_bytes], dtype=np.int64),
+                posting_offsets=self.posting_offsets,
+                postings=self.postings,
+                lats=self.lats,
+                lons=self.lons
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'NameSearchIndex':
+        """
+        NPZファイルのスナップショットから索引を読み込む．
+        """
+        def split_blob(blob: np.ndarray, offsets: np.ndarray) -> list[str]:
+            data = blob.tobytes()
+            return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(
+                names=split_blob(npz['names_blob'], npz['names_offsets']),
+                lats=npz['lats'],
+                lons=npz['lons'],
+                grams=split_blob(npz['grams_blob'], npz['grams_offsets']),
+                posting_offsets=npz['posting_offsets'],
+                postings=npz['postings']
+            )
+
+    def _get_postings(self, gram: str) -> np.ndarray:
+        start, end = self.gram_to_range.get(gram, (0, 0))
+        return self.postings[start:end]
+
+    def _find_candidates(self, keyword: str) -> np.ndarray:
+        """
+        キーワードを名前に含む可能性がある名前の番号を返す．（バイグラムの積集合なので偽陽性を含む）
+        """
+        if len(keyword) == 1:
+            return self._get_postings(keyword)
+
+        candidates = None
+        # ポスティングの短いn-gramから積集合を取ると速い．
+        bigrams = sorted({keyword[i:i+2] for i in range(len(keyword) - 1)},
+                         key=lambda gram: len(self._get_postings(gram)))
+        for gram in bigrams:
+            postings = self._get_postings(gram)
+            candidates = postings if candidates is None else np.intersect1d(candidates, postings, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def search(self, name: str, lat: float, lon: float, limit: int = 10, offset: int = 0) -> tuple[int, list[SearchRow]]:
+        """
+        スペース区切りの全ての検索クエリを名前に含む場所をAND検索し，指定された座標に近い順にソートして返す．
+
+        Returns:
+            (int, list[SearchRow]): 総件数，ページの行
+        """
+        keywords = name.split()
+        if not keywords:
+            return 0, []
+
+        doc_ids = None
+        for keyword in sorted(keywords, key=len, reverse=True): # 長いキーワードほど候補が少ない．
+            candidates = self._find_candidates(keyword)
+            doc_ids = candidates if doc_ids is None else np.intersect1d(doc_ids, candidates, assume_unique=True)
+            if len(doc_ids) == 0:
+                return 0, []
+
+        # バイグラムの偽陽性を，文字列の部分一致で除去（2文字以下のキーワードはn-gramそのものなので不要）
+        long_keywords = [kw for kw in keywords if len(kw) > 2]
+        if long_keywords:
+            doc_ids = np.array([doc_id for doc_id in doc_ids if all(kw in self.names[doc_id] for kw in long_keywords)],
+                               dtype=np.int64)
+        total = len(doc_ids)
+        if total == 0 or offset >= total:
+            return total, []
+
+        # 大円距離（ハーサイン公式）で近い順に並べる．必要な件数だけを部分ソートする．
+        lat1, lon1 = np.radians(lat), np.radians(lon)
+        lat2, lon2 = np.radians(self.lats[doc_ids]), np.radians(self.lons[doc_ids])
+        a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+        distances = 2 * EARTH_R * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+        page_end = min(offset + limit, total)
+        if page_end < total:
+            top = np.argpartition(distances, page_end - 1)[:page_end]
+        else:
+            top = np.arange(total)
+        top = top[np.argsort(distances[top], kind='stable')][offset:page_end]
+
+        rows = [
+            SearchRow(name=self.names[doc_ids[i]], lat=float(self.lats[doc_ids[i]]),
+                      lon=float(self.lons[doc_ids[i]]), distance=float(distances[i]))
+            for i in top
+        ]
+        return total, rows
+
+class NameSearchService:
+    """
+    インメモリの場所検索索引を保持し，定期的に再構築するサービス．
+    索引が無い場合（無効・構築前・メモリ予算超過）はNoneを返し，呼び出し側はDBで検索する．
+    """
+    def __init__(self, snapshot_path: Path | None, memory_budget_mb: int):
+        # スナップショットはNPZ形式なので，拡張子を.npzに揃える．
+        self.snapshot_path = Path(snapshot_path).with_suffix('.npz') if snapshot_path else None
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self._index: NameSearchIndex | None = None
+        self._lock = threading.Lock() # 再構築の重複実行を防ぐ．
+
+    def get_index(self) -> NameSearchIndex | None:
+        """
+        現在の索引を返す．
+        """
+        return self._index
+
+    def load_snapshot(self) -> bool:
+        """
+        スナップショットファイルがあれば索引を読み込む．
+        """
+        if not self.snapshot_path or not Path(self.snapshot_path).exists():
+            return False
+        self._index = NameSearchIndex.load(self.snapshot_path)
+        print(f"NameSearchService: スナップショットから{len(self._index.names)}件の索引を読み込み完了．")
+        return True
+
+    def rebuild(self, db: Session) -> None:
+        """
+        DBから索引を再構築し，構築し終えてから差し替える．スナップショットのパスがあれば保存する．
+        """
+        if not self._lock.acquire(blocking=False):
+            return # 他のスレッドで再構築中
+        try:
+            print("NameSearchService: 索引の構築を開始...")
+            index = NameSearchIndex.from_db(db=db, memory_budget_bytes=self.memory_budget_bytes)
+            self._index = index
+            print(f"NameSearchService: {len(index.names)}件の索引を構築完了．")
+            if self.snapshot_path:
+                index.save(self.snapshot_path)
+        except MemoryError as e:
+            print(f"⚠️ 警告: {e} DBでの検索を使います．")
+        finally:
+            self._lock.release()
+
+settings = get_settings()
+name_search_service_instance = NameSearchService(
+    snapshot_path=settings.LOCATION_SEARCH_INDEX_SNAPSHOT,
+    memory_budget_mb=settings.LOCATION_SEARCH_INDEX_MEMORY_BUDGET_MB
+)
+
+def get_name_search_service() -> NameSearchService:
+    """
+    FastAPIのDepends()に渡すための関数．
+    起動時に作成された単一のインスタンスを返す．
+    """
+    return name_search_service_instance
@@ -0,0 +1,214 @@
+# app/services/sky_glow_service.py
+import json
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import rasterio
+from rasterio.windows import Window, from_bounds
+from affine import Affine
+from app.core.config import get_settings
+
+NATURAL_SKY_BRIGHTNESS_MCD_M2 = 0.171168465 # 自然の夜空の輝度（22.00 mag/arcsec2）
+SQM_CONVERSION_CONSTANT = 108000000
+LOG_BASE_FACTOR = -0.4
+SQM_NELM_BOUNDARY = 19.5 # Crumey (2014)の(90)式と(91)式を切り替えるSQM値
+
+# 光害スコアのルックアップテーブル．raw_values[i] = i × stepの光害スコアがscores[i]．
+SkyGlowLut = namedtuple('SkyGlowLut', ['raw_values', 'scores', 'step'])
+
+def convert_sqm_to_wa2015(sqm_value: float) -> float:
+    """
+    SQM値を，World Atlas 2015の生値（人工光の輝度 mcd/m2）に逆変換する．
+    """
+    return SQM_CONVERSION_CONSTANT * 10 ** (LOG_BASE_FACTOR * sqm_value) - NATURAL_SKY_BRIGHTNESS_MCD_M2
+
+def calc_sky_glow_score_exact(artificial_brightness: np.ndarray, sqm_min: float, sqm_max: float) -> np.ndarray:
+    """
+    World Atlas 2015の生値（人工光の輝度 mcd/m2）の配列を，0-1に正規化した光害スコアの配列に変換する．
+    ルックアップテーブルの作成にだけ使い，スコアの計算にはbuild_sky_glow_lutの表を使う．
+    """
+    SQM_MIN = sqm_min
+    SQM_MAX = sqm_max
+
+    # World Atlas 2015の生値をSQM値に変換
+    artificial_brightness = np.array(artificial_brightness, dtype=float)
+    artificial_brightness[artificial_brightness < 0] = 0 # 負の値を0にクリップ
+    total_brightness = artificial_brightness + NATURAL_SKY_BRIGHTNESS_MCD_M2
+    sqm_value = np.log10(total_brightness / SQM_CONVERSION_CONSTANT) / LOG_BASE_FACTOR
+
+    # SQM値を限界等級NELM（Naked-Eye Limiting Magnitude）に変換
+    # 参考文献：Crumey, Andrew (2014). “Human Contrast Threshold and Astronomical Visibility”. Monthly Notices of the Royal Astronomical Society. 442 (3): 2600-2619.
+    F = 2.0 # 典型的な観測者と仮定
+
+    NELM_INTERCEPT_91 = -1.44 - (2.5 * np.log10(F))
+    NELM_SLOPE_91 = 0.383
+
+    NELM_INTERCEPT_90 = 0.8 - (2.5 * np.log10(F))
+    NELM_SLOPE_90 = 0.27
+
+    nelm_value = np.where(
+        sqm_value >= SQM_NELM_BOUNDARY,
+        (NELM_SLOPE_91 * sqm_value) + NELM_INTERCEPT_91,
+        (NELM_SLOPE_90 * sqm_value) + NELM_INTERCEPT_90
+    )
+    
+    # NELMをクリップ
+    NELM_MIN = (NELM_SLOPE_90 * SQM_MIN) + NELM_INTERCEPT_90
+    NELM_MAX = (NELM_SLOPE_91 * SQM_MAX) + NELM_INTERCEPT_91
+    nelm_value = np.clip(nelm_value, NELM_MIN, NELM_MAX)
+
+    NELM_RANGE = NELM_MAX - NELM_MIN
+    if NELM_RANGE > 0:
+        sky_glow_score = (nelm_value - NELM_MIN) / NELM_RANGE
+    else:
+        sky_glow_score = np.full_like(nelm_value, 0.0)
+    
+    return sky_glow_score
+
+@lru_cache
+def build_sky_glow_lut(sqm_min: float, sqm_max: float, size: int) -> SkyGlowLut:
+    """
+    World Atlas 2015の生値を0から等間隔にsize点取り，各点の光害スコアを計算した表を返す．
+    上端は，それより明るいと光害スコアが必ず0になる生値（SQM値がmin(SQM_MIN, 19.5)）とする．
+    Python（np.interp）とSQL（sky_glow_lutテーブル）のどちらの光害スコアもこの表から求める．
+    """
+    raw_max = convert_sqm_to_wa2015(min(sqm_min, SQM_NELM_BOUNDARY))
+    raw_values = np.linspace(0.0, raw_max, num=size)
+    scores = calc_sky_glow_score_exact(artificial_brightness=raw_values, sqm_min=sqm_min, sqm_max=sqm_max)
+    return SkyGlowLut(raw_values=raw_values, scores=scores, step=raw_max / (size - 1))
+
+def get_bbox_window(src, bbox: tuple[float, float, float, float]) -> Window:
+    """
+    経緯度の範囲（西端経度, 南端緯度, 東端経度, 北端緯度）を覆う，画素境界に揃えたウィンドウを返す．
+    """
+    window = from_bounds(*bbox, transform=src.transform)
+    window = window.round_offsets(op='floor').round_lengths(op='ceil')
+    return window.intersection(Window(0, 0, src.width, src.height))
+
+class SkyGlowRaster:
+    """
+    World Atlas 2015のうち，アプリが扱う範囲（日本周辺）だけを切り出したNumPy配列とアフィン変換．
+    起動時に1度だけ読み込み，以降の光害の値の取得は配列の添字参照だけで済ませる．
+    """
+    def __init__(self, bbox: tuple[float, float, float, float], cache_path: Path | None = None):
+        self.bbox = tuple(bbox) # (西端経度, 南端緯度, 東端経度, 北端緯度)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.data: np.ndarray | None = None
+        self.transform: Affine | None = None
+
+    def is_loaded(self) -> bool:
+        return self.data is not None
+
+    def load(self, path_world_atlas_2015: str, required_tags: dict | None = None) -> None:
+        """
+        キャッシュファイル（.npy）があればメモリマップで開き，無ければGeoTIFFから切り出す．
+        キャッシュは範囲とGeoTIFF（パス・サイズ・更新日時）が作成時と同じ場合に限って使う．
+        required_tagsを渡した場合，GeoTIFFのタグが一致しなければValueErrorを送出する．
+        """
+        if self._load_cache(path_world_atlas_2015):
+            print(f"SkyGlowRaster: キャッシュ {self.cache_path} を読み込み完了．{self.data.shape}")
+            return
+
+        with rasterio.open(path_world_atlas_2015) as src:
+            tags = src.tags()
+            for key, value in (required_tags or {}).items():
+                if tags.get(key) != value:
+                    raise ValueError(f"{path_world_atlas_2015} のタグ {key}={tags.get(key)} が {value} と一致しません．")
+            window = get_bbox_window(src, self.bbox)
+            data = src.read(1, window=window).astype(np.float32)
+            transform = src.window_transform(window)
+
+        data[data < 0] = 0 # 負の値を0にクリップ
+        self.data, self.transform = data, transform
+        print(f"SkyGlowRaster: {path_world_atlas_2015} の{self.bbox}の範囲を読み込み完了．{self.data.shape}")
+        self._save_cache(path_world_atlas_2015)
+
+    def _cache_meta_path(self) -> Path:
+        return self.cache_path.with_suffix('.json')
+
+    @staticmethod
+    def _get_source_signature(path_world_atlas_2015: str) -> dict:
+        """
+        キャッシュの作成元のGeoTIFFを識別する値を返す．
+        ローカルのファイルはサイズと更新日時，S3などのファイルはヘッダを読んで画素の並び（アフィン変換と大きさ）で識別する．
+        """
+        signature = {'source_path': str(path_world_atlas_2015)}
+        path_source = Path(path_world_atlas_2015)
+        if path_source.exists():
+            stat = path_source.stat()
+            signature.update({'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns})
+        else:
+            with rasterio.open(path_world_atlas_2015) as src:
+                signature.update({'source_transform': list(src.transform)[:6], 'source_shape': [src.height, src.width]})
+        return signature
+
+    def _load_cache(self, path_world_atlas_2015: str) -> bool:
+        if not self.cache_path or not self.cache_path.exists() or not self._cache_meta_path().exists():
+            return False
+        meta = json.loads(self._cache_meta_path().read_text(encoding='utf-8'))
+        if tuple(meta['bbox']) != self.bbox: # 範囲の設定が変わった場合は作り直す．
+            return False
+        try:
+            signature = self._get_source_signature(path_world_atlas_2015)
+        except rasterio.errors.RasterioIOError as e:
+            # 作成元を確認できない場合は，古い可能性があってもキャッシュを使う．
+            print(f"⚠️ 警告: {path_world_atlas_2015} を確認できないため，キャッシュ {self.cache_path} をそのまま使います: {e}")
+        else:
+            if any(meta.get(key) != value for key, value in signature.items()):
+                print(f"⚠️ 警告: キャッシュ {self.cache_path} は {path_world_atlas_2015} の現在の内容と異なるため，作り直します．")
+                return False
+        self.data = np.load(self.cache_path, mmap_mode='r')
+        self.transform = Affine(*meta['transform'])
+        return True
+
+    def _save_cache(self, path_world_atlas_2015: str) -> None:
+        if not self.cache_path:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(self.cache_path, self.data)
+        meta = {'bbox': list(self.bbox), 'transform': list(self.transform)[:6]}
+        meta.update(self._get_source_signature(path_world_atlas_2015))
+        self._cache_meta_path().write_text(json.dumps(meta), encoding='utf-8')
+
+    def sample(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """
+        座標に対応する画素の生値（人工光の輝度 mcd/m2）を返す．範囲外の座標はNaNになる．
+        画素の選び方はrasterioのsampleと同じ（逆アフィン変換の切り捨て）．
+        """
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        cols, rows = ~self.transform * (lons, lats)
+        cols = np.floor(cols).astype(np.int64)
+        rows = np.floor(rows).astype(np.int64)
+
+        height, width = self.data.shape
+        in_bounds = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        values = np.full(lons.shape, np.nan, dtype=float)
+        values[in_bounds] = self.data[rows[in_bounds], cols[in_bounds]]
+        return values
+
+def get_sky_glow_params(settings) -> str:
+    """
+    光害スコアの計算に用いるパラメータを文字列で返す．光害スコアのGeoTIFFのタグと比較するために使う．
+    """
+    return f"SQM_MIN={settings.SQM_MIN};SQM_MAX={settings.SQM_MAX};SKY_GLOW_LUT_SIZE={settings.SKY_GLOW_LUT_SIZE}"
+
+settings = get_settings()
+sky_glow_raster_instance = SkyGlowRaster(bbox=settings.SKY_GLOW_BBOX, cache_path=settings.SKY_GLOW_CACHE_PATH)
+# scripts/build_sky_glow_score_tiff.pyで事前計算した光害スコア（World Atlas 2015と同じ画素の並び）
+sky_glow_score_raster_instance = SkyGlowRaster(bbox=settings.SKY_GLOW_BBOX)
+
+def get_sky_glow_raster() -> SkyGlowRaster:
+    """
+    FastAPIのDepends()に渡すための関数．
+    起動時に作成された単一のインスタンスを返す．
+    """
+    return sky_glow_raster_instance
+
+def get_sky_glow_score_raster() -> SkyGlowRaster:
+    """
+    FastAPIのDepends()に渡すための関数．
+    事前計算された光害スコアのインスタンスを返す．
+    """
+    return sky_glow_score_raster_instance
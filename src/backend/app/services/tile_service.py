@@ -0,0 +1,112 @@
+# app/services/tile_service.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from app.core.config import get_settings
+from app.services.dem_service import get_gdal_env_options
+
+WEB_MERCATOR_HALF_WIDTH_M = 20037508.342789244 # EPSG:3857の世界全体の幅の半分（m）
+TILE_SIZE_PX = 256
+
+# 光害スコア（0：明るい - 1：暗い）ごとのRGBA．暗い場所ほど透明にして地図に重ねる．
+SKY_GLOW_COLOR_STOPS = np.array([0.0, 0.25, 0.5, 0.75, 1.0])
+SKY_GLOW_COLORS = np.array([
+    [255, 255, 255, 220],
+    [255, 220, 0, 200],
+    [255, 100, 0, 160],
+    [120, 0, 160, 100],
+    [0, 0, 60, 0],
+], dtype=float)
+
+class TileCache:
+    """
+    レスポンス済みのタイルをプロセス内に保持するLRUキャッシュ．
+    静的スコアは起動時やスクリプトの実行時にしか変わらないため，有効期間（max_age_s）を過ぎたら取り直す．
+    """
+    def __init__(self, max_size: int, max_age_s: int):
+        self.max_size = max_size
+        self.max_age_s = max_age_s
+        self._tiles: OrderedDict[tuple, tuple[float, bytes, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[bytes, str] | None:
+        """
+        キャッシュ済みのタイルと，そのETagを返す．無い場合や有効期間を過ぎた場合はNoneを返す．
+        """
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None:
+                return None
+            cached_at, content, etag = entry
+            if time.monotonic() - cached_at > self.max_age_s:
+                del self._tiles[key]
+                return None
+            self._tiles.move_to_end(key)
+            return content, etag
+
+    def put(self, key: tuple, content: bytes) -> str:
+        """
+        タイルをキャッシュし，内容から計算したETagを返す．
+        """
+        etag = make_etag(content)
+        with self._lock:
+            self._tiles[key] = (time.monotonic(), content, etag)
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.max_size:
+                self._tiles.popitem(last=False)
+        return etag
+
+def make_etag(content: bytes) -> str:
+    """
+    内容のハッシュから強いETagを作る．
+    """
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+def get_tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """
+    XYZタイルのEPSG:3857での範囲（西端, 南端, 東端, 北端）を返す．
+    """
+    tile_width = 2 * WEB_MERCATOR_HALF_WIDTH_M / (2 ** z)
+    west = -WEB_MERCATOR_HALF_WIDTH_M + x * tile_width
+    north = WEB_MERCATOR_HALF_WIDTH_M - y * tile_width
+    return west, north - tile_width, west + tile_width, north
+
+def render_sky_glow_tile(path_sky_glow_score_tiff: str, z: int, x: int, y: int) -> bytes:
+    """
+    光害スコアのGeoTIFFから，XYZタイルの範囲を着色したPNG画像を作る．
+    タイルの範囲へ直接ワープして読むため，低ズームではGeoTIFFの縮小画像が使われる．
+    S3に置いた場合も，DEMと同じGDALの設定でタイルの範囲のブロックだけを取得する．
+    """
+    transform = from_bounds(*get_tile_bounds(z=z, x=x, y=y), TILE_SIZE_PX, TILE_SIZE_PX)
+    with rasterio.Env(**get_gdal_env_options(settings)), rasterio.open(path_sky_glow_score_tiff) as src:
+        with WarpedVRT(src, crs='EPSG:3857', transform=transform, width=TILE_SIZE_PX, height=TILE_SIZE_PX,
+                       resampling=Resampling.bilinear, src_nodata=np.nan, nodata=np.nan) as vrt:
+            sky_glow_score = vrt.read(1)
+
+    rgba = np.zeros((4, TILE_SIZE_PX, TILE_SIZE_PX), dtype=np.uint8)
+    is_valid = ~np.isnan(sky_glow_score)
+    for band in range(4):
+        rgba[band][is_valid] = np.interp(sky_glow_score[is_valid], SKY_GLOW_COLOR_STOPS, SKY_GLOW_COLORS[:, band])
+
+    with MemoryFile() as memfile:
+        with memfile.open(driver='PNG', width=TILE_SIZE_PX, height=TILE_SIZE_PX, count=4, dtype='uint8',
+                          crs='EPSG:3857', transform=transform) as dst:
+            dst.write(rgba)
+        return memfile.read()
+
+settings = get_settings()
+tile_cache_instance = TileCache(max_size=settings.SPOT_TILE_CACHE_SIZE, max_age_s=settings.SPOT_TILE_CACHE_MAX_AGE_S)
+
+def get_tile_cache() -> TileCache:
+    """
+    FastAPIのDepends()に渡すための関数．
+    起動時に作成された単一のインスタンスを返す．
+    """
+    return tile_cache_instance
@@ -0,0 +1,34 @@
+# scripts/build_dem_tile_manifest.py
+
+import argparse
+from pathlib import Path
+import time
+
+# backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from app.core.config import get_settings
+from app.core.dem_manifest import DemTileManifest
+settings = get_settings()
+
+def main():
+    parser = argparse.ArgumentParser(description="DEMのGeoTIFFが存在する3次メッシュの一覧（ビットマップ）を作成する．")
+    parser.add_argument('--dem-root', type=Path, default=None,
+                        help="DEM5Aのディレクトリ（デフォルト：LOCAL_DATA_ROOT/DEM5A）．S3に置く場合はアップロード元を指定する．")
+    parser.add_argument('--output', type=Path, default=None, help="出力先の.npy（デフォルト：DEM_TILE_MANIFEST_PATH）")
+    args = parser.parse_args()
+
+    dem_root = args.dem_root or (settings.LOCAL_DATA_ROOT / "DEM5A" if settings.LOCAL_DATA_ROOT else None)
+    output_path = args.output or settings.DEM_TILE_MANIFEST_PATH
+    if dem_root is None or output_path is None:
+        print("ERROR: --dem-rootと--output（またはLOCAL_DATA_ROOTとDEM_TILE_MANIFEST_PATH）を指定してください．")
+        return
+
+    start_time = time.perf_counter()
+    manifest = DemTileManifest.from_directory(dem_root)
+    manifest.save(output_path)
+    print(f"{len(manifest)}個の3次メッシュを登録しました（{time.perf_counter() - start_time:.1f}秒）: {output_path}")
+    print("✅")
+
+if __name__ == "__main__":
+    main()
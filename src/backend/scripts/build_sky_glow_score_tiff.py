@@ -0,0 +1,88 @@
+# scripts/build_sky_glow_score_tiff.py
+
+from pathlib import Path
+import time
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from tqdm import tqdm
+
+# backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from app.core.config import get_settings
+from app.services.score_service import convert_wa2015_to_sky_glow_score
+from app.services.sky_glow_service import get_bbox_window, get_sky_glow_params
+settings = get_settings()
+
+BLOCK_SIZE = 512 # GeoTIFFの内部タイルの1辺（画素）．1ブロックずつ読み書きするため，メモリ使用量はこれで決まる．
+OVERVIEW_FACTORS = [2, 4, 8, 16, 32] # 地図タイルの低ズーム用の縮小画像
+
+def build_sky_glow_score_tiff(path_world_atlas_2015: str, path_output: Path) -> None:
+    """
+    World Atlas 2015のSKY_GLOW_BBOXの範囲を，0-1に正規化した光害スコアのGeoTIFFに変換する．
+    画素の並びはWorld Atlas 2015と同じで，内部タイル・DEFLATE圧縮・縮小画像付きで書き出す．
+    """
+    with rasterio.open(path_world_atlas_2015) as src:
+        window = get_bbox_window(src, settings.SKY_GLOW_BBOX)
+        profile = {
+            'driver': 'GTiff',
+            'width': int(window.width),
+            'height': int(window.height),
+            'count': 1,
+            'dtype': 'float32',
+            'crs': src.crs,
+            'transform': src.window_transform(window),
+            'nodata': np.nan,
+            'tiled': True,
+            'blockxsize': BLOCK_SIZE,
+            'blockysize': BLOCK_SIZE,
+            'compress': 'deflate',
+            'predictor': 3, # 浮動小数点数の差分予測で圧縮率を上げる．
+            'BIGTIFF': 'IF_SAFER',
+        }
+
+        path_output.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = path_output.with_suffix('.tmp.tif') # 書き込み途中のファイルをアプリに読ませない．
+        with rasterio.open(path_tmp, 'w', **profile) as dst:
+            dst.update_tags(SKY_GLOW_PARAMS=get_sky_glow_params(settings=settings))
+
+            block_windows = [block_window for _, block_window in dst.block_windows(1)]
+            for block_window in tqdm(block_windows, desc="Converting to Sky Glow Score"):
+                src_window = Window(
+                    window.col_off + block_window.col_off, window.row_off + block_window.row_off,
+                    block_window.width, block_window.height
+                )
+                artificial_brightness = src.read(1, window=src_window).astype(float)
+                sky_glow_score = convert_wa2015_to_sky_glow_score(artificial_brightness=artificial_brightness, settings=settings)
+                dst.write(sky_glow_score.astype(np.float32), 1, window=block_window)
+
+            print("縮小画像を作成中...")
+            dst.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+
+        path_tmp.replace(path_output)
+
+def main():
+    print("World Atlas 2015から日本周辺の光害スコアのGeoTIFFを作成します．")
+
+    if settings.S3_BUCKET or not settings.LOCAL_DATA_ROOT:
+        print("ERROR: 出力先はLOCAL_DATA_ROOTです．S3_BUCKETを外してLOCAL_DATA_ROOTを設定してください．（作成後にS3へアップロード）")
+        return
+
+    path_output = Path(settings.PATH_SKY_GLOW_SCORE_TIFF)
+
+    try:
+        start_time = time.perf_counter()
+        build_sky_glow_score_tiff(path_world_atlas_2015=settings.PATH_WORLD_ATLAS_2015_TIFF, path_output=path_output)
+        elapsed = time.perf_counter() - start_time
+        print(f"{path_output} を作成しました．（{elapsed:.1f}秒）")
+
+    except rasterio.errors.RasterioIOError:
+        print(f"ERROR: World Atlas 2015データセットが見つかりません．: {settings.PATH_WORLD_ATLAS_2015_TIFF}")
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# scripts/check_index_usage.py
+
+# このスクリプトを動かす前に：`cd src` -> `docker-compose up -d db` -> `alembic upgrade head`
+# 終わったら：`docker-compose down`
+
+# 空間検索・名前検索のクエリがインデックスを使っているかを EXPLAIN で確認する回帰テスト．
+# 非同期のルーターが使うクエリがasyncpgで実行できるかも確認する．
+# インデックスを使えない書き方に変わった場合や，実行できないクエリがある場合は終了コード1で終了する．
+
+import sys
+import asyncio
+from pathlib import Path
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+
+# backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from app.crud import location as crud_location
+from app.crud import spot as crud_spot
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# このスクリプト専用のDBセッションを確立
+engine = create_engine(str(settings.DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 東京駅
+CENTER_LAT = 35.68126494858904
+CENTER_LON = 139.7670650510304
+
+def collect_index_names(plan: dict) -> set[str]:
+    """
+    EXPLAIN (FORMAT JSON) の実行計画を再帰的にたどり，使われているインデックス名を集める．
+    """
+    index_names = set()
+    if 'Index Name' in plan:
+        index_names.add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        index_names |= collect_index_names(child)
+    return index_names
+
+def capture_statements(db: Session, func, **kwargs) -> list[tuple[str, dict]]:
+    """
+    crudの関数を実行し，発行されたSELECT文とそのパラメータを記録して返す．
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        func(db=db, **kwargs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return statements
+
+def explain(db: Session, statement: str, parameters: dict) -> set[str]:
+    """
+    SELECT文の実行計画を取得し，使われているインデックス名を返す．
+    """
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    return collect_index_names(plan[0]['Plan'])
+
+async def check_async_queries() -> list[str]:
+    """
+    非同期版のcrudの関数をasyncpgで実行する．
+    asyncpgはパラメータに型を付けて送る（文字列はVARCHAR）ため，psycopg2では通るクエリが失敗することがある．
+
+    Returns:
+        (list[str]): 失敗したクエリの説明
+    """
+    failures = []
+    async_engine = create_async_engine(settings.ASYNC_DATABASE_URL)
+    try:
+        async with AsyncSession(async_engine) as db:
+            try:
+                rows = await crud_spot.get_top_spots_by_static_score_async(
+                    db=db, settings=settings, lat=CENTER_LAT, lon=CENTER_LON, radius_km=30, limit=10
+                )
+                print(f"get_top_spots_by_static_score_async: {len(rows)}件")
+            except Exception as e:
+                failures.append(f"get_top_spots_by_static_score_async がasyncpgで実行できません: {e}")
+    finally:
+        await async_engine.dispose()
+
+    return failures
+
+def main():
+    print("空間検索・名前検索のクエリの実行計画を確認します．")
+
+    db: Session = SessionLocal()
+    failures = []
+
+    try:
+        # テーブルが小さいとシーケンシャルスキャンの方が安く見積もられるため，インデックスを使えるかだけを確認する．
+        db.connection().exec_driver_sql("SET enable_seqscan = off")
+
+        # 1. 半径検索（ST_DWithin）
+        statements = capture_statements(
+            db, crud_spot.get_top_spots_by_static_score,
+            settings=settings, lat=CENTER_LAT, lon=CENTER_LON, radius_km=30, limit=10
+        )
+        for statement, parameters in statements:
+            if 'ST_DWithin' not in statement:
+                continue
+            index_names = explain(db, statement, parameters)
+            print(f"get_top_spots_by_static_score: {sorted(index_names)}")
+            if not index_names & {'idx_spots_geom', 'ix_spots_static_score'}:
+                failures.append("get_top_spots_by_static_score がspotsのインデックスを使っていません．")
+
+        # 2. 距離順の検索（<->演算子によるKNN）と，名前の部分一致検索（pg_trgm）
+        # トライグラムを作れるよう，3文字以上のキーワードで確認する．
+        statements = capture_statements(
+            db, crud_location.search_locations_and_sort_by_distance,
+            name="東京都", lat=CENTER_LAT, lon=CENTER_LON, limit=10, offset=0,
+            count_limit=settings.LOCATION_SEARCH_COUNT_LIMIT
+        )
+        # ページと総件数は1つのクエリで取得される．
+        for statement, parameters in statements:
+            index_names = explain(db, statement, parameters)
+            print(f"search_locations_and_sort_by_distance: {sorted(index_names)}")
+
+            for index_name in ['idx_locations_geom', 'idx_spots_geom', 'ix_locations_name_trgm', 'ix_spots_name_trgm']:
+                if index_name not in index_names:
+                    failures.append(f"search_locations_and_sort_by_distance が {index_name} を使っていません．")
+
+    finally:
+        db.rollback()
+        db.close() # セッションを閉じる
+
+    # 3. 非同期のルーターが使うクエリ（asyncpg）
+    failures += asyncio.run(check_async_queries())
+
+    if failures:
+        for failure in failures:
+            print(f"NG: {failure}")
+        sys.exit(1)
+
+    print("OK: 全てのクエリがインデックスを使用し，asyncpgで実行できます．")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
+import argparse
 import io
+import multiprocessing as mp
+import time
+import zipfile
 import numpy as np
 import xml.etree.ElementTree as ET
 import rasterio
 from rasterio.transform import from_origin
-import glob
 import os
-import gc
 from tqdm import tqdm
 import re
 import sys
@@ -17,6 +19,9 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 from app.core.config import get_settings
 settings = get_settings()
 
+# tupleListの各行「記述,値」から「記述,」を取り除くための正規表現（値だけを空白区切りで残す．）
+TUPLE_DESC_PATTERN = re.compile(r'[^\s,]*,')
+
 class xmlDem:
     def __init__(self) -> None:
         self.ns = {
@@ -25,35 +30,55 @@ class xmlDem:
         }
 
     def read_xml(self,file_path:str|bytes) -> None:
-
+        """
+        FGDのGMLをiterparseで先頭から1回だけ走査し，必要な要素だけを取り出す．
+        要素は読んだそばから破棄するため，ElementTree全体をメモリに持たない．
+        """
         if isinstance(file_path, str):
             # ファイルパスなら普通に読む
-            tree = ET.parse(file_path)
+            source = file_path
         elif isinstance(file_path, bytes):
             # bytesならBytesIOで読む
-            tree = ET.parse(io.BytesIO(file_path))
+            source = io.BytesIO(file_path)
         else:
             raise ValueError(f"Unsupported file type: {type(file_path)}")
 
-        self.root = tree.getroot()
-        self.type = self.root.find('.//fgd:type', namespaces=self.ns).text
-        self.meshcode = self.root.find('.//fgd:mesh', namespaces=self.ns).text
-        self.envelope = self.root.find('.//gml:Envelope', namespaces=self.ns)        
-
-        self.tupleList = self.root.find('.//gml:tupleList', self.ns).text
-        self.lowerCorner = self.root.find('.//gml:lowerCorner', self.ns).text
-        self.upperCorner = self.root.find('.//gml:upperCorner', self.ns).text
-        self.GridEnvelope = self.root.find('.//gml:GridEnvelope', self.ns)
-        self.low = self.GridEnvelope.find('gml:low', self.ns).text
-        self.high = self.GridEnvelope.find('gml:high', self.ns).text
-        self.startPoint = self.root.find('.//gml:startPoint', self.ns).text
-        self.sequenceRule = self.root.find('.//gml:sequenceRule', self.ns).attrib.get('order')
+        # 名前空間付きのタグ名 -> 属性名
+        tags = {
+            f"{{{self.ns['fgd']}}}type": 'type',
+            f"{{{self.ns['fgd']}}}mesh": 'meshcode',
+            f"{{{self.ns['gml']}}}lowerCorner": 'lowerCorner',
+            f"{{{self.ns['gml']}}}upperCorner": 'upperCorner',
+            f"{{{self.ns['gml']}}}low": 'low',
+            f"{{{self.ns['gml']}}}high": 'high',
+            f"{{{self.ns['gml']}}}startPoint": 'startPoint',
+        }
+        tag_envelope = f"{{{self.ns['gml']}}}Envelope"
+        tag_tuple_list = f"{{{self.ns['gml']}}}tupleList"
+        tag_sequence_rule = f"{{{self.ns['gml']}}}sequenceRule"
+
+        for attr in tags.values():
+            setattr(self, attr, None)
+        self.srs_name = None
+        self.sequenceRule = None
+        self.tupleList = None
+        for _, elem in ET.iterparse(source, events=('end',)):
+            if elem.tag in tags:
+                if getattr(self, tags[elem.tag]) is None:
+                    setattr(self, tags[elem.tag], elem.text) # 最初に現れた要素を使う．
+            elif elem.tag == tag_envelope and self.srs_name is None:
+                self.srs_name = elem.attrib.get('srsName')
+            elif elem.tag == tag_tuple_list:
+                self.tupleList = elem.text
+            elif elem.tag == tag_sequence_rule:
+                self.sequenceRule = elem.attrib.get('order')
+            elem.clear() # 読み終えた要素を破棄
 
         self._gridinfo()
         self._setcrs()
     def _setcrs(self):
-        assert self.envelope is not None 
-        srs_name = self.envelope.attrib.get('srsName')
+        assert self.srs_name is not None
+        srs_name = self.srs_name
         if srs_name == "fguuid:jgd2011.bl":
             self.epsg = '6668'
         elif srs_name == "fguuid:jgd2024.bl":
@@ -66,20 +91,13 @@ class xmlDem:
         self.nlat = int(self.high.split()[1]) - int(self.low.split()[1]) + 1
         self.llat, self.llon = np.array(self.lowerCorner.split(),dtype=float)
         self.ulat, self.ulon = np.array(self.upperCorner.split(),dtype=float)
-        
+
         self.dlon = (self.ulon - self.llon) / self.nlon
         self.dlat = (self.ulat - self.llat) / self.nlat
-        
+
         self.lat0 = self.ulat #左上座標の緯度
         self.lon0 = self.llon #左上座標の経度
 
-        self.lonc = [self.lon0 + 0.5*self.dlon + self.dlon*_ for _ in range(self.nlon)]
-        self.latc = [self.lat0 - 0.5*self.dlat - self.dlat*_ for _ in range(self.nlat)]
-
-        self.lon_array = np.array(self.lonc)
-        self.lat_array = np.array(self.latc)
-        
-
         if self.sequenceRule is not None and self.startPoint is not None:
             order = self.sequenceRule
             start_x, start_y = map(int, self.startPoint.split())
@@ -89,27 +107,23 @@ class xmlDem:
             print("[Warning] <sequenceRule> または <startPoint> が見つかりませんでした。")
             print("          デフォルト値 order='+x-y', startPoint=(0,0) を仮定して処理します。")
 
-        self.Z = np.full((self.nlat, self.nlon), np.nan, dtype=float)
+        self.Z = np.full((self.nlat, self.nlon), np.nan, dtype=np.float32)
 
-        _desc =  np.array([_.split(",")[0] for _ in self.tupleList.split()])
-        _value = np.array([float(_.split(",")[1]) for _ in self.tupleList.split()])
-        _value = np.where(_value == -9999, np.nan, _value)
+        # 「記述,値」の記述を取り除き，値の列を文字列のまま一括でfloat32の配列に変換する．
+        _value = np.fromstring(TUPLE_DESC_PATTERN.sub('', self.tupleList or ''), dtype=np.float32, sep=' ')
+        _value[_value == -9999] = np.nan
+        self.tupleList = None # 巨大な文字列を早めに手放す．
 
         if order == "+x-y":
             # フラットなインデックス計算
             flat_start_idx = start_y * self.nlon + start_x
 
-            # 1D化して挿入
-            Z_flat = self.Z.flatten()
+            # 1D化したビュー（コピーしない）に挿入
+            Z_flat = self.Z.reshape(-1)
             Z_flat[flat_start_idx:flat_start_idx + len(_value)] = _value
-
-            # 2Dに戻す
-            self.Z = Z_flat.reshape((self.nlat, self.nlon))
         else:
             raise NotImplementedError(f"Order '{order}' not supported yet.")
 
-        self.LON, self.LAT = np.meshgrid(self.lon_array, self.lat_array)
-
     def info(self):
         print(f"type     = {self.type}")
         print(f"meshcode = {self.meshcode}")
@@ -118,7 +132,8 @@ class xmlDem:
 
     def to_geotiff(self, output_path: str):
         """
-        標高データをGeoTIFFで保存する
+        標高データを，Cloud Optimized GeoTIFF（内部タイル・縮小画像・DEFLATE圧縮）で保存する
+        S3上のファイルでも，HTTPのRange要求でヘッダと必要なタイルだけを読める．
         """
         # ピクセルサイズ
         pixel_width = abs(self.dlon)
@@ -131,54 +146,146 @@ class xmlDem:
         # アフィン変換（位置とピクセル解像度をセット）
         transform = from_origin(west, north, pixel_width, pixel_height)
 
-        # GeoTIFFとして保存
+        # COGとして保存（COGドライバはCreateCopyのみ対応のため，rasterioが一時データセットを経由して書き出す．）
         with rasterio.open(
             output_path,
             'w',
-            driver='GTiff',
+            driver='COG',
             height=self.Z.shape[0],
             width=self.Z.shape[1],
             count=1,
             dtype=self.Z.dtype,
             crs=f"EPSG:{self.epsg}",
             transform=transform,
+            nodata=np.nan,
+            blocksize=128,
+            compress='deflate',
+            predictor='YES', # 浮動小数点数の差分予測で圧縮率を上げる．
+            overviews='AUTO',
+            overview_resampling='average',
         ) as dst:
             dst.write(self.Z, 1)
 
         # print(f"Saved GeoTIFF: {output_path}")
 
-target = "/Users/shotasasaki/Downloads/target"
-input_folders = [
-    f for f in os.listdir(target) if os.path.isdir(os.path.join(target, f))
-]
-
-for input_folder in tqdm(input_folders):
-    xml_files = glob.glob(os.path.join(*[target, input_folder, "*.xml"]))
-
-    if not xml_files:
-        print("対象のXMLファイルが見つかりません．")
-    else:
-        for xml_file in xml_files:
-            # print(f"▶ 処理中: {xml_file}")
-
-            dem = xmlDem()
-            dem.read_xml(file_path=xml_file)
-
-            # 正規表現で4桁-2桁-2桁をキャプチャグループとして抽出
-            match = re.search(r'(\d{4})-(\d{2})-(\d{2})', str(xml_file))
-
-            first = match.group(1)
-            second = match.group(2)
-            third = match.group(3)
-
-            dir_path = f"{str(settings.LOCAL_DATA_ROOT)}/DEM5A/{first}/{first}-{second}"
-            os.makedirs(dir_path, exist_ok=True) # exist_ok=True で既に存在してもエラーにならない．
-
-            # output_name = f"{dir_path}/{os.path.splitext(xml_file)[0][-32:]}.tif"
-            output_name = f"{dir_path}/{first}-{second}-{third}.tif"
-            dem.to_geotiff(output_name)
-
-            del dem
-            gc.collect() # 強制的にメモリを回収
-
-print("✅")
+def get_output_path(output_root: Path, xml_name: str) -> Path | None:
+    """
+    XMLのファイル名（FG-GML-{1次}-{2次}-{3次}-DEM5A-...）から，Settings.get_dem_filepathと同じ配置の出力先を返す．
+    """
+    # 正規表現で4桁-2桁-2桁をキャプチャグループとして抽出
+    match = re.search(r'(\d{4})-(\d{2})-(\d{2})', xml_name)
+    if match is None:
+        return None
+
+    first, second, third = match.groups()
+    return output_root / first / f"{first}-{second}" / f"{first}-{second}-{third}.tif"
+
+def list_zip_tasks(zip_path: Path) -> list[str | None]:
+    """
+    ZIPを変換の単位に分ける．直下のXMLはまとめて1つ（None），入れ子のZIPは1つずつ別の単位にする．
+    基盤地図情報のまとめてダウンロードはZIPの中にメッシュごとのZIPが入っているため，1階層だけ入れ子を開く．
+    """
+    with zipfile.ZipFile(zip_path) as zip_file:
+        names = zip_file.namelist()
+    tasks = [name for name in names if name.lower().endswith('.zip')]
+    if any(name.lower().endswith('.xml') for name in names):
+        tasks.append(None)
+    return tasks
+
+def convert_zip(args: tuple[str, str | None, str, bool]) -> dict:
+    """
+    ZIP（または入れ子のZIP）の中のXMLを全て，展開せずにGeoTIFFへ変換する．（ワーカープロセスで実行）
+    出力先がZIPより新しい場合は変換しない．
+    """
+    zip_path, inner_zip_name, output_root, force = args
+    zip_mtime = os.path.getmtime(zip_path)
+    stats = {'converted': 0, 'skipped': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    with zipfile.ZipFile(zip_path) as outer_zip_file:
+        if inner_zip_name is None:
+            zip_file = outer_zip_file
+        else:
+            zip_file = zipfile.ZipFile(io.BytesIO(outer_zip_file.read(inner_zip_name)))
+
+        for member in zip_file.namelist():
+            if not member.lower().endswith('.xml'):
+                continue
+            output_path = get_output_path(Path(output_root), Path(member).name)
+            if output_path is None:
+                stats['failed'] += 1
+                continue
+            if not force and output_path.exists() and output_path.stat().st_mtime >= zip_mtime:
+                stats['skipped'] += 1
+                continue
+
+            xml_bytes = zip_file.read(member)
+            try:
+                dem = xmlDem()
+                dem.read_xml(file_path=xml_bytes)
+
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = output_path.with_suffix('.tmp.tif') # 書き込み途中のファイルを残さない．
+                dem.to_geotiff(str(tmp_path))
+                os.replace(tmp_path, output_path)
+            except Exception as e:
+                print(f"⚠️ 警告: {zip_path} の {member} を変換できませんでした: {e}")
+                stats['failed'] += 1
+                continue
+
+            stats['converted'] += 1
+            stats['bytes_in'] += len(xml_bytes)
+            stats['bytes_out'] += output_path.stat().st_size
+
+        if zip_file is not outer_zip_file:
+            zip_file.close()
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="基盤地図情報の数値標高モデル（DEM5A）のZIPを展開せずにGeoTIFFへ変換する．")
+    parser.add_argument('inputs', nargs='+', type=Path, help="ZIPファイル，またはZIPを含むディレクトリ（再帰的に探す）")
+    parser.add_argument('--output-root', type=Path, default=None, help="出力先（デフォルト：LOCAL_DATA_ROOT/DEM5A）")
+    parser.add_argument('--processes', type=int, default=mp.cpu_count())
+    parser.add_argument('--force', action='store_true', help="出力先が新しくても変換し直す．")
+    args = parser.parse_args()
+
+    output_root = args.output_root or (settings.LOCAL_DATA_ROOT / "DEM5A" if settings.LOCAL_DATA_ROOT else None)
+    if output_root is None:
+        print("ERROR: --output-rootかLOCAL_DATA_ROOTを指定してください．")
+        return
+
+    zip_paths = []
+    for input_path in args.inputs:
+        if input_path.is_dir():
+            zip_paths.extend(sorted(input_path.rglob("*.zip")))
+        else:
+            zip_paths.append(input_path)
+    if not zip_paths:
+        print("対象のZIPファイルが見つかりません．")
+        return
+
+    # ZIPの大きい順に投入すると，最後に大きいZIPだけが残って待たされることが減る．
+    zip_paths.sort(key=lambda path: path.stat().st_size, reverse=True)
+    tasks = [
+        (str(zip_path), inner_zip_name, str(output_root), args.force)
+        for zip_path in zip_paths
+        for inner_zip_name in list_zip_tasks(zip_path)
+    ]
+
+    totals = {'converted': 0, 'skipped': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+    start_time = time.perf_counter()
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(processes=args.processes) as pool:
+        print(f"{args.processes}個のプロセスで{len(zip_paths)}個のZIP（{len(tasks)}単位）を変換します．")
+        for stats in tqdm(pool.imap_unordered(convert_zip, tasks), total=len(tasks), desc="Converting DEM"):
+            for key in totals:
+                totals[key] += stats[key]
+    elapsed = time.perf_counter() - start_time
+
+    print(f"変換：{totals['converted']}件，スキップ（変換済み）：{totals['skipped']}件，失敗：{totals['failed']}件")
+    print(f"経過時間：{elapsed:.1f}秒，{totals['converted'] / elapsed:.1f}ファイル/秒，"
+          f"XML {totals['bytes_in'] / 1e6 / elapsed:.1f}MB/秒（出力 {totals['bytes_out'] / 1e6:.1f}MB）")
+    print("✅")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# scripts/enrich_spots.py
+
+# 観測候補地点のCSVを1回だけ読み，標高・World Atlas 2015の生値・稜線プロファイルを付けて1つのParquetに書き出す．
+# （add_elevation_m.py・add_wa2015_value.py・add_horizon_profile.pyを置き換える．）
+
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+# backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from app.core.config import get_settings
+from app.services.dem_service import calc_horizon_profile, get_elevations_by_lonlats, open_dem_dataset
+from app.services.horizon_service import (
+    encode_horizon_profile, stack_horizon_profiles, summarize_horizon_profile, HORIZON_PROFILE_DTYPE, HORIZON_SUMMARY_COLUMNS
+)
+settings = get_settings()
+
+DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "観測候補地点"
+OUTPUT_PATH = Path(__file__).resolve().parents[2] / "data" / "spots_enriched.parquet"
+
+CHUNK_ROWS = 10000 # CSVを読み込む単位（メモリ使用量はこれで決まる．）
+TASK_ROWS = 16 # ワーカーに渡す1タスクあたりの地点数
+
+# 出力の列．load_spots.pyはこの列を読む．
+OUTPUT_SCHEMA = pa.schema([
+    ('osm_id', pa.int64()),
+    ('name', pa.string()),
+    ('name_en', pa.string()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('geometry', pa.string()),
+    ('source_csv', pa.string()),
+    ('input_hash', pa.string()), # 差分実行で，入力（座標と計算パラメータ）が変わった行を見分ける．
+    ('elevation_m', pa.float64()),
+    ('wa2015_raw_value', pa.float64()),
+    ('horizon_profile', pa.binary()), # horizon_service.encode_horizon_profileの形式（DBのbyteaと同じ）
+    # 稜線プロファイルの要約（horizon_service.summarize_horizon_profile）．稜線プロファイルから毎回計算し直す．
+    ('open_sky_fraction_0', pa.float64()),
+    ('open_sky_fraction_3', pa.float64()),
+    ('open_sky_fraction_5', pa.float64()),
+    ('open_sky_fraction_10', pa.float64()),
+    ('max_ridge_angle', pa.float64()),
+    ('horizon_octant_max', pa.binary()),
+    ('horizon_octant_min', pa.binary()),
+])
+ENRICHED_COLUMNS = ['elevation_m', 'wa2015_raw_value', 'horizon_profile']
+
+def get_input_hash(lat: float, lon: float, params: str) -> str:
+    return hashlib.blake2b(f"{lat!r},{lon!r};{params}".encode('utf-8'), digest_size=8).hexdigest()
+
+def enrich_spots(args) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[bytes | None]]:
+    """
+    地点のまとまりについて，標高・World Atlas 2015の生値・稜線プロファイルを計算する．（ワーカープロセスで実行）
+    開いたDEMとWorld Atlas 2015のファイルはプロセス内で保持し，3つの処理と後続のタスクで使い回す．
+    """
+    row_ids, lons, lats, horizon_params = args
+
+    # 1. 標高（地点のまとまりを1回で取得）
+    elevations = get_elevations_by_lonlats(lons=lons, lats=lats, settings=settings)
+
+    # 2. World Atlas 2015の生値
+    src = open_dem_dataset(settings.PATH_WORLD_ATLAS_2015_TIFF, max_open=settings.DEM_DATASET_CACHE_SIZE)
+    wa2015_raw_values = np.array([value[0] for value in src.sample(zip(lons, lats))], dtype=float)
+
+    # 3. 稜線プロファイル（1で取得した観測地点の標高を使う．）保存形式のバイト列で返す．
+    horizon_profiles = [
+        encode_horizon_profile(calc_horizon_profile(
+            settings=settings, observer_lat=lat, observer_lon=lon, observer_ground_elev=elevation, **horizon_params
+        )[0])
+        for lat, lon, elevation in zip(lats, lons, elevations)
+    ]
+    return row_ids, elevations, wa2015_raw_values, horizon_profiles
+
+def read_spot_chunks(csv_paths: list[Path], chunk_rows: int):
+    """
+    全てのCSVの行を，出力の列に揃えたDataFrameとしてchunk_rows行ずつ返す．同じosm_idの行は最初の1行だけを残す．
+    """
+    processed_osm_id = set()
+    for csv_path in csv_paths:
+        print(f"{csv_path} を処理中...")
+        for df in pd.read_csv(csv_path, encoding='utf-8', header=0, chunksize=chunk_rows):
+            chunk = pd.DataFrame({
+                'osm_id': pd.to_numeric(df['id'], errors='coerce').fillna(-1).astype('int64') if 'id' in df else -1,
+                'name': df['name'].astype('string') if 'name' in df else None,
+                'name_en': df['name:en'].astype('string') if 'name:en' in df else None,
+                'latitude': df['latitude'].astype(float),
+                'longitude': df['longitude'].astype(float),
+                'geometry': df['geometry'].astype('string') if 'geometry' in df else None,
+                'source_csv': str(csv_path.relative_to(DATA_DIR)) if csv_path.is_relative_to(DATA_DIR) else str(csv_path),
+            })
+
+            # 同じ行が2つ存在する事がある．
+            is_duplicated = chunk['osm_id'].duplicated() | chunk['osm_id'].isin(processed_osm_id)
+            chunk = chunk[~(is_duplicated & (chunk['osm_id'] > -1))].reset_index(drop=True)
+            processed_osm_id.update(chunk['osm_id'][chunk['osm_id'] > -1])
+            yield chunk
+
+def load_previous_results(path: Path) -> dict[tuple[int, str], tuple]:
+    """
+    前回の出力から，（osm_id, input_hash）ごとの計算結果を読み込む．
+    """
+    if not path.exists():
+        return {}
+    table = pq.read_table(path, columns=['osm_id', 'input_hash'] + ENRICHED_COLUMNS)
+    columns = [table.column(name).to_pylist() for name in table.column_names]
+    return {
+        (osm_id, input_hash): (elevation, wa2015_raw_value, horizon_profile)
+        for osm_id, input_hash, elevation, wa2015_raw_value, horizon_profile in zip(*columns)
+        if osm_id > -1
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="観測候補地点に標高・World Atlas 2015の生値・稜線プロファイルを付けてParquetに書き出す．")
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--output', type=Path, default=OUTPUT_PATH)
+    parser.add_argument('--incremental', action='store_true', help="前回の出力から入力が変わっていない行は計算し直さない．")
+    parser.add_argument('--processes', type=int, default=mp.cpu_count())
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--num-directions', type=int, default=180)
+    parser.add_argument('--max-distance', type=float, default=100000.0)
+    parser.add_argument('--num-samples', type=int, default=1000)
+    parser.add_argument('--horizon-npy', type=Path, default=None,
+                        help="稜線プロファイルを(地点数, 方位数)のint16（0.01度単位）の.npyにも書き出す．行の順はParquetと同じ．")
+    args = parser.parse_args()
+
+    horizon_params = {
+        'num_directions': args.num_directions,
+        'max_distance': args.max_distance,
+        'num_samples': args.num_samples,
+    }
+    params = ";".join(f"{key}={value}" for key, value in horizon_params.items())
+    params += f";horizon_dtype={HORIZON_PROFILE_DTYPE.str}" # 保存形式が変わった場合も計算し直す．
+
+    csv_paths = sorted(args.data_dir.rglob("*.csv"))
+    if not csv_paths:
+        print("対象のCSVファイルが見つかりません．")
+        return
+
+    previous_results = load_previous_results(args.output) if args.incremental else {}
+    if args.incremental:
+        print(f"前回の出力から{len(previous_results)}件の計算結果を読み込みました．")
+
+    print("観測候補地点の付加情報を計算します．")
+    num_rows, num_computed = 0, 0
+    start_time = time.perf_counter()
+    tmp_path = args.output.with_suffix('.tmp.parquet') # 書き込み途中のファイルを残さない．
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(processes=args.processes) as pool, pq.ParquetWriter(tmp_path, OUTPUT_SCHEMA) as writer:
+        for chunk in read_spot_chunks(csv_paths, chunk_rows=args.chunk_rows):
+            chunk['input_hash'] = [get_input_hash(lat, lon, params) for lat, lon in zip(chunk['latitude'], chunk['longitude'])]
+            chunk['elevation_m'] = np.nan
+            chunk['wa2015_raw_value'] = np.nan
+            chunk['horizon_profile'] = None
+
+            # 前回の結果を使える行と，計算する行に分ける．
+            rows_to_compute = []
+            for row_id, (osm_id, input_hash) in enumerate(zip(chunk['osm_id'], chunk['input_hash'])):
+                previous = previous_results.get((osm_id, input_hash))
+                if previous is None:
+                    rows_to_compute.append(row_id)
+                else:
+                    chunk.at[row_id, 'elevation_m'], chunk.at[row_id, 'wa2015_raw_value'], \
+                        chunk.at[row_id, 'horizon_profile'] = previous
+
+            lons = chunk['longitude'].to_numpy()
+            lats = chunk['latitude'].to_numpy()
+            tasks = [
+                (ids, lons[ids], lats[ids], horizon_params)
+                for ids in np.array_split(np.array(rows_to_compute, dtype=int), max(1, -(-len(rows_to_compute) // TASK_ROWS)))
+                if len(ids) > 0
+            ]
+            with tqdm(total=len(rows_to_compute), desc="Enriching Spots", unit="rows") as pbar:
+                for row_ids, elevations, wa2015_raw_values, horizon_profiles in pool.imap_unordered(enrich_spots, tasks):
+                    chunk.loc[row_ids, 'elevation_m'] = elevations
+                    chunk.loc[row_ids, 'wa2015_raw_value'] = wa2015_raw_values
+                    for row_id, horizon_profile in zip(row_ids, horizon_profiles):
+                        chunk.at[row_id, 'horizon_profile'] = horizon_profile
+                    pbar.update(len(row_ids))
+
+            # 稜線プロファイルの要約（軽い計算なので，前回の結果を使った行も計算し直す．）
+            summaries = pd.DataFrame([summarize_horizon_profile(data) for data in chunk['horizon_profile']],
+                                     columns=HORIZON_SUMMARY_COLUMNS)
+            chunk[HORIZON_SUMMARY_COLUMNS] = summaries
+
+            writer.write_table(pa.Table.from_pandas(chunk, schema=OUTPUT_SCHEMA, preserve_index=False))
+            num_rows += len(chunk)
+            num_computed += len(rows_to_compute)
+
+    os.replace(tmp_path, args.output)
+
+    if args.horizon_npy:
+        horizon_profiles = pq.read_table(args.output, columns=['horizon_profile']).column('horizon_profile').to_pylist()
+        np.save(args.horizon_npy, stack_horizon_profiles(horizon_profiles, num_directions=args.num_directions))
+        print(f"稜線プロファイルを {args.horizon_npy} に書き出しました．")
+    elapsed = time.perf_counter() - start_time
+    print(f"{num_rows}件（計算：{num_computed}件，前回の結果を使用：{num_rows - num_computed}件）を {args.output} に書き出しました．")
+    print(f"経過時間：{elapsed:.1f}秒，{num_computed / elapsed:.1f}件/秒")
+    print("✅")
+
+if __name__ == "__main__":
+    main()
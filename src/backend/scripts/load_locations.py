@@ -5,15 +5,16 @@
 
 import sys
 import csv
+import time
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 
 # backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from app.models.location import Location
 from app.core.config import get_settings
+from app.db.bulk_load import copy_rows, create_indexes, drop_secondary_indexes, run_timed
 
 settings = get_settings()
 
@@ -23,47 +24,52 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "大字・町丁目レベル位置参照情報（2024年版)"
 
+def iter_location_rows(csv_paths: list[Path]):
+    """
+    CSVの行を，ステージングテーブルの列の順のタプルとして1行ずつ返す．
+    """
+    for csv_path in csv_paths:
+        print(f"{csv_path} を処理中...")
+        with open(csv_path, mode='r', encoding='cp932') as f: # shift_jisだとエラー
+            reader = csv.DictReader(f) # 各行を辞書として読み込み
+            for row in reader:
+                # 大字町丁目名がない場合は空文字にする
+                town_name = row.get("大字町丁目名", "")
+
+                # 検索用のname列を作成
+                full_name = f'{row["都道府県名"]}{row["市区町村名"]}{town_name}'
+
+                yield (full_name, f"POINT ({row['経度']} {row['緯度']})") # lon -> latの順に注意！
+
 def main():
     """
     data/"大字・町丁目レベル位置参照情報（2024年版)" ディレクトリ内の全CSVファイルを再帰的に読み込み，locationsテーブルにデータを登録する．
+    ステージングテーブルにCOPYで流し込んでから1回のINSERT ... SELECTで登録し，インデックスは登録後にまとめて作る．
     """
     print("データベースの登録を開始します．")
+    start_time = time.perf_counter()
 
     db: Session = SessionLocal()
 
     try:
+        db.execute(text("CREATE TEMP TABLE locations_staging (name text, point_wkt text) ON COMMIT DROP"))
+        copy_rows(db=db, table='locations_staging', columns=['name', 'point_wkt'],
+                  rows=iter_location_rows(sorted(DATA_DIR.rglob("*.csv"))))
+
         # 既存のデータを全て削除（冪等性を保つため）
-        num_deleted = db.query(Location).delete()
-        if num_deleted > 0:
-            print(f"{num_deleted}件の既存データを削除しました．")
-        
-        locations_to_create = []
-
-        for csv_path in sorted(DATA_DIR.rglob("*.csv")):
-            print(f"{csv_path} を処理中...")
-            with open(csv_path, mode='r', encoding='cp932') as f: # shift_jisだとエラー
-                reader = csv.DictReader(f) # 各行を辞書として読み込み
-                for row in reader:
-                    # 大字町丁目名がない場合は空文字にする
-                    town_name = row.get("大字町丁目名", "")
-
-                    # 検索用のname列を作成
-                    full_name = f'{row["都道府県名"]}{row["市区町村名"]}{town_name}'
-
-                    # データベースに登録するオブジェクトの辞書を作成
-                    location_data = {
-                        'name': full_name,
-                        'geom': f"POINT ({row['経度']} {row['緯度']})" # lon -> latの順に注意！
-                    }
-                    locations_to_create.append(location_data)
-        
-        # 全てのデータを一括で挿入（バルクインサート）
-        print(f"{len(locations_to_create)}件のデータを登録します...")
-        db.bulk_insert_mappings(Location, locations_to_create)
+        db.execute(text("TRUNCATE locations"))
+        index_defs = drop_secondary_indexes(db=db, table='locations')
+        run_timed(db, """
+            INSERT INTO locations (name, geom)
+            SELECT name, ST_GeogFromText('SRID=4326;' || point_wkt)
+            FROM locations_staging
+        """, label="INSERT locations")
+        create_indexes(db=db, index_defs=index_defs)
+        db.execute(text("ANALYZE locations"))
 
         # 変更をコミット
         db.commit()
-        print("データ登録が正常に完了しました．")
+        print(f"データ登録が正常に完了しました（{time.perf_counter() - start_time:.1f}秒）．")
 
     except Exception as e:
         print(f"エラーが発生しました: {e}")
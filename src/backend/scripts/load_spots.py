@@ -1,19 +1,24 @@
-# scripts/load_locations.py
+# scripts/load_spots.py
 
 # このスクリプトを動かす前に：`cd src` -> `docker-compose up -d db`
 # 終わったら：`docker-compose down`
 
 import sys
-import csv
+import argparse
+import math
+import time
 from pathlib import Path
-from sqlalchemy import create_engine
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 
 # backend/ をPythonの検索パスに追加（先に実行しないとappが見つからないよ．）
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from app.models import Spot
+from app.crud.spot import refresh_static_scores
 from app.core.config import get_settings
+from app.db.bulk_load import copy_rows, create_indexes, drop_secondary_indexes, format_pg_bytea, run_timed
+from app.services.horizon_service import HORIZON_SUMMARY_COLUMNS
 
 settings = get_settings()
 
@@ -21,90 +26,124 @@ settings = get_settings()
 engine = create_engine(str(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-DATA_DIR = Path(__file__).resolve().parents[2] / "data" / "観測候補地点"
+ENRICHED_PATH = Path(__file__).resolve().parents[2] / "data" / "spots_enriched.parquet"
+
+STAGING_COLUMNS = ['osm_id', 'name', 'name_en', 'point_wkt', 'polygon_wkt', 'horizon_profile', 'wa2015_raw_value', 'elevation_m',
+                   *HORIZON_SUMMARY_COLUMNS]
+SPOT_COLUMNS = ['osm_id', 'name', 'name_en', 'geom', 'polygon_geom', 'horizon_profile', 'wa2015_raw_value', 'elevation_m',
+                *HORIZON_SUMMARY_COLUMNS]
+
+def iter_spot_rows(path: Path):
+    """
+    scripts/enrich_spots.pyの出力（同じosm_idの行は除去済み）を，ステージングテーブルの列の順のタプルとして1行ずつ返す．
+    """
+    for batch in pq.ParquetFile(path).iter_batches():
+        for row in batch.to_pylist():
+            geom_wkt = row.get('geometry')
+            if not geom_wkt:
+                continue
+
+            # WKT (Well-known text)からPOINTかPOLYGONかを判定
+            if geom_wkt.startswith('POINT'):
+                point_geom = geom_wkt
+                polygon_geom = None
+            elif geom_wkt.startswith('POLYGON'):
+                point_geom = f'POINT ({row['longitude']} {row['latitude']})'
+                polygon_geom = geom_wkt
+            else:
+                continue # MULTIPOLYGONなど，POINTでもPOLYGONでもないものはスキップ．
+
+            # Parquetの欠損値（NaN）はNoneにする．
+            wa2015_raw_value = row.get('wa2015_raw_value')
+            elevation_m = row.get('elevation_m')
+            osm_id = row.get('osm_id')
+
+            yield (
+                osm_id if osm_id is not None and osm_id > -1 else None, # OSMのIDが無い行（-1）はNULL
+                row.get('name') or 'N/A',
+                row.get('name_en'),
+                point_geom, # POINTのWKT文字列
+                polygon_geom, # POLYGONのWKT文字列またはNone
+                format_pg_bytea(row.get('horizon_profile')), # 保存形式のバイト列．取得できなかった地点はNone
+                None if wa2015_raw_value is None or math.isnan(wa2015_raw_value) else wa2015_raw_value,
+                None if elevation_m is None or math.isnan(elevation_m) else elevation_m,
+                # 稜線プロファイルの要約（稜線プロファイルが無い地点はNone）
+                *(format_pg_bytea(row.get(column)) if column.startswith('horizon_octant_') else row.get(column)
+                  for column in HORIZON_SUMMARY_COLUMNS),
+            )
 
 def main():
+    parser = argparse.ArgumentParser(description="観測候補地点をspotsテーブルに登録する．")
+    parser.add_argument('--input', type=Path, default=ENRICHED_PATH, help="scripts/enrich_spots.pyの出力")
+    parser.add_argument('--upsert', action='store_true',
+                        help="既存のデータを削除せず，osm_idが同じ行を更新する．（osm_idの無い行は登録しない．）")
+    args = parser.parse_args()
+
     print("データベースの登録を開始します．")
+    start_time = time.perf_counter()
 
     db: Session = SessionLocal()
 
     try:
-        # 既存のデータを全て削除（冪等性を保つため）
-        num_deleted = db.query(Spot).delete()
-        if num_deleted > 0:
-            print(f"{num_deleted}件の既存データを削除しました．")
-        
-        spots_to_create = []
-        processed_osm_id = set()
-
-        for csv_path in sorted(DATA_DIR.rglob("*.csv")):
-            print(f"{csv_path} を処理中...")
-            with open(csv_path, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(f) # 各行を辞書として読み込み
-                for row in reader:
-                    # 同じ行が2つ存在する事がある．
-                    osm_id = int(row.get('id', -1))
-                    if osm_id > -1 and osm_id in processed_osm_id:
-                        continue
-                    else:
-                        processed_osm_id.add(osm_id)
-
-                    geom_wkt = row.get('geometry')
-                    if not geom_wkt:
-                        continue
-
-                    # WKT (Well-known text)からPOINTかPOLYGONかを判定
-                    if geom_wkt.startswith('POINT'):
-                        point_geom = geom_wkt
-                        polygon_geom = None
-                    elif geom_wkt.startswith('POLYGON'):
-                        point_geom = f'POINT ({row['longitude']} {row['latitude']})'
-                        polygon_geom = geom_wkt
-                    else:
-                        continue # MULTIPOLYGONなど，POINTでもPOLYGONでもないものはスキップ．
-
-                    # 稜線プロファイルのカンマ区切り文字列をfloatのリストに変換
-                    horizon_profile_str = row.get('horizon_profile')
-                    horizon_profile_list = None
-                    if horizon_profile_str and isinstance(horizon_profile_str, str) and ('nan' not in horizon_profile_str):
-                        try:
-                            horizon_profile_list = [float(val) for val in horizon_profile_str.split(',')]
-                        except ValueError:
-                            # 変換に失敗した場合はNoneのままにする
-                            print(f"警告: osm_id {osm_id} のhorizon_profileのパースに失敗しました。")
-                            horizon_profile_list = None
-
-                    # SQM値をfloatに変換
-                    try:
-                        wa2015_raw_value= float(row.get('wa2015_raw_value')) if row.get('wa2015_raw_value') else None
-                    except (ValueError, TypeError):
-                        wa2015_raw_value = None
-                    
-                    # 標高をfloatに変換
-                    try:
-                        elevation_m = float(row.get('elevation_m')) if row.get('elevation_m') else None
-                    except (ValueError, TypeError):
-                        elevation_m = None
-                    
-                    spot_data = {
-                        'osm_id': osm_id,
-                        'name': row.get('name', 'N/A'),
-                        'name_en': row.get('name:en'),
-                        'geom': point_geom, # POINTのWKT文字列をセット
-                        'polygon_geom': polygon_geom, # POLYGONのWKT文字列またはNoneをセット
-                        'horizon_profile': horizon_profile_list,
-                        'wa2015_raw_value': wa2015_raw_value,
-                        'elevation_m': elevation_m
-                    }
-                    spots_to_create.append(spot_data)
-        
-        # 全てのデータを一括で挿入（バルクインサート）
-        print(f"{len(spots_to_create)}件のデータを登録します...")
-        db.bulk_insert_mappings(Spot, spots_to_create)
+        # 1. ステージングテーブルにCOPYで流し込む（Python側は一定のメモリで済む．）
+        db.execute(text("""
+            CREATE TEMP TABLE spots_staging (
+                osm_id bigint,
+                name text,
+                name_en text,
+                point_wkt text,
+                polygon_wkt text,
+                horizon_profile bytea,
+                wa2015_raw_value double precision,
+                elevation_m double precision,
+                open_sky_fraction_0 double precision,
+                open_sky_fraction_3 double precision,
+                open_sky_fraction_5 double precision,
+                open_sky_fraction_10 double precision,
+                max_ridge_angle double precision,
+                horizon_octant_max bytea,
+                horizon_octant_min bytea
+            ) ON COMMIT DROP
+        """))
+        print(f"{args.input} を処理中...")
+        copy_rows(db=db, table='spots_staging', columns=STAGING_COLUMNS, rows=iter_spot_rows(args.input))
+
+        select_statement = f"""
+            SELECT osm_id, name, name_en,
+                   ST_GeogFromText('SRID=4326;' || point_wkt),
+                   ST_GeogFromText('SRID=4326;' || polygon_wkt),
+                   horizon_profile, wa2015_raw_value, elevation_m,
+                   {', '.join(HORIZON_SUMMARY_COLUMNS)}
+            FROM spots_staging
+        """
+        if args.upsert:
+            # 2. osm_idが同じ行を更新する．値が変わらない行は書き換えない（静的スコアの再計算の対象にしないため）．
+            updated_columns = [column for column in SPOT_COLUMNS if column != 'osm_id']
+            run_timed(db, f"""
+                INSERT INTO spots ({', '.join(SPOT_COLUMNS)})
+                {select_statement}
+                WHERE osm_id IS NOT NULL
+                ON CONFLICT (osm_id) DO UPDATE SET
+                    {', '.join(f'{column} = EXCLUDED.{column}' for column in updated_columns)}
+                WHERE ({', '.join(f'spots.{column}' for column in updated_columns)})
+                    IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in updated_columns)})
+            """, label="UPSERT spots")
+        else:
+            # 2. 既存のデータを全て削除（冪等性を保つため）し，インデックスは登録後にまとめて作る．
+            db.execute(text("TRUNCATE spots"))
+            index_defs = drop_secondary_indexes(db=db, table='spots')
+            run_timed(db, f"INSERT INTO spots ({', '.join(SPOT_COLUMNS)}) {select_statement}", label="INSERT spots")
+            create_indexes(db=db, index_defs=index_defs)
+
+        db.execute(text("ANALYZE spots"))
 
         # 変更をコミット
         db.commit()
-        print("データ登録が正常に完了しました．")
+        print(f"データ登録が正常に完了しました（{time.perf_counter() - start_time:.1f}秒）．")
+
+        # 静的スコアを計算してカラムに保存
+        num_updated = refresh_static_scores(db=db, settings=settings)
+        print(f"{num_updated}件のスポットの静的スコアを計算しました．")
 
     except Exception as e:
         print(f"エラーが発生しました: {e}")